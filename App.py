@@ -1,6 +1,11 @@
 import sys
 from PyQt5.QtWidgets import QApplication, QWidget, QPushButton, QFileDialog, QLabel
-import subprocess
+
+from log_pipeline import LogPipeline
+from qt_support import EngineBridge
+from stream_engine import StreamEngine
+
+STREAM_NAME = 'main'
 
 class StreamApp(QWidget):
     def __init__(self):
@@ -23,6 +28,12 @@ class StreamApp(QWidget):
         self.start_btn.clicked.connect(self.startStreaming)
         
         self.video_path = None
+        # Rotating log under ~/.automated_obs/logs, ffmpeg's messages included
+        self.logs = LogPipeline()
+        self.engine = StreamEngine().run_in_background()
+        self.engine.subscribe(self.logs.on_event)
+        self.bridge = EngineBridge(self.engine, skip=('log',))
+        self.bridge.event.connect(self.onEngineEvent)
     
     def showDialog(self):
         options = QFileDialog.Options()
@@ -33,13 +44,15 @@ class StreamApp(QWidget):
     def startStreaming(self):
         if self.video_path:
             stream_url = "rtmp://a.rtmp.youtube.com/live2/cs2f-ev2w-m9z9-qg9y-erqk"
-            ffmpeg_path = r"C:/ffmpeg/bin/ffmpeg.exe"  # Replace with the correct path
-            command = [
-                ffmpeg_path, '-re', '-i', self.video_path, '-c:v', 'libx264', '-preset', 'veryfast', 
-                '-maxrate', '3000k', '-bufsize', '6000k', '-pix_fmt', 'yuv420p', '-g', '50', '-c:a', 'aac', 
-                '-b:a', '128k', '-ar', '44100', '-f', 'flv', stream_url
-            ]
-            subprocess.run(command, check=True)
+            self.engine.submit(self.engine.start(STREAM_NAME, self.video_path, [stream_url]))
+
+    def onEngineEvent(self, event):
+        if event['type'] == 'state':
+            self.start_btn.setEnabled(not self.engine.is_active(STREAM_NAME))
+
+    def closeEvent(self, event):
+        self.engine.submit(self.engine.stop_all()).result(10)
+        super().closeEvent(event)
 
 if __name__ == '__main__':
     app = QApplication(sys.argv)
@@ -1,13 +1,24 @@
 import sys
 from PyQt5.QtWidgets import (QApplication, QWidget, QPushButton, QFileDialog, QLabel, QVBoxLayout, 
-                             QMessageBox, QHBoxLayout, QLineEdit, QTimeEdit, QTextEdit)
+                             QMessageBox, QHBoxLayout, QLineEdit, QDateTimeEdit)
 from PyQt5.QtGui import QFont
-from PyQt5.QtCore import Qt, QUrl, QTime, QTimer
+from PyQt5.QtCore import Qt, QUrl, QDateTime
 from PyQt5.QtMultimedia import QMediaPlayer, QMediaContent
 from PyQt5.QtMultimediaWidgets import QVideoWidget
-import subprocess
-import threading
-import datetime
+
+from keyframes import build_later, lookup as lookup_keyframes
+from log_pipeline import LogPipeline
+from loudness import loudness_cache, measure_later, summary
+from preview import PreviewTap
+from qt_support import EngineBridge, LibraryDialog, LogView, PreviewWidget, ResourceSparklines
+from resources import ResourceSampler, engine_sources
+from scheduler import STARTED, ScheduledJob, Scheduler, parse_clip
+from stream_command import parse_destinations
+from stream_engine import FAILED, LIVE, RECONNECTING, STOPPED, StreamEngine
+from telemetry import describe
+from text_ticker import TextTicker
+
+STREAM_NAME = 'main'
 
 class StreamApp(QWidget):
     def __init__(self):
@@ -24,22 +35,31 @@ class StreamApp(QWidget):
         self.status_label.setAlignment(Qt.AlignCenter)
         self.updateStatusLabel("red", "Streaming is off")
 
+        self.metrics_label = QLabel(self)
+        self.metrics_label.setFont(QFont('Arial', 10))
+        self.metrics_label.setAlignment(Qt.AlignCenter)
+
         self.label = QLabel('Select a video file', self)
         self.label.setFont(QFont('Arial', 14))
         self.label.setAlignment(Qt.AlignCenter)
 
-        self.key_label = QLabel('YouTube Streaming Key:', self)
+        self.key_label = QLabel('YouTube Streaming Key(s) or URL(s), comma separated:', self)
         self.key_label.setFont(QFont('Arial', 12))
 
         self.key_input = QLineEdit(self)
         self.key_input.setFont(QFont('Arial', 12))
 
-        self.schedule_label = QLabel('Schedule Time (HH:MM):', self)
+        self.schedule_label = QLabel('Schedule Date and Time:', self)
         self.schedule_label.setFont(QFont('Arial', 12))
 
-        self.time_input = QTimeEdit(self)
-        self.time_input.setDisplayFormat('HH:mm')
+        self.time_input = QDateTimeEdit(QDateTime.currentDateTime(), self)
+        self.time_input.setDisplayFormat('yyyy-MM-dd HH:mm')
+        self.time_input.setCalendarPopup(True)
         self.time_input.setFont(QFont('Arial', 12))
+
+        self.clip_input = QLineEdit(self)
+        self.clip_input.setFont(QFont('Arial', 12))
+        self.clip_input.setPlaceholderText('Air from (1:20:00) or a clip (1:20:00-1:50:00); empty for the whole file')
         
         self.btn = QPushButton('Browse Video', self)
         self.btn.setFont(QFont('Arial', 12))
@@ -48,6 +68,14 @@ class StreamApp(QWidget):
         self.ticker_btn = QPushButton('Browse Ticker Image', self)
         self.ticker_btn.setFont(QFont('Arial', 12))
         self.ticker_btn.clicked.connect(self.showTickerDialog)
+
+        self.ticker_text_input = QLineEdit(self)
+        self.ticker_text_input.setFont(QFont('Arial', 12))
+        self.ticker_text_input.setPlaceholderText('Ticker headlines')
+
+        self.ticker_text_btn = QPushButton('Update Ticker Text', self)
+        self.ticker_text_btn.setFont(QFont('Arial', 12))
+        self.ticker_text_btn.clicked.connect(self.updateTickerText)
         
         self.start_btn = QPushButton('Start Streaming', self)
         self.start_btn.setFont(QFont('Arial', 12))
@@ -72,13 +100,20 @@ class StreamApp(QWidget):
         self.stop_video_btn.setEnabled(False)
         self.stop_video_btn.clicked.connect(self.stopVideo)
 
+        self.preview_btn = QPushButton('On-Air Preview', self)
+        self.preview_btn.setFont(QFont('Arial', 12))
+        self.preview_btn.setCheckable(True)
+        self.preview_btn.toggled.connect(self.togglePreview)
+
         self.video_widget = QVideoWidget(self)
         self.media_player = QMediaPlayer(None, QMediaPlayer.VideoSurface)
         self.media_player.setVideoOutput(self.video_widget)
 
-        self.log_output = QTextEdit(self)
+        # Everything logged lands in a bounded ring and a rotating file; the
+        # view is refreshed from the ring in batches, never per line
+        self.logs = LogPipeline()
+        self.log_output = LogView(self.logs.ring, self)
         self.log_output.setFont(QFont('Arial', 12))
-        self.log_output.setReadOnly(True)
         
         left_layout = QVBoxLayout()
         left_layout.addWidget(self.label)
@@ -86,8 +121,13 @@ class StreamApp(QWidget):
         left_layout.addWidget(self.key_input)
         left_layout.addWidget(self.schedule_label)
         left_layout.addWidget(self.time_input)
+        left_layout.addWidget(self.clip_input)
         left_layout.addWidget(self.btn)
         left_layout.addWidget(self.ticker_btn)
+        ticker_text_box = QHBoxLayout()
+        ticker_text_box.addWidget(self.ticker_text_input)
+        ticker_text_box.addWidget(self.ticker_text_btn)
+        left_layout.addLayout(ticker_text_box)
         left_layout.addWidget(self.start_btn)
         left_layout.addWidget(self.schedule_btn)
         left_layout.addWidget(self.stop_btn)
@@ -96,13 +136,23 @@ class StreamApp(QWidget):
         video_control_box = QHBoxLayout()
         video_control_box.addWidget(self.play_btn)
         video_control_box.addWidget(self.stop_video_btn)
+        video_control_box.addWidget(self.preview_btn)
         left_layout.addLayout(video_control_box)
+        self.video_box = left_layout
         
         right_layout = QVBoxLayout()
         right_layout.addWidget(self.log_output)
 
+        self.sparklines = ResourceSparklines(STREAM_NAME, self)
+        status_box = QHBoxLayout()
+        status_box.addStretch(1)
+        status_box.addWidget(self.status_label)
+        status_box.addWidget(self.sparklines)
+        status_box.addStretch(1)
+
         main_layout = QVBoxLayout()
-        main_layout.addWidget(self.status_label)
+        main_layout.addLayout(status_box)
+        main_layout.addWidget(self.metrics_label)
         
         content_layout = QHBoxLayout()
         content_layout.addLayout(left_layout, 2)
@@ -113,19 +163,42 @@ class StreamApp(QWidget):
 
         self.video_path = None
         self.ticker_path = None
-        self.ffmpeg_process = None
-        self.timer = QTimer()
-        self.timer.timeout.connect(self.check_schedule)
-        self.timer.start(1000)  # Check every second
+        self.preview = None
+        self.preview_tap = None
+        self.engine = StreamEngine().run_in_background()
+        self.sampler = ResourceSampler(engine_sources(self.engine)).start()
+        self.sparklines.setSampler(self.sampler)
+        self.engine.subscribe(self.logs.on_event)
+        self.bridge = EngineBridge(self.engine, skip=('log',))
+        self.bridge.event.connect(self.onEngineEvent)
+        try:
+            self.text_ticker = TextTicker()
+        except RuntimeError as e:
+            self.text_ticker = None
+            self.ticker_text_input.setEnabled(False)
+            self.ticker_text_btn.setEnabled(False)
+            self.log_message(str(e))
+        # Scheduled slots survive restarts; anything missed meanwhile is
+        # caught up when the schedule is loaded
+        self.scheduler = Scheduler(self.engine, ticker_factory=self.scheduledTicker)
+        self.scheduler.subscribe(self.logs.on_event)
+        self.schedule_bridge = EngineBridge(self.scheduler, skip=('log',))
+        self.schedule_bridge.event.connect(self.onScheduleEvent)
+        self.scheduler.load().start()
+        for job in self.scheduler.upcoming():
+            self.log_message(f"Scheduled: {job.describe()}")
 
     def log_message(self, message):
-        self.log_output.append(message)
+        self.logs.write(message)
     
     def showVideoDialog(self):
-        options = QFileDialog.Options()
-        self.video_path, _ = QFileDialog.getOpenFileName(self, "Select Video File", "", "All Files (*);;MP4 Files (*.mp4)", options=options)
+        self.video_path = LibraryDialog.pick(self)
         if self.video_path:
-            self.label.setText(f"Selected file: {self.video_path}")
+            self.label.setText(f"Selected file: {self.video_path} ({summary(self.video_path)})")
+            if not loudness_cache.lookup(self.video_path):
+                measure_later([self.video_path])
+            if lookup_keyframes(self.video_path) is None:
+                build_later([self.video_path])
             self.media_player.setMedia(QMediaContent(QUrl.fromLocalFile(self.video_path)))
             self.play_btn.setEnabled(True)
             self.stop_video_btn.setEnabled(True)
@@ -136,52 +209,73 @@ class StreamApp(QWidget):
         self.ticker_path, _ = QFileDialog.getOpenFileName(self, "Select Ticker Image", "", "All Files (*);;PNG Files (*.png);;JPG Files (*.jpg)", options=options)
         if self.ticker_path:
             self.log_message(f"Selected ticker image: {self.ticker_path}")
+
+    def updateTickerText(self):
+        # Redraws the strip the running encoder is reading; no restart needed
+        if self.text_ticker:
+            self.text_ticker.set_text(self.ticker_text_input.text())
+            self.log_message(f"Ticker text: {self.ticker_text_input.text()}")
     
+    def clip(self):
+        try:
+            return parse_clip(self.clip_input.text())
+        except ValueError:
+            self.showMessageBox("Error", "Enter the start as h:mm:ss, or a clip as h:mm:ss-h:mm:ss.")
+            return None
+
     def startStreaming(self):
-        if self.video_path and self.key_input.text() and self.ticker_path:
+        has_ticker = self.ticker_path or (self.text_ticker and self.ticker_text_input.text())
+        clip = self.clip()
+        if not clip:
+            return
+        if self.video_path and parse_destinations(self.key_input.text()) and has_ticker:
             self.start_btn.setEnabled(False)
             self.stop_btn.setEnabled(True)
             self.updateStatusLabel("green", "Streaming is on")
             self.log_message("Starting streaming...")
-            threading.Thread(target=self.run_ffmpeg).start()
+            stream_urls = parse_destinations(self.key_input.text())
+            # Ticker text entered before the start keeps the text strip live for edits
+            text_ticker = self.text_ticker if self.text_ticker and self.ticker_text_input.text() else None
+            if text_ticker:
+                text_ticker.set_text(self.ticker_text_input.text())
+            # The on-air preview replaces local playback: no second decode of the source
+            self.media_player.stop()
+            self.play_btn.setEnabled(False)
+            self.stop_video_btn.setEnabled(False)
+            # The tap is an extra encoder output, so it is only planned in while the preview is shown
+            self.preview_tap = PreviewTap().start() if self.preview_btn.isChecked() else None
+            if self.preview:
+                self.preview.setTap(self.preview_tap)
+            self.engine.submit(self.engine.start(STREAM_NAME, self.video_path, stream_urls,
+                                                 ticker_path=self.ticker_path, text_ticker=text_ticker,
+                                                 preview=self.preview_tap, start_offset=clip[0], end_at=clip[1]))
         else:
-            self.showMessageBox("Error", "Please select a video file, ticker image, and enter the YouTube streaming key.")
+            self.showMessageBox("Error", "Please select a video file, a ticker image or ticker text, and enter the YouTube streaming key.")
     
-    def run_ffmpeg(self):
-        stream_key = self.key_input.text()
-        stream_url = f"rtmp://a.rtmp.youtube.com/live2/{stream_key}"
-        ffmpeg_path = r"C:/ffmpeg/bin/ffmpeg.exe"  # Replace with the correct path
-        command = [
-            ffmpeg_path, '-re', '-i', self.video_path, '-i', self.ticker_path,
-            '-filter_complex', '[1:v]scale=iw:-1[ticker];[0:v][ticker]overlay=0:H-h',
-            '-c:v', 'libx264', '-preset', 'veryfast', 
-            '-maxrate', '3000k', '-bufsize', '6000k', '-pix_fmt', 'yuv420p', '-g', '50', '-c:a', 'aac', 
-            '-b:a', '128k', '-ar', '44100', '-f', 'flv', stream_url
-        ]
-        self.log_message(f"Running command: {command}")
-        try:
-            self.ffmpeg_process = subprocess.Popen(command)
-            self.ffmpeg_process.wait()
-        except FileNotFoundError as e:
-            self.showMessageBox("File Not Found", f"FileNotFoundError: {e}")
-            self.log_message(f"FileNotFoundError: {e}")
-        except Exception as e:
-            self.showMessageBox("Error", f"An error occurred: {e}")
-            self.log_message(f"An error occurred: {e}")
-        finally:
+    def onEngineEvent(self, event):
+        if event['type'] == 'metrics':
+            self.metrics_label.setText(describe(event['sample']))
+        elif event['state'] == RECONNECTING:
+            self.updateStatusLabel("orange", "Reconnecting...")
+        elif event['state'] == LIVE:
+            self.updateStatusLabel("green", "Streaming is on")
+        elif event['state'] in (STOPPED, FAILED):
+            self.metrics_label.clear()
             self.updateStatusLabel("red", "Streaming is off")
             self.start_btn.setEnabled(True)
             self.stop_btn.setEnabled(False)
+            self.play_btn.setEnabled(bool(self.video_path))
+            if self.preview_tap:
+                self.preview_tap.stop()
+                self.preview_tap = None
+            if event['state'] == FAILED:
+                self.showMessageBox("Error", f"An error occurred: {event['error']}")
             self.log_message("Streaming stopped.")
     
     def stopStreaming(self):
-        if self.ffmpeg_process:
-            self.ffmpeg_process.terminate()
-            self.ffmpeg_process = None
+        if self.engine.is_active(STREAM_NAME):
+            self.engine.submit(self.engine.stop(STREAM_NAME))
             self.showMessageBox("Stopped", "Streaming stopped successfully!")
-            self.updateStatusLabel("red", "Streaming is off")
-            self.start_btn.setEnabled(True)
-            self.stop_btn.setEnabled(False)
             self.log_message("Streaming stopped by user.")
 
     def playVideo(self):
@@ -196,16 +290,57 @@ class StreamApp(QWidget):
         self.stop_video_btn.setEnabled(False)
         self.log_message("Stopped video.")
     
-    def scheduleStreaming(self):
-        self.scheduled_time = self.time_input.time().toString('HH:mm')
-        self.showMessageBox("Scheduled", f"Streaming scheduled at {self.scheduled_time}")
-        self.log_message(f"Streaming scheduled at {self.scheduled_time}")
+    def togglePreview(self, checked):
+        # Built the first time it's asked for; hidden, it doesn't even run its timer
+        if checked and not self.preview:
+            self.preview = PreviewWidget(self.preview_tap, self)
+            self.video_box.insertWidget(self.video_box.indexOf(self.video_widget) + 1, self.preview)
+        if self.preview:
+            self.preview.setVisible(checked)
+        self.video_widget.setVisible(not checked)
+        if self.engine.is_active(STREAM_NAME) and checked != bool(self.preview_tap):
+            self.swapPreviewTap(PreviewTap().start() if checked else None)
+
+    def swapPreviewTap(self, tap):
+        # Mid-stream the encoder restarts with or without the tap
+        old, self.preview_tap = self.preview_tap, tap
+        if self.preview:
+            self.preview.setTap(tap)
+        self.engine.submit(self.engine.set_preview(STREAM_NAME, tap))
+        if old:
+            old.stop()
     
-    def check_schedule(self):
-        current_time = datetime.datetime.now().strftime('%H:%M')
-        if hasattr(self, 'scheduled_time') and self.scheduled_time == current_time:
-            self.startStreaming()
-            delattr(self, 'scheduled_time')  # Remove the attribute after starting streaming
+    def scheduleStreaming(self):
+        has_ticker = self.ticker_path or (self.text_ticker and self.ticker_text_input.text())
+        stream_urls = parse_destinations(self.key_input.text())
+        if not (self.video_path and stream_urls and has_ticker):
+            self.showMessageBox("Error", "Please select a video file, a ticker image or ticker text, and enter the YouTube streaming key.")
+            return
+        clip = self.clip()
+        if not clip:
+            return
+        try:
+            job = ScheduledJob(self.time_input.dateTime().toSecsSinceEpoch(), self.video_path, stream_urls,
+                               ticker_path=self.ticker_path, ticker_text=self.ticker_text_input.text(),
+                               name=STREAM_NAME, in_point=clip[0], out_point=clip[1])
+        except ValueError as e:
+            self.showMessageBox("Error", str(e))
+            return
+        self.scheduler.add(job)
+        self.showMessageBox("Scheduled", f"Streaming scheduled: {job.describe()}")
+
+    def scheduledTicker(self, text):
+        # Called on the scheduler's thread ahead of a slot with ticker text.
+        # Each slot gets its own strip, so warming one up never changes the
+        # text on air; without Pillow the slot goes out without one.
+        return TextTicker(text) if self.text_ticker else None
+
+    def onScheduleEvent(self, event):
+        if event['job']['status'] == STARTED:
+            self.start_btn.setEnabled(False)
+            self.stop_btn.setEnabled(True)
+            self.updateStatusLabel("green", "Streaming is on")
+            self.log_message("Starting scheduled streaming...")
     
     def updateStatusLabel(self, color, text):
         color_circle = f'<span style="color: {color}; font-size: 46px;">&#9679;</span>'
@@ -215,6 +350,12 @@ class StreamApp(QWidget):
         QMessageBox.information(self, title, message)
         self.log_message(message)
 
+    def closeEvent(self, event):
+        self.scheduler.stop()
+        self.sampler.stop()
+        self.engine.submit(self.engine.stop_all()).result(10)
+        super().closeEvent(event)
+
 if __name__ == '__main__':
     app = QApplication(sys.argv)
     ex = StreamApp()
@@ -1,11 +1,22 @@
 import sys
-from PyQt5.QtWidgets import (QApplication, QWidget, QPushButton, QFileDialog, QLabel, QVBoxLayout, QMessageBox, QHBoxLayout, QLineEdit, QStyle)
+from PyQt5.QtWidgets import (QApplication, QWidget, QPushButton, QFileDialog, QLabel, QVBoxLayout, QMessageBox, QHBoxLayout, QLineEdit, QStyle, QListWidget)
 from PyQt5.QtGui import QFont
 from PyQt5.QtCore import Qt, QUrl
 from PyQt5.QtMultimedia import QMediaPlayer, QMediaContent
 from PyQt5.QtMultimediaWidgets import QVideoWidget
-import subprocess
-import threading
+
+from keyframes import build_later, lookup as lookup_keyframes
+from log_pipeline import LogPipeline
+from loudness import loudness_cache, measure_later, summary
+from playlist import Playlist
+from preview import PreviewTap
+from qt_support import EngineBridge, LibraryDialog, PreviewWidget, ResourceSparklines
+from resources import ResourceSampler, engine_sources
+from stream_command import parse_destinations
+from stream_engine import FAILED, LIVE, RECONNECTING, STOPPED, StreamEngine
+from telemetry import describe
+
+STREAM_NAME = 'main'
 
 class StreamApp(QWidget):
     def __init__(self):
@@ -19,12 +30,15 @@ class StreamApp(QWidget):
         self.status_label = QLabel(self)
         self.status_label.setFixedSize(20, 20)
         self.status_label.setStyleSheet("background-color: red; border-radius: 10px;")
+
+        self.metrics_label = QLabel(self)
+        self.metrics_label.setFont(QFont('Arial', 10))
         
         self.label = QLabel('Select a video file', self)
         self.label.setFont(QFont('Arial', 14))
         self.label.setAlignment(Qt.AlignCenter)
 
-        self.key_label = QLabel('YouTube Streaming Key:', self)
+        self.key_label = QLabel('YouTube Streaming Key(s) or URL(s), comma separated:', self)
         self.key_label.setFont(QFont('Arial', 12))
 
         self.key_input = QLineEdit(self)
@@ -34,6 +48,20 @@ class StreamApp(QWidget):
         self.btn.setFont(QFont('Arial', 12))
         self.btn.clicked.connect(self.showDialog)
         
+        # Files in the playlist play back to back in one session, looping;
+        # edits apply from the next item on
+        self.playlist_list = QListWidget(self)
+        self.playlist_list.setFont(QFont('Arial', 10))
+        self.playlist_list.setMaximumHeight(100)
+
+        self.playlist_add_btn = QPushButton('Add to Playlist', self)
+        self.playlist_add_btn.setFont(QFont('Arial', 12))
+        self.playlist_add_btn.clicked.connect(self.addToPlaylist)
+
+        self.playlist_remove_btn = QPushButton('Remove from Playlist', self)
+        self.playlist_remove_btn.setFont(QFont('Arial', 12))
+        self.playlist_remove_btn.clicked.connect(self.removeFromPlaylist)
+
         self.start_btn = QPushButton('Start Streaming', self)
         self.start_btn.setFont(QFont('Arial', 12))
         self.start_btn.clicked.connect(self.startStreaming)
@@ -53,12 +81,21 @@ class StreamApp(QWidget):
         self.stop_video_btn.setEnabled(False)
         self.stop_video_btn.clicked.connect(self.stopVideo)
 
+        self.preview_btn = QPushButton('On-Air Preview', self)
+        self.preview_btn.setFont(QFont('Arial', 12))
+        self.preview_btn.setCheckable(True)
+        self.preview_btn.toggled.connect(self.togglePreview)
+
         self.video_widget = QVideoWidget(self)
         self.media_player = QMediaPlayer(None, QMediaPlayer.VideoSurface)
         self.media_player.setVideoOutput(self.video_widget)
 
+        self.sparklines = ResourceSparklines(STREAM_NAME, self)
+
         hbox = QHBoxLayout()
         hbox.addWidget(self.status_label)
+        hbox.addWidget(self.sparklines)
+        hbox.addWidget(self.metrics_label)
         hbox.addStretch(1)
 
         vbox = QVBoxLayout()
@@ -67,6 +104,11 @@ class StreamApp(QWidget):
         vbox.addWidget(self.key_label)
         vbox.addWidget(self.key_input)
         vbox.addWidget(self.btn)
+        vbox.addWidget(self.playlist_list)
+        playlist_box = QHBoxLayout()
+        playlist_box.addWidget(self.playlist_add_btn)
+        playlist_box.addWidget(self.playlist_remove_btn)
+        vbox.addLayout(playlist_box)
         vbox.addWidget(self.start_btn)
         vbox.addWidget(self.stop_btn)
         vbox.addWidget(self.video_widget)
@@ -74,61 +116,95 @@ class StreamApp(QWidget):
         video_control_box = QHBoxLayout()
         video_control_box.addWidget(self.play_btn)
         video_control_box.addWidget(self.stop_video_btn)
+        video_control_box.addWidget(self.preview_btn)
         vbox.addLayout(video_control_box)
         
         self.setLayout(vbox)
+        self.video_box = vbox
         
         self.video_path = None
-        self.ffmpeg_process = None
+        self.preview = None
+        self.preview_tap = None
+        self.playlist = Playlist()
+        # Rotating log under ~/.automated_obs/logs; earlier runs are kept, not truncated
+        self.logs = LogPipeline()
+        self.engine = StreamEngine().run_in_background()
+        self.sampler = ResourceSampler(engine_sources(self.engine)).start()
+        self.sparklines.setSampler(self.sampler)
+        self.engine.subscribe(self.logs.on_event)
+        self.bridge = EngineBridge(self.engine, skip=('log',))
+        self.bridge.event.connect(self.onEngineEvent)
     
     def showDialog(self):
-        options = QFileDialog.Options()
-        self.video_path, _ = QFileDialog.getOpenFileName(self, "Select Video File", "", "All Files (*);;MP4 Files (*.mp4)", options=options)
+        self.video_path = LibraryDialog.pick(self)
         if self.video_path:
-            self.label.setText(f"Selected file: {self.video_path}")
+            self.label.setText(f"Selected file: {self.video_path} ({summary(self.video_path)})")
+            if not loudness_cache.lookup(self.video_path):
+                measure_later([self.video_path])
+            if lookup_keyframes(self.video_path) is None:
+                build_later([self.video_path])
             self.media_player.setMedia(QMediaContent(QUrl.fromLocalFile(self.video_path)))
             self.play_btn.setEnabled(True)
             self.stop_video_btn.setEnabled(True)
     
+    def addToPlaylist(self):
+        if self.video_path:
+            self.playlist.add(self.video_path)
+            self.playlist_list.addItem(self.video_path)
+
+    def removeFromPlaylist(self):
+        row = self.playlist_list.currentRow()
+        if row >= 0:
+            self.playlist.remove(row)
+            self.playlist_list.takeItem(row)
+
     def startStreaming(self):
-        if self.video_path and self.key_input.text():
+        if (self.video_path or self.playlist_list.count()) and parse_destinations(self.key_input.text()):
             self.start_btn.setEnabled(False)
             self.stop_btn.setEnabled(True)
             self.updateStatusLabel("green")
-            threading.Thread(target=self.run_ffmpeg).start()
+            # The on-air preview replaces local playback: no second decode of the source
+            self.media_player.stop()
+            self.play_btn.setEnabled(False)
+            self.stop_video_btn.setEnabled(False)
+            # The tap is an extra encoder output, so it is only planned in while the preview is shown
+            self.preview_tap = PreviewTap().start() if self.preview_btn.isChecked() else None
+            if self.preview:
+                self.preview.setTap(self.preview_tap)
+            stream_urls = parse_destinations(self.key_input.text())
+            if self.playlist_list.count():
+                self.playlist.rewind()
+                self.engine.submit(self.engine.start(STREAM_NAME, None, stream_urls, playlist=self.playlist,
+                                                     preview=self.preview_tap))
+            else:
+                self.engine.submit(self.engine.start(STREAM_NAME, self.video_path, stream_urls,
+                                                     preview=self.preview_tap))
         else:
             self.showMessageBox("Error", "Please select a video file and enter the YouTube streaming key.")
-    
-    def run_ffmpeg(self):
-        stream_key = self.key_input.text()
-        stream_url = f"rtmp://a.rtmp.youtube.com/live2/{stream_key}"
-        ffmpeg_path = r"C:/ffmpeg/bin/ffmpeg.exe"  # Replace with the correct path
-        command = [
-            ffmpeg_path, '-re', '-i', self.video_path, '-c:v', 'libx264', '-preset', 'veryfast', 
-            '-maxrate', '3000k', '-bufsize', '6000k', '-pix_fmt', 'yuv420p', '-g', '50', '-c:a', 'aac', 
-            '-b:a', '128k', '-ar', '44100', '-f', 'flv', stream_url
-        ]
-        print("Running command:", command)
-        try:
-            self.ffmpeg_process = subprocess.Popen(command)
-            self.ffmpeg_process.wait()
-        except FileNotFoundError as e:
-            self.showMessageBox("File Not Found", f"FileNotFoundError: {e}")
-        except Exception as e:
-            self.showMessageBox("Error", f"An error occurred: {e}")
-        finally:
+
+    def onEngineEvent(self, event):
+        if event['type'] == 'metrics':
+            self.metrics_label.setText(describe(event['sample']))
+        elif event['state'] == RECONNECTING:
+            self.updateStatusLabel("orange")
+        elif event['state'] == LIVE:
+            self.updateStatusLabel("green")
+        elif event['state'] in (STOPPED, FAILED):
+            self.metrics_label.clear()
             self.updateStatusLabel("red")
             self.start_btn.setEnabled(True)
             self.stop_btn.setEnabled(False)
+            self.play_btn.setEnabled(bool(self.video_path))
+            if self.preview_tap:
+                self.preview_tap.stop()
+                self.preview_tap = None
+            if event['state'] == FAILED:
+                self.showMessageBox("Error", f"An error occurred: {event['error']}")
     
     def stopStreaming(self):
-        if self.ffmpeg_process:
-            self.ffmpeg_process.terminate()
-            self.ffmpeg_process = None
+        if self.engine.is_active(STREAM_NAME):
+            self.engine.submit(self.engine.stop(STREAM_NAME))
             self.showMessageBox("Stopped", "Streaming stopped successfully!")
-            self.updateStatusLabel("red")
-            self.start_btn.setEnabled(True)
-            self.stop_btn.setEnabled(False)
 
     def playVideo(self):
         self.media_player.play()
@@ -140,12 +216,37 @@ class StreamApp(QWidget):
         self.play_btn.setEnabled(True)
         self.stop_video_btn.setEnabled(False)
     
+    def togglePreview(self, checked):
+        # Built the first time it's asked for; hidden, it doesn't even run its timer
+        if checked and not self.preview:
+            self.preview = PreviewWidget(self.preview_tap, self)
+            self.video_box.insertWidget(self.video_box.indexOf(self.video_widget) + 1, self.preview)
+        if self.preview:
+            self.preview.setVisible(checked)
+        self.video_widget.setVisible(not checked)
+        if self.engine.is_active(STREAM_NAME) and checked != bool(self.preview_tap):
+            self.swapPreviewTap(PreviewTap().start() if checked else None)
+
+    def swapPreviewTap(self, tap):
+        # Mid-stream the encoder restarts with or without the tap
+        old, self.preview_tap = self.preview_tap, tap
+        if self.preview:
+            self.preview.setTap(tap)
+        self.engine.submit(self.engine.set_preview(STREAM_NAME, tap))
+        if old:
+            old.stop()
+    
     def updateStatusLabel(self, color):
         self.status_label.setStyleSheet(f"background-color: {color}; border-radius: 10px;")
     
     def showMessageBox(self, title, message):
         QMessageBox.information(self, title, message)
 
+    def closeEvent(self, event):
+        self.sampler.stop()
+        self.engine.submit(self.engine.stop_all()).result(10)
+        super().closeEvent(event)
+
 if __name__ == '__main__':
     app = QApplication(sys.argv)
     ex = StreamApp()
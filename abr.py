@@ -0,0 +1,96 @@
+import json
+import os
+
+from config import DATA_DIR
+
+LADDER_PATH = os.path.join(DATA_DIR, 'abr_ladder.json')
+
+# Top rung is the encoder's usual settings at the source resolution
+DEFAULT_LADDER = [
+    {'name': 'source', 'height': None, 'maxrate': 3000, 'bufsize': 6000},
+    {'name': '540p', 'height': 540, 'maxrate': 1800, 'bufsize': 3600},
+    {'name': '480p', 'height': 480, 'maxrate': 1200, 'bufsize': 2400},
+    {'name': '360p', 'height': 360, 'maxrate': 700, 'bufsize': 1400},
+]
+
+DOWN_SPEED = 0.95      # below this the output can't keep up with -re
+UP_SPEED = 0.99
+DOWN_AFTER = 6         # seconds of congestion before stepping down
+UP_AFTER = 60          # seconds of clean sending before trying a step up
+MAX_UP_AFTER = 960
+COOLDOWN = 15          # no decisions while the restarted encoder settles
+THROUGHPUT_MARGIN = 0.8
+
+
+def load_ladder(path=LADDER_PATH):
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return DEFAULT_LADDER
+
+
+class AdaptiveBitrate:
+    # Watches encoder speed and effective send rate from the telemetry samples
+    # and picks a rung. Separate up/down thresholds and hold times give the
+    # hysteresis; a step up that fails quickly doubles the next hold time.
+    def __init__(self, ladder=None):
+        self.ladder = ladder or load_ladder()
+        self.index = 0
+        self.bad_since = None
+        self.good_since = None
+        self.last_change = None
+        self.last_change_up = False
+        self.up_after = UP_AFTER
+        self.last_sample = None
+        self.send_rate_kbps = 0.0
+
+    @property
+    def rung(self):
+        return self.ladder[self.index]
+
+    def measure(self, sample):
+        # Effective send rate from bytes the muxer actually got out; tee outputs
+        # don't report a size, so fall back to ffmpeg's own bitrate figure.
+        previous = self.last_sample
+        self.last_sample = (sample['time'], sample['total_size'])
+        if previous and sample['total_size'] > previous[1] and sample['time'] > previous[0]:
+            self.send_rate_kbps = (sample['total_size'] - previous[1]) * 8 / 1000 / (sample['time'] - previous[0])
+        elif sample['bitrate_kbps']:
+            self.send_rate_kbps = sample['bitrate_kbps']
+
+    def observe(self, sample):
+        self.measure(sample)
+        now = sample['time']
+        if self.last_change is None:
+            self.last_change = now
+        if now - self.last_change < COOLDOWN:
+            return None
+        speed = sample['speed']
+        if 0 < speed < DOWN_SPEED:
+            self.good_since = None
+            self.bad_since = self.bad_since or now
+            if now - self.bad_since >= DOWN_AFTER and self.index < len(self.ladder) - 1:
+                index = self.index + 1
+                while (index < len(self.ladder) - 1 and self.send_rate_kbps and
+                       self.ladder[index]['maxrate'] > self.send_rate_kbps * THROUGHPUT_MARGIN):
+                    index += 1
+                if self.last_change_up and now - self.last_change < self.up_after * 2:
+                    self.up_after = min(self.up_after * 2, MAX_UP_AFTER)
+                return self.change(index, now)
+        elif speed >= UP_SPEED:
+            self.bad_since = None
+            self.good_since = self.good_since or now
+            if self.index > 0 and now - self.good_since >= self.up_after:
+                return self.change(self.index - 1, now)
+        return None
+
+    def change(self, index, now):
+        self.last_change_up = index < self.index
+        if not self.last_change_up and now - self.last_change > MAX_UP_AFTER:
+            self.up_after = UP_AFTER
+        self.index = index
+        self.last_change = now
+        self.bad_since = None
+        self.good_since = None
+        return self.rung
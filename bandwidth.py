@@ -0,0 +1,164 @@
+import json
+import os
+import threading
+import time
+import urllib.request
+
+from telemetry import METRICS_DIR, MetricsRing
+
+PROBE_TTL = 30 * 60       # an active result stays good for this long
+CHECK_INTERVAL = 60
+HISTORY_CAPACITY = 1440   # a day of one-minute samples
+PROBE_BYTES = 10_000_000
+
+FIELDS = ('time', 'download_mbps', 'upload_mbps', 'passive')
+
+ACTIVE = 0.0
+PASSIVE = 1.0
+
+
+class SpeedtestTarget:
+    # speedtest.net, as before; only imported when a probe actually runs
+    def probe(self):
+        import speedtest
+
+        test = speedtest.Speedtest()
+        test.get_best_server()
+        return test.download() / 1_000_000, test.upload() / 1_000_000
+
+
+class HttpTarget:
+    # Times a GET and a POST of PROBE_BYTES against a plain HTTP server,
+    # e.g. standin.BandwidthStandIn for offline checks.
+    def __init__(self, url, size=PROBE_BYTES, timeout=30):
+        self.url = url
+        self.size = size
+        self.timeout = timeout
+
+    def probe(self):
+        started = time.perf_counter()
+        received = 0
+        with urllib.request.urlopen(f"{self.url}?bytes={self.size}", timeout=self.timeout) as response:
+            while True:
+                chunk = response.read(65536)
+                if not chunk:
+                    break
+                received += len(chunk)
+        download = received * 8 / 1_000_000 / (time.perf_counter() - started)
+        request = urllib.request.Request(self.url, data=bytes(self.size), method='POST')
+        started = time.perf_counter()
+        with urllib.request.urlopen(request, timeout=self.timeout) as response:
+            response.read()
+        upload = self.size * 8 / 1_000_000 / (time.perf_counter() - started)
+        return download, upload
+
+
+def default_target():
+    # BANDWIDTH_PROBE_URL points the probe at your own server instead of speedtest.net
+    url = os.environ.get('BANDWIDTH_PROBE_URL')
+    return HttpTarget(url) if url else SpeedtestTarget()
+
+
+class BandwidthMonitor:
+    # One worker thread does all the probing, so two probes never overlap.
+    # While a stream is live an active probe would compete with it for the
+    # uplink, so the monitor records the stream's own send rate instead.
+    # on_probe(message) is called from the worker when a probe finishes or fails.
+    def __init__(self, target=None, engine=None, ttl=PROBE_TTL, interval=CHECK_INTERVAL, directory=METRICS_DIR,
+                 on_probe=None):
+        self.target = target or default_target()
+        self.engine = engine
+        self.on_probe = on_probe or (lambda message: None)
+        self.ttl = ttl
+        self.interval = interval
+        self.history = MetricsRing(HISTORY_CAPACITY, FIELDS)
+        self.log_path = os.path.join(directory, 'bandwidth.jsonl')
+        self.last_probe = None
+        self.error = None
+        self.probing = False
+        self.lock = threading.Lock()
+        self.wake = threading.Event()
+        self.running = False
+        self.worker = None
+
+    def start(self):
+        self.running = True
+        self.worker = threading.Thread(target=self.run, name='bandwidth-monitor', daemon=True)
+        self.worker.start()
+        return self
+
+    def stop(self):
+        self.running = False
+        self.wake.set()
+
+    def refresh(self):
+        # Ask for a probe now; ignored while one is running or a stream is live
+        self.last_probe = None
+        self.wake.set()
+
+    def streaming(self):
+        return bool(self.engine and self.engine.has_live_stream())
+
+    def stale(self):
+        return self.last_probe is None or time.time() - self.last_probe['time'] > self.ttl
+
+    def run(self):
+        while self.running:
+            if self.streaming():
+                self.record_passive()
+            elif self.stale():
+                self.probe()
+            self.wake.wait(self.interval)
+            self.wake.clear()
+
+    def probe(self):
+        self.probing = True
+        try:
+            download, upload = self.target.probe()
+        except Exception as e:  # speedtest raises its own exception types
+            self.error = f"{type(e).__name__}: {e}"
+            self.on_probe(f"Speed test failed: {self.error}")
+            return
+        finally:
+            self.probing = False
+        self.error = None
+        self.last_probe = self.record(download, upload, ACTIVE)
+        self.on_probe(f"Speed test: download {download:.2f} Mbps, upload {upload:.2f} Mbps")
+
+    def record_passive(self):
+        rate = self.engine.send_rate_kbps()
+        if rate:
+            self.record(0.0, rate / 1000, PASSIVE)
+
+    def record(self, download, upload, kind):
+        sample = {'time': time.time(), 'download_mbps': download, 'upload_mbps': upload, 'passive': kind}
+        with self.lock:
+            self.history.append(sample)
+        try:
+            os.makedirs(os.path.dirname(self.log_path), exist_ok=True)
+            with open(self.log_path, 'a') as f:
+                f.write(json.dumps(sample) + '\n')
+        except OSError:
+            pass
+        return sample
+
+    def latest(self):
+        with self.lock:
+            return self.history.latest()
+
+    def series(self, field, limit=None):
+        with self.lock:
+            return self.history.series(field, limit)
+
+    def describe(self):
+        sample = self.latest()
+        if sample and sample['passive'] and self.streaming():
+            return f"Streaming at {sample['upload_mbps']:.2f} Mbps (speed test paused while live)"
+        if self.probing:
+            return "Measuring internet speed..."
+        sample = self.last_probe
+        if not sample:
+            return f"Speed test failed ({self.error})" if self.error else "Checking internet speed..."
+        age = (time.time() - sample['time']) / 60
+        return (f"Download: {sample['download_mbps']:.2f} Mbps / Upload: {sample['upload_mbps']:.2f} Mbps "
+                f"({age:.0f} min ago)")
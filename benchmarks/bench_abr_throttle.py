@@ -0,0 +1,50 @@
+import asyncio
+import json
+import os
+import tempfile
+import time
+
+import common  # noqa: F401  (puts the repo root on sys.path)
+from standin import StandInListener, ThrottledProxy, free_port, make_sample
+from stream_engine import StreamEngine
+
+# Full uplink, then a squeeze well under the top rung, then full again
+PHASES = [(None, 20), (1000, 40), (None, 100)]
+
+
+async def run(sample):
+    listener = StandInListener(free_port()).start()
+    proxy = ThrottledProxy(listener, free_port()).start()
+    engine = StreamEngine()
+    switches = []
+
+    def on_event(event):
+        if event['type'] == 'log' and event['message'].startswith('Switching'):
+            switches.append({'time': round(event['time'] - started, 1), 'message': event['message']})
+            print(event['message'], flush=True)
+
+    engine.subscribe(on_event)
+    started = time.time()
+    try:
+        await engine.start('abr', sample, [proxy.url], adaptive=True)
+        for rate, seconds in PHASES:
+            proxy.set_rate(rate)
+            print(f"uplink {rate or 'unlimited'} kbit/s for {seconds}s", flush=True)
+            await asyncio.sleep(seconds)
+        status = engine.status('abr')
+        await engine.stop_all()
+    finally:
+        proxy.stop()
+        listener.stop()
+    return {'switches': switches, 'final_rung': status['rung'], 'state': status['state']}
+
+
+def main():
+    workdir = tempfile.mkdtemp(prefix='bench-abr-')
+    duration = sum(seconds for _, seconds in PHASES) + 30
+    sample = make_sample(os.path.join(workdir, 'sample.mp4'), duration=duration, gop=50)
+    print(json.dumps(asyncio.run(run(sample)), indent=2))
+
+
+if __name__ == '__main__':
+    main()
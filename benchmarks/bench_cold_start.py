@@ -0,0 +1,52 @@
+import json
+import os
+import re
+import statistics
+import subprocess
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BUDGET_MS = 100
+RUNS = 15
+
+
+def wall_ms(code):
+    timings = []
+    for _ in range(RUNS):
+        started = time.perf_counter()
+        subprocess.run([sys.executable, '-c', code], cwd=ROOT, check=True, capture_output=True)
+        timings.append((time.perf_counter() - started) * 1000)
+    return statistics.median(timings)
+
+
+def import_ms(module):
+    # Cumulative self-reported import time of the module, from -X importtime
+    result = subprocess.run([sys.executable, '-X', 'importtime', '-c', f"import {module}"], cwd=ROOT,
+                            capture_output=True, text=True)
+    for line in reversed(result.stderr.splitlines()):
+        match = re.match(r'import time:\s+\d+ \|\s+(\d+) \|\s*(\S+)$', line)
+        if match and match.group(2) == module:
+            return int(match.group(1)) / 1000
+    return None
+
+
+def main():
+    results = {
+        'interpreter_ms': wall_ms('pass'),
+        'cli_ready_ms': wall_ms('import stream_cli; stream_cli.StreamEngine()'),
+        'stream_cli_import_ms': import_ms('stream_cli'),
+        'stream_engine_import_ms': import_ms('stream_engine'),
+    }
+    try:
+        import PyQt5  # noqa: F401
+        results['gui_import_ms'] = wall_ms('import PyQt5.QtWidgets, PyQt5.QtMultimedia, PyQt5.QtMultimediaWidgets')
+    except ImportError:
+        results['gui_import_ms'] = None
+    results['budget_ms'] = BUDGET_MS
+    print(json.dumps(results, indent=2))
+    return 0 if results['cli_ready_ms'] < BUDGET_MS else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,136 @@
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+import common  # noqa: F401  (puts the repo root on sys.path)
+from control_api import ControlServer
+from standin import StandInListener, free_port, make_sample
+from stream_engine import StreamEngine
+
+PHASE_SECONDS = 15
+CONCURRENCY = 50
+
+
+async def request(reader, writer, method, path, body=None):
+    data = json.dumps(body).encode() if body is not None else b''
+    writer.write(f"{method} {path} HTTP/1.1\r\nHost: localhost\r\nContent-Length: {len(data)}\r\n\r\n".encode()
+                 + data)
+    await writer.drain()
+    status = int((await reader.readline()).split()[1])
+    length = 0
+    while True:
+        line = await reader.readline()
+        if line in (b'\r\n', b''):
+            break
+        key, _, value = line.decode().partition(':')
+        if key.lower() == 'content-length':
+            length = int(value)
+    return status, json.loads(await reader.readexactly(length))
+
+
+async def call(port, method, path, body=None):
+    reader, writer = await asyncio.open_connection('127.0.0.1', port)
+    try:
+        return await request(reader, writer, method, path, body)
+    finally:
+        writer.close()
+
+
+async def hammer(port, seconds, concurrency):
+    # Keep-alive clients asking for /status back to back
+    latencies = []
+    errors = 0
+    deadline = time.monotonic() + seconds
+
+    async def client():
+        nonlocal errors
+        reader, writer = await asyncio.open_connection('127.0.0.1', port)
+        while time.monotonic() < deadline:
+            started = time.perf_counter()
+            status, _ = await request(reader, writer, 'GET', '/status')
+            latencies.append(time.perf_counter() - started)
+            errors += status != 200
+        writer.close()
+
+    started = time.monotonic()
+    await asyncio.gather(*(client() for _ in range(concurrency)))
+    elapsed = time.monotonic() - started
+    latencies.sort()
+    return {
+        'requests': len(latencies),
+        'errors': errors,
+        'requests_per_second': len(latencies) / elapsed,
+        'latency_p50_ms': latencies[len(latencies) // 2] * 1000,
+        'latency_p99_ms': latencies[int(len(latencies) * 0.99)] * 1000,
+    }
+
+
+def encoder_figures(samples):
+    # Encoder speed and the longest wait between progress reports, as seen by the engine
+    times = [sample['time'] for sample in samples]
+    gaps = [b - a for a, b in zip(times, times[1:])]
+    return {
+        'samples': len(samples),
+        'speed_median': statistics.median(sample['speed'] for sample in samples) if samples else None,
+        'max_progress_gap_seconds': max(gaps) if gaps else None,
+    }
+
+
+async def run(sample, seconds, concurrency):
+    listener = StandInListener(free_port()).start()
+    engine = StreamEngine()
+    server = await ControlServer(engine, port=0).start()
+    samples = []
+    engine.subscribe(lambda event: event['type'] == 'metrics' and samples.append(event['sample']))
+    try:
+        status, body = await call(server.port, 'POST', '/streams/bench/start',
+                                  {'video': sample, 'keys': [listener.url]})
+        if status != 201 or body['state'] != 'live':
+            raise RuntimeError(f"Start through the API failed: {status} {body}")
+        await asyncio.sleep(seconds)
+        baseline = encoder_figures(samples)
+        samples.clear()
+        # The load comes from another process, like a real client would
+        client = await asyncio.create_subprocess_exec(
+            sys.executable, os.path.abspath(__file__), '--client', str(server.port), '--duration', str(seconds),
+            '--concurrency', str(concurrency), stdout=asyncio.subprocess.PIPE)
+        load = json.loads((await client.communicate())[0])
+        under_load = encoder_figures(samples)
+        status, body = await call(server.port, 'POST', '/streams/bench/stop')
+    finally:
+        await engine.stop_all()
+        await server.close()
+        listener.stop()
+    return {
+        'load': load,
+        'encoder_baseline': baseline,
+        'encoder_under_load': under_load,
+        'stopped_through_api': status == 200 and body['state'] == 'stopped',
+    }
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Hammer the control API while a stream is live.")
+    parser.add_argument('--duration', type=int, default=PHASE_SECONDS, help="Seconds per phase")
+    parser.add_argument('--concurrency', type=int, default=CONCURRENCY)
+    parser.add_argument('--client', type=int, metavar='PORT', help=argparse.SUPPRESS)
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    if args.client:
+        print(json.dumps(asyncio.run(hammer(args.client, args.duration, args.concurrency))))
+        return
+    workdir = tempfile.mkdtemp(prefix='bench-control-')
+    sample = make_sample(os.path.join(workdir, 'sample.mp4'), duration=args.duration * 3)
+    print(json.dumps(asyncio.run(run(sample, args.duration, args.concurrency)), indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,94 @@
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import tempfile
+import time
+
+import common  # noqa: F401  (puts the repo root on sys.path)
+from config import FFMPEG_PATH
+from keyframes import build, loaded, lookup
+from probe import probe_duration
+from standin import make_sample
+from stream_command import seek_args
+
+HOURS = 2.0
+SIZE = '640x360'
+RATE = 25
+GOP_SECONDS = 10          # long GOPs, as in camera and broadcast recordings, make accurate seeks expensive
+POSITIONS = (0.1, 0.3, 0.5, 0.7, 0.9)
+RUNS = 3
+
+# The airing's decode and encode up to its first frame, without the network
+FIRST_FRAME = ['-map', '0:v:0', '-c:v', 'libx264', '-preset', 'veryfast', '-frames:v', '1', '-f', 'null', '-']
+
+
+def first_frame_seconds(sample, seek):
+    command = [FFMPEG_PATH, '-hide_banner', '-loglevel', 'error', '-nostdin'] + seek + ['-i', sample] + FIRST_FRAME
+    started = time.perf_counter()
+    subprocess.run(command, check=True)
+    return time.perf_counter() - started
+
+
+def run(sample, runs):
+    duration = probe_duration(sample)
+    started = time.perf_counter()
+    times = build(sample)
+    build_seconds = time.perf_counter() - started
+    loaded.clear()
+    started = time.perf_counter()
+    lookup(sample)
+    load_ms = (time.perf_counter() - started) * 1000
+    # Halfway into a GOP: the worst case for the accurate seek is the whole GOP
+    offsets = [duration * position + GOP_SECONDS / 2 for position in POSITIONS]
+    first_frame_seconds(sample, [])   # page in ffmpeg and the head of the file
+    results = []
+    for offset in offsets:
+        accurate = []
+        indexed = []
+        for _ in range(runs):
+            accurate.append(first_frame_seconds(sample, ['-ss', f"{offset:.3f}"]))
+            started = time.perf_counter()
+            start, seek = seek_args(sample, offset)
+            lookup_us = (time.perf_counter() - started) * 1e6
+            indexed.append(first_frame_seconds(sample, seek))
+        results.append({
+            'offset_seconds': offset,
+            'keyframe_seconds': start,
+            'accurate_seek_median_seconds': statistics.median(accurate),
+            'indexed_median_seconds': statistics.median(indexed),
+            'plan_lookup_us': lookup_us,
+        })
+    return {
+        'duration_seconds': duration,
+        'keyframes': len(times),
+        'index_bytes': len(times) * times.itemsize,
+        'index_build_seconds': build_seconds,
+        'index_load_ms': load_ms,
+        'offsets': results,
+    }
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Start latency at offsets across a long file, "
+                                                 "accurate seek versus the keyframe index.")
+    parser.add_argument('--sample', help="An existing long video (default: generate one)")
+    parser.add_argument('--hours', type=float, default=HOURS, help="Length of the generated sample")
+    parser.add_argument('--size', default=SIZE, help="Resolution of the generated sample")
+    parser.add_argument('--runs', type=int, default=RUNS)
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    sample = args.sample
+    if not sample:
+        workdir = tempfile.mkdtemp(prefix='bench-keyframes-')
+        sample = make_sample(os.path.join(workdir, 'long.mp4'), duration=int(args.hours * 3600), size=args.size,
+                             rate=RATE, gop=GOP_SECONDS * RATE)
+    print(json.dumps(run(sample, args.runs), indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,64 @@
+import asyncio
+import json
+import os
+import subprocess
+import tempfile
+import time
+
+import common  # noqa: F401  (puts the repo root on sys.path)
+from config import FFPROBE_PATH
+from playlist import OUTPUT_FPS, Playlist
+from standin import StandInListener, free_port, make_sample
+from stream_engine import STOPPED, StreamEngine
+
+ITEMS = [(8, '1280x720'), (8, '640x360'), (8, '1920x1080')]
+
+
+def packet_gaps(path):
+    # Largest hole between consecutive video frames in what the stand-in received
+    command = [FFPROBE_PATH, '-v', 'error', '-select_streams', 'v:0', '-show_entries', 'packet=pts_time',
+               '-of', 'csv=p=0', path]
+    times = sorted(float(line) for line in subprocess.run(command, capture_output=True, text=True,
+                                                          check=True).stdout.split() if line != 'N/A')
+    gaps = [b - a for a, b in zip(times, times[1:])]
+    return max(gaps) - 1 / OUTPUT_FPS if gaps else None, times[-1] - times[0] if times else 0
+
+
+async def run(items, recording):
+    listener = StandInListener(free_port(), output_path=recording).start()
+    engine = StreamEngine()
+    try:
+        started = time.perf_counter()
+        await engine.start('playlist', None, [listener.url], playlist=Playlist(items, loop=False))
+        stream = engine.streams['playlist']
+        await stream.task
+        wall = time.perf_counter() - started
+        stalls = stream.plan.feeder.boundary_stalls
+        state = stream.state
+    finally:
+        time.sleep(1)
+        listener.stop()
+    return wall, stalls, state
+
+
+def main():
+    workdir = tempfile.mkdtemp(prefix='bench-playlist-')
+    items = [make_sample(os.path.join(workdir, f"item{i}.mp4"), duration=duration, size=size)
+             for i, (duration, size) in enumerate(ITEMS)]
+    recording = os.path.join(workdir, 'received.flv')
+    wall, stalls, state = asyncio.run(run(items, recording))
+    max_gap, received = packet_gaps(recording)
+    print(json.dumps({
+        'state': state,
+        'ok': state == STOPPED,
+        'items': len(items),
+        'source_seconds': sum(duration for duration, _ in ITEMS),
+        'received_seconds': received,
+        'wall_seconds': wall,
+        'boundary_stalls_ms': [stall * 1000 for stall in stalls],
+        'max_extra_frame_gap_ms': max_gap * 1000 if max_gap is not None else None,
+    }, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,35 @@
+import json
+import time
+
+import common  # noqa: F401  (puts the repo root on sys.path)
+from telemetry import MetricsRing, ProgressParser
+
+# One -progress block as ffmpeg writes it, every 0.5 s by default
+BLOCK = """frame=1500
+fps=25.00
+stream_0_0_q=23.0
+bitrate=2950.3kbits/s
+total_size=22118400
+out_time_us=60000000
+out_time_ms=60000000
+out_time=00:01:00.000000
+dup_frames=0
+drop_frames=0
+speed=1.00x
+progress=continue
+""".splitlines()
+
+
+def main(blocks=200000):
+    parser = ProgressParser(MetricsRing())
+    started = time.process_time()
+    for _ in range(blocks):
+        for line in BLOCK:
+            parser.feed(line)
+    per_block = (time.process_time() - started) / blocks
+    # Share of one core spent parsing a stream at two blocks per second
+    print(json.dumps({'us_per_block': per_block * 1e6, 'core_share_per_stream': per_block * 2}, indent=2))
+
+
+if __name__ == '__main__':
+    main()
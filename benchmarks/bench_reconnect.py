@@ -0,0 +1,53 @@
+import asyncio
+import json
+import os
+import tempfile
+import time
+
+import common  # noqa: F401  (puts the repo root on sys.path)
+from standin import StandInListener, free_port, make_sample
+from stream_engine import StreamEngine
+
+KILL_AFTER = 10
+OUTAGE = 3
+
+
+async def run(sample, workdir):
+    port = free_port()
+    listener = StandInListener(port, output_path=os.path.join(workdir, 'before.flv')).start()
+    engine = StreamEngine()
+    engine.subscribe(lambda event: event['type'] == 'log' and print(event['message'], flush=True))
+    try:
+        await engine.start('supervised', sample, [listener.url])
+        await asyncio.sleep(KILL_AFTER)
+        # The ingest goes away mid-stream and comes back a few seconds later
+        killed_at = time.monotonic()
+        listener.stop()
+        await asyncio.sleep(OUTAGE)
+        listener = StandInListener(port, output_path=os.path.join(workdir, 'after.flv')).start()
+        status = engine.status('supervised')
+        while not status['restarts'] and time.monotonic() - killed_at < 120:
+            await asyncio.sleep(0.5)
+            status = engine.status('supervised')
+        await engine.stop('supervised')
+    finally:
+        listener.stop()
+    return {
+        'state_after_user_stop': engine.status('supervised')['state'],
+        'recovered': bool(status['restarts']),
+        'time_to_recover_seconds': status['last_recovery_seconds'],
+        'outage_seconds': OUTAGE,
+        'resumed_at_offset': status['offset'],
+        'bytes_after_reconnect': os.path.getsize(os.path.join(workdir, 'after.flv'))
+        if os.path.exists(os.path.join(workdir, 'after.flv')) else 0,
+    }
+
+
+def main():
+    workdir = tempfile.mkdtemp(prefix='bench-reconnect-')
+    sample = make_sample(os.path.join(workdir, 'sample.mp4'), duration=60)
+    print(json.dumps(asyncio.run(run(sample, workdir)), indent=2))
+
+
+if __name__ == '__main__':
+    main()
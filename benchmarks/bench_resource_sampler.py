@@ -0,0 +1,77 @@
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+import common  # noqa: F401  (puts the repo root on sys.path)
+from resources import APP, FIELDS, ResourceSampler
+
+CHILDREN = 8
+SECONDS = 30
+INTERVAL = 0.5
+BUDGET_PERCENT = 1.0
+# A child that keeps a little CPU and disk busy, like a small encoder
+CHILD_CODE = '''
+import os, sys, time
+with open(sys.argv[1], 'wb') as f:
+    while True:
+        sum(range(20000))
+        f.write(os.urandom(4096))
+        time.sleep(0.01)
+'''
+
+
+def run(children, seconds, interval):
+    workdir = tempfile.mkdtemp(prefix='bench-resources-')
+    processes = [subprocess.Popen([sys.executable, '-c', CHILD_CODE, os.path.join(workdir, f"child{index}.bin")])
+                 for index in range(children)]
+    try:
+        sources = {f"child{index}": [process.pid] for index, process in enumerate(processes)}
+        sources[APP] = [os.getpid()]
+        sampler = ResourceSampler(lambda: sources, interval).start()
+        time.sleep(seconds)
+        sampler.stop()
+        sampler.thread.join()
+        overhead = sampler.overhead()
+        ticks = sampler.series['child0'].rings[0].total + 1
+        started = time.perf_counter()
+        for extension in ('csv', 'json'):
+            sampler.export(os.path.join(workdir, f"resources.{extension}"))
+        export_ms = (time.perf_counter() - started) * 1000
+        child = sampler.latest('child0')
+    finally:
+        for process in processes:
+            process.kill()
+            process.wait()
+    return {
+        'sources': len(sources),
+        'interval_seconds': interval,
+        'ticks': ticks,
+        'overhead_percent_of_one_core': overhead,
+        'per_tick_ms': sampler.cpu_used / ticks * 1000,
+        'budget_percent': BUDGET_PERCENT,
+        'export_ms': export_ms,
+        'latest_child_sample': {field: round(child[field], 2) for field in FIELDS if field != 'time'},
+    }
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Measure the resource sampler's own CPU use.")
+    parser.add_argument('--children', type=int, default=CHILDREN)
+    parser.add_argument('--seconds', type=float, default=SECONDS)
+    parser.add_argument('--interval', type=float, default=INTERVAL)
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    results = run(args.children, args.seconds, args.interval)
+    print(json.dumps(results, indent=2))
+    return 0 if results['overhead_percent_of_one_core'] < BUDGET_PERCENT else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
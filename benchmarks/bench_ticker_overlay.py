@@ -0,0 +1,45 @@
+import json
+import os
+import subprocess
+import tempfile
+import time
+
+import common  # puts the repo root on sys.path
+from config import FFMPEG_PATH
+from standin import make_sample
+from stream_command import TICKER_FILTER, VIDEO_ENCODE_ARGS
+from ticker_overlay import OVERLAY_FILTER, prepare_ticker
+
+WIDTH, HEIGHT = 1280, 720
+DURATION = 20
+
+
+def encode_fps(sample, ticker, filter_graph):
+    command = [FFMPEG_PATH, '-hide_banner', '-loglevel', 'error', '-nostats', '-progress', 'pipe:1',
+               '-i', sample, '-i', ticker, '-filter_complex', filter_graph] + VIDEO_ENCODE_ARGS + ['-an', '-f', 'null', '-']
+    started = time.perf_counter()
+    result = subprocess.run(command, capture_output=True, text=True, check=True)
+    elapsed = time.perf_counter() - started
+    frames = 0
+    for line in result.stdout.splitlines():
+        key, _, value = line.partition('=')
+        if key == 'frame' and value.isdigit():
+            frames = int(value)
+    return frames / elapsed
+
+
+def main(runs=3):
+    workdir = tempfile.mkdtemp(prefix='bench-ticker-')
+    sample = make_sample(os.path.join(workdir, 'sample.mp4'), duration=DURATION, size=f"{WIDTH}x{HEIGHT}")
+    ticker = common.make_ticker(os.path.join(workdir, 'ticker.png'))
+    prepared = prepare_ticker(ticker, WIDTH, HEIGHT)
+    results = {
+        'scale_in_graph_fps': max(encode_fps(sample, ticker, TICKER_FILTER) for _ in range(runs)),
+        'prerendered_fps': max(encode_fps(sample, prepared, OVERLAY_FILTER) for _ in range(runs)),
+    }
+    results['speedup'] = results['prerendered_fps'] / results['scale_in_graph_fps']
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == '__main__':
+    main()
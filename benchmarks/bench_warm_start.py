@@ -0,0 +1,72 @@
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import tempfile
+import time
+
+import common  # noqa: F401  (puts the repo root on sys.path)
+from standin import StandInListener, ThrottledProxy, free_port, make_sample
+from stream_engine import StreamEngine
+
+RUNS = 5
+TIMEOUT = 30
+
+
+async def time_to_first_packet(sample, warm):
+    # Seconds from the start call to media reaching the stand-in ingest
+    listener = StandInListener(free_port()).start()
+    proxy = ThrottledProxy(listener, free_port()).start()
+    engine = StreamEngine()
+    try:
+        if warm:
+            await engine.prewarm('bench', sample, [proxy.url])
+        released = time.time()
+        status = await engine.start('bench', sample, [proxy.url])
+        while proxy.first_media_time is None and time.time() < released + TIMEOUT:
+            await asyncio.sleep(0.005)
+    finally:
+        await engine.stop_all()
+        proxy.stop()
+        listener.stop()
+    if proxy.first_media_time is None:
+        raise RuntimeError(f"Nothing reached the stand-in: {status}")
+    return proxy.first_media_time - released, status['startup_seconds']
+
+
+async def run(workdir, runs):
+    results = {'cold': [], 'warm': []}
+    spawned = {'cold': [], 'warm': []}
+    for index in range(runs):
+        for mode in ('cold', 'warm'):
+            # A fresh file each time, so a cold start never finds it already probed
+            sample = make_sample(os.path.join(workdir, f"{mode}_{index}.mp4"), duration=20)
+            ttfp, startup = await time_to_first_packet(sample, mode == 'warm')
+            results[mode].append(ttfp)
+            spawned[mode].append(startup)
+    return {
+        'runs': runs,
+        'cold_ttfp_median_seconds': statistics.median(results['cold']),
+        'warm_ttfp_median_seconds': statistics.median(results['warm']),
+        'cold_start_call_median_seconds': statistics.median(spawned['cold']),
+        'warm_start_call_median_seconds': statistics.median(spawned['warm']),
+        'cold_ttfp_seconds': results['cold'],
+        'warm_ttfp_seconds': results['warm'],
+    }
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Time-to-first-packet for a cold start versus a warm standby.")
+    parser.add_argument('--runs', type=int, default=RUNS)
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    workdir = tempfile.mkdtemp(prefix='bench-warm-')
+    print(json.dumps(asyncio.run(run(workdir, args.runs)), indent=2))
+
+
+if __name__ == '__main__':
+    main()
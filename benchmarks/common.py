@@ -0,0 +1,16 @@
+import os
+import subprocess
+import sys
+
+# The benchmarks run as scripts from this directory; the modules they measure live one level up
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from config import FFMPEG_PATH
+
+
+def make_ticker(path):
+    # Wider than the output and semi-transparent, like a typical exported banner
+    command = [FFMPEG_PATH, '-hide_banner', '-loglevel', 'error', '-y', '-f', 'lavfi',
+               '-i', 'color=c=red@0.6:s=1920x96,format=rgba', '-frames:v', '1', path]
+    subprocess.run(command, check=True)
+    return path
@@ -0,0 +1,208 @@
+import argparse
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+import common  # puts the repo root on sys.path
+from abr import DEFAULT_LADDER
+from config import FFMPEG_PATH
+from playlist import item_args
+from standin import StandInListener, free_port, make_sample
+from stream_command import AUDIO_ENCODE_ARGS, TICKER_FILTER, VIDEO_ENCODE_ARGS, scale_filter, video_encode_args
+from ticker_overlay import OVERLAY_FILTER, prepare_ticker
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+RESULTS_DIR = os.path.join(ROOT, 'benchmarks', 'results')
+RESOLUTIONS = ['640x360', '1280x720', '1920x1080']
+DURATION = 10
+RUNS = 3
+THRESHOLD = 0.05
+
+
+# Each template returns the ffmpeg arguments between the global options and
+# the sink, plus the container the apps would write.
+def copy_template(sample, ticker, size):
+    return ['-i', sample, '-c', 'copy'], 'flv'
+
+
+def encode_template(sample, ticker, size):
+    return ['-i', sample] + VIDEO_ENCODE_ARGS + AUDIO_ENCODE_ARGS, 'flv'
+
+
+def overlay_template(sample, ticker, size):
+    width, height = map(int, size.split('x'))
+    prepared = prepare_ticker(ticker, width, height)
+    return ['-i', sample, '-i', prepared, '-filter_complex', OVERLAY_FILTER] + VIDEO_ENCODE_ARGS + AUDIO_ENCODE_ARGS, 'flv'
+
+
+def overlay_scaled_template(sample, ticker, size):
+    return ['-i', sample, '-i', ticker, '-filter_complex', TICKER_FILTER] + VIDEO_ENCODE_ARGS + AUDIO_ENCODE_ARGS, 'flv'
+
+
+def ladder_template(sample, ticker, size):
+    rung = DEFAULT_LADDER[1]
+    return ['-i', sample, '-vf', scale_filter(rung)] + video_encode_args(rung) + AUDIO_ENCODE_ARGS, 'flv'
+
+
+def playlist_item_template(sample, ticker, size):
+    args = item_args(sample, 0)
+    return args[:args.index('-f')], 'mpegts'
+
+
+TEMPLATES = {
+    'copy': copy_template,
+    'encode': encode_template,
+    'overlay': overlay_template,
+    'overlay_scaled': overlay_scaled_template,
+    'ladder_540p': ladder_template,
+    'playlist_item': playlist_item_template,
+}
+
+
+def run_encode(args, container, sink, workdir):
+    if sink == 'null':
+        output = ['-f', 'null', '-']
+        output_path = None
+    elif sink == 'rtmp':
+        listener = StandInListener(free_port()).start()
+        output = ['-f', 'flv', listener.url]
+        output_path = None
+    else:
+        output_path = os.path.join(workdir, f"out.{container}")
+        output = ['-f', container, '-y', output_path]
+    command = [FFMPEG_PATH, '-hide_banner', '-loglevel', 'error', '-nostdin', '-nostats',
+               '-progress', 'pipe:1'] + args + output
+    started = time.perf_counter()
+    process = subprocess.Popen(command, stdout=subprocess.PIPE, text=True)
+    frames = out_time = total_size = 0
+    for line in process.stdout:
+        key, _, value = line.strip().partition('=')
+        if key == 'frame' and value.isdigit():
+            frames = int(value)
+        elif key == 'out_time_us' and value.isdigit():
+            out_time = int(value) / 1e6
+        elif key == 'total_size' and value.isdigit():
+            total_size = int(value)
+    if hasattr(os, 'wait4'):
+        # wait4 reaps the child and hands back its own CPU time and peak RSS
+        _, status, usage = os.wait4(process.pid, 0)
+        process.returncode = os.waitstatus_to_exitcode(status)
+    else:
+        process.wait()
+        usage = None
+    elapsed = time.perf_counter() - started
+    if sink == 'rtmp':
+        listener.stop()
+    if process.returncode != 0:
+        raise RuntimeError(f"ffmpeg exited with {process.returncode}: {' '.join(command)}")
+    size = os.path.getsize(output_path) if output_path else total_size
+    return {
+        'fps': frames / elapsed,
+        'speed': out_time / elapsed if out_time else None,
+        'cpu_seconds': usage.ru_utime + usage.ru_stime if usage else None,
+        'peak_rss_mb': usage.ru_maxrss * (1 if sys.platform == 'darwin' else 1024) / 1e6 if usage else None,
+        'bitrate_kbps': size * 8 / 1000 / out_time if size and out_time else None,
+    }
+
+
+def ffmpeg_version():
+    try:
+        return subprocess.run([FFMPEG_PATH, '-version'], capture_output=True, text=True).stdout.splitlines()[0]
+    except (OSError, IndexError):
+        return None
+
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT, capture_output=True,
+                              text=True).stdout.strip() or None
+    except OSError:
+        return None
+
+
+def run_suite(templates, resolutions, duration, runs, sink):
+    workdir = tempfile.mkdtemp(prefix='encode-suite-')
+    ticker = common.make_ticker(os.path.join(workdir, 'ticker.png'))
+    results = []
+    for size in resolutions:
+        sample = make_sample(os.path.join(workdir, f"sample_{size}.mp4"), duration=duration, size=size, gop=50)
+        for name in templates:
+            args, container = TEMPLATES[name](sample, ticker, size)
+            measured = [run_encode(args, container, sink, workdir) for _ in range(runs)]
+            # Median of each figure across runs; CPU and RSS are properties of the work, fps of the box
+            row = {'template': name, 'resolution': size}
+            for key in measured[0]:
+                values = [m[key] for m in measured if m[key] is not None]
+                row[key] = statistics.median(values) if values else None
+            results.append(row)
+            print(f"{name:15} {size:>9}  {row['fps']:7.1f} fps  {row['speed'] or 0:5.2f}x  "
+                  f"{row['cpu_seconds'] or 0:6.2f} cpu s  {row['peak_rss_mb'] or 0:6.1f} MB  "
+                  f"{row['bitrate_kbps'] or 0:7.0f} kbit/s", flush=True)
+    return {
+        'meta': {
+            'commit': git_commit(),
+            'ffmpeg': ffmpeg_version(),
+            'host': platform.node(),
+            'cpus': os.cpu_count(),
+            'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'duration': duration,
+            'runs': runs,
+            'sink': sink,
+        },
+        'results': results,
+    }
+
+
+def compare(old_path, new_path, threshold=THRESHOLD):
+    # Slower fps or more CPU seconds by more than the threshold is a regression
+    with open(old_path) as f:
+        old = {(row['template'], row['resolution']): row for row in json.load(f)['results']}
+    with open(new_path) as f:
+        new = json.load(f)['results']
+    regressions = 0
+    for row in new:
+        before = old.get((row['template'], row['resolution']))
+        if not before:
+            continue
+        fps_change = row['fps'] / before['fps'] - 1 if before['fps'] else 0
+        cpu_change = row['cpu_seconds'] / before['cpu_seconds'] - 1 if before['cpu_seconds'] and row['cpu_seconds'] else 0
+        flag = fps_change < -threshold or cpu_change > threshold
+        regressions += flag
+        print(f"{row['template']:15} {row['resolution']:>9}  fps {fps_change * 100:+6.1f}%  "
+              f"cpu {cpu_change * 100:+6.1f}%{'  REGRESSION' if flag else ''}")
+    return regressions
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the ffmpeg command templates on synthetic sources.")
+    parser.add_argument('--templates', nargs='+', choices=sorted(TEMPLATES), default=list(TEMPLATES))
+    parser.add_argument('--resolutions', nargs='+', default=RESOLUTIONS)
+    parser.add_argument('--duration', type=int, default=DURATION, help="Seconds of test source per encode")
+    parser.add_argument('--runs', type=int, default=RUNS)
+    parser.add_argument('--sink', choices=['file', 'null', 'rtmp'], default='file')
+    parser.add_argument('--output', help="Results file (default benchmarks/results/<commit>.json)")
+    parser.add_argument('--compare', nargs=2, metavar=('OLD', 'NEW'), help="Compare two results files and exit")
+    parser.add_argument('--threshold', type=float, default=THRESHOLD)
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    if args.compare:
+        return 1 if compare(*args.compare, threshold=args.threshold) else 0
+    report = run_suite(args.templates, args.resolutions, args.duration, args.runs, args.sink)
+    output = args.output or os.path.join(RESULTS_DIR, f"{report['meta']['commit'] or 'results'}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, 'w') as f:
+        json.dump(report, f, indent=2)
+    print(f"Results written to {output}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,316 @@
+import argparse
+import asyncio
+import collections
+import json
+import math
+import os
+import subprocess
+import sys
+import time
+
+from config import DATA_DIR
+from procfs import available_cpus, cpu_seconds, system_cpu_times
+from stream_engine import FAILED, LIVE, STOPPED, EngineError, StreamEngine
+
+COST_PATH = os.path.join(DATA_DIR, 'stream_costs.json')
+SAMPLE_INTERVAL = 2
+WARMUP = 10             # seconds before a new stream's CPU use counts as its cost
+HEADROOM = 0.85         # plan to fill at most this share of the cores
+REALTIME_SPEED = 0.98   # a stream below this is already starved
+COST_SMOOTHING = 0.2
+REPORT_INTERVAL = 10
+
+QUEUE = 'queue'
+REFUSE = 'refuse'
+
+
+class AdmissionError(EngineError):
+    pass
+
+
+class Channel:
+    def __init__(self, name, video_path, urls, options, profile):
+        self.name = name
+        self.video_path = video_path
+        self.urls = urls
+        self.options = options
+        self.profile = profile
+        self.threads = None
+        self.cpus = None
+        self.admitted_at = None
+        self.cores = None       # measured cores per real-time second, smoothed
+        self.last_cpu = {}
+        self.last_sample = None
+
+    @property
+    def warming_up(self):
+        return self.cores is None
+
+
+class ChannelManager:
+    # Admits streams onto the engine only while the measured cost of what is
+    # already running leaves room for one more at real time. Costs are
+    # measured from /proc per stream (CPU seconds per second, scaled by
+    # encoder speed) and remembered per source profile, so the next stream
+    # of the same kind is admitted on numbers rather than a guess. A profile
+    # nobody has measured yet is charged as the dearest one measured so far
+    # (the whole host before anything has been) until its own cost is known.
+    def __init__(self, engine, policy=QUEUE, headroom=HEADROOM, pin=False, cost_path=COST_PATH, log=None):
+        self.engine = engine
+        self.policy = policy
+        self.pin = pin
+        self.cpus = available_cpus()
+        self.capacity = len(self.cpus) * headroom
+        self.cost_path = cost_path
+        self.costs = self.load_costs()
+        self.log = log or (lambda message: None)
+        self.channels = {}
+        self.queue = collections.deque()
+        self.sampler = None
+        self.system_busy = 0.0
+        self.last_system = system_cpu_times()
+        engine.subscribe(self.on_event)
+
+    def load_costs(self):
+        try:
+            with open(self.cost_path) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def save_costs(self):
+        os.makedirs(os.path.dirname(self.cost_path), exist_ok=True)
+        tmp_path = f"{self.cost_path}.tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump(self.costs, f, indent=1)
+        os.replace(tmp_path, self.cost_path)
+
+    def profile_for(self, video_path, options):
+        # Streams with the same profile cost about the same to run
+        from probe import probe_cache
+        from stream_command import codec_args
+
+        if options.get('playlist'):
+            from playlist import OUTPUT_SIZE
+            return f"playlist:{OUTPUT_SIZE[0]}x{OUTPUT_SIZE[1]}"
+        overlay = bool(options.get('ticker_path') or options.get('text_ticker'))
+        args, _ = codec_args(video_path, overlay=overlay)
+        try:
+            video = probe_cache.get(video_path)['video']
+            size = f"{video['width']}x{video['height']}"
+        except (OSError, ValueError, KeyError, TypeError, subprocess.CalledProcessError):
+            size = 'unknown'
+        kind = 'copy' if args == ['-c', 'copy'] else 'x264' + (':overlay' if overlay else '')
+        return f"{kind}:{size}"
+
+    def unmeasured_cost(self):
+        return max(self.costs.values(), default=self.capacity)
+
+    def planned_cost(self, channel):
+        if channel.cores is not None:
+            return channel.cores
+        cost = self.costs.get(channel.profile)
+        return cost if cost is not None else self.unmeasured_cost()
+
+    def used_cores(self):
+        return sum(self.planned_cost(channel) for channel in self.channels.values())
+
+    def admit(self, channel):
+        for other in self.channels.values():
+            sample = other.last_sample
+            if not other.warming_up and sample and 0 < sample['speed'] < REALTIME_SPEED:
+                return False, f"{other.name} is already below real time ({sample['speed']:.2f}x)"
+        estimate = self.costs.get(channel.profile)
+        measured = estimate is not None
+        if not measured:
+            waiting = [other.name for other in self.channels.values() if other.warming_up]
+            if waiting:
+                return False, f"{channel.profile} not measured yet, waiting for {', '.join(waiting)} to settle"
+            estimate = self.unmeasured_cost()
+        if self.used_cores() + estimate > self.capacity:
+            return False, (f"needs {estimate:.1f} cores{'' if measured else ' until measured'}, "
+                           f"{max(self.capacity - self.used_cores(), 0):.1f} of {self.capacity:.1f} free")
+        return True, None
+
+    def assign_cpus(self, channel):
+        # Thread budget from the measured cost; unmeasured streams get what's free
+        free = max(self.capacity - self.used_cores(), 1)
+        estimate = self.costs.get(channel.profile)
+        channel.threads = max(1, min(math.ceil(estimate) if estimate else int(free), len(self.cpus)))
+        if self.pin:
+            taken = {cpu for other in self.channels.values() for cpu in (other.cpus or ())}
+            available = [cpu for cpu in self.cpus if cpu not in taken]
+            if len(available) >= channel.threads:
+                channel.cpus = available[:channel.threads]
+
+    async def start(self, name, video_path, urls, **options):
+        if name in self.channels or any(channel.name == name for channel in self.queue):
+            raise EngineError(f"Channel {name} already exists")
+        loop = asyncio.get_running_loop()
+        profile = await loop.run_in_executor(None, self.profile_for, video_path, options)
+        channel = Channel(name, video_path, urls, options, profile)
+        ok, reason = self.admit(channel)
+        if ok:
+            return await self.launch(channel)
+        if self.policy == REFUSE:
+            raise AdmissionError(f"Not starting {name}: {reason}")
+        self.queue.append(channel)
+        self.log(f"Queued {name}: {reason}")
+        return {'name': name, 'state': 'queued', 'reason': reason}
+
+    async def prewarm(self, name, video_path, urls, **options):
+        # Warms with the thread budget the start would get, so the plan still fits then
+        loop = asyncio.get_running_loop()
+        profile = await loop.run_in_executor(None, self.profile_for, video_path, options)
+        channel = Channel(name, video_path, urls, options, profile)
+        self.assign_cpus(channel)
+        return await self.engine.prewarm(name, video_path, urls, threads=channel.threads, **options)
+
+    async def launch(self, channel):
+        self.assign_cpus(channel)
+        channel.admitted_at = time.monotonic()
+        self.channels[channel.name] = channel
+        cost = self.costs.get(channel.profile)
+        self.log(f"Starting {channel.name} ({channel.profile}, "
+                 f"{f'{cost:.1f} cores measured' if cost else 'cost not measured yet'}, "
+                 f"{channel.threads} threads{f', cpus {channel.cpus}' if channel.cpus else ''})")
+        if not self.sampler:
+            self.sampler = asyncio.ensure_future(self.sample_loop())
+        return await self.engine.start(channel.name, channel.video_path, channel.urls, threads=channel.threads,
+                                       affinity=channel.cpus, **channel.options)
+
+    async def stop(self, name):
+        for channel in list(self.queue):
+            if channel.name == name:
+                self.queue.remove(channel)
+                return {'name': name, 'state': 'stopped'}
+        return await self.engine.stop(name)
+
+    def on_event(self, event):
+        if event['type'] == 'state' and event['state'] in (STOPPED, FAILED) and event['stream'] in self.channels:
+            del self.channels[event['stream']]
+            asyncio.ensure_future(self.admit_queued())
+
+    async def admit_queued(self):
+        while self.queue:
+            ok, _ = self.admit(self.queue[0])
+            if not ok:
+                return
+            await self.launch(self.queue.popleft())
+
+    async def sample_loop(self):
+        last = time.monotonic()
+        while True:
+            await asyncio.sleep(SAMPLE_INTERVAL)
+            now = time.monotonic()
+            self.sample(now - last)
+            last = now
+            await self.admit_queued()
+
+    def sample(self, elapsed):
+        system = system_cpu_times()
+        if system and self.last_system and system[1] > self.last_system[1]:
+            self.system_busy = (system[0] - self.last_system[0]) / (system[1] - self.last_system[1])
+        self.last_system = system
+        changed = False
+        for channel in list(self.channels.values()):
+            stream = self.engine.streams.get(channel.name)
+            if not stream or stream.state != LIVE:
+                continue
+            used = 0.0
+            current = {}
+            for pid in stream.pids():
+                seconds = cpu_seconds(pid)
+                if seconds is not None:
+                    current[pid] = seconds
+                    used += seconds - channel.last_cpu.get(pid, 0.0)
+            first = not channel.last_cpu
+            channel.last_cpu = current
+            channel.last_sample = stream.metrics.latest()
+            if first or not current or time.monotonic() - channel.admitted_at < WARMUP:
+                continue
+            speed = channel.last_sample['speed'] if channel.last_sample else 1.0
+            # What it takes to run this stream at 1.0x
+            cost = used / elapsed / max(min(speed, 1.0), 0.1)
+            channel.cores = cost if channel.cores is None else channel.cores + COST_SMOOTHING * (cost - channel.cores)
+            previous = self.costs.get(channel.profile)
+            self.costs[channel.profile] = (channel.cores if previous is None else
+                                           previous + COST_SMOOTHING * (channel.cores - previous))
+            changed = True
+        if changed:
+            try:
+                self.save_costs()
+            except OSError:
+                pass
+
+    def utilization(self):
+        return {
+            'cores': len(self.cpus),
+            'capacity_cores': self.capacity,
+            'planned_cores': self.used_cores(),
+            'system_busy': self.system_busy,
+            'channels': {
+                name: {
+                    'profile': channel.profile,
+                    'cores': channel.cores,
+                    'threads': channel.threads,
+                    'cpus': channel.cpus,
+                    'speed': channel.last_sample['speed'] if channel.last_sample else None,
+                } for name, channel in self.channels.items()
+            },
+            'queued': [channel.name for channel in self.queue],
+        }
+
+
+def describe(utilization):
+    channels = ', '.join(f"{name} {info['speed'] or 0:.2f}x/{info['cores'] or 0:.1f}c"
+                         for name, info in utilization['channels'].items())
+    return (f"CPU {utilization['system_busy'] * 100:.0f}% of {utilization['cores']} cores | planned "
+            f"{utilization['planned_cores']:.1f}/{utilization['capacity_cores']:.1f} | {channels or 'no channels'}"
+            + (f" | queued: {', '.join(utilization['queued'])}" if utilization['queued'] else ''))
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Run several channels on one host within its CPU budget.")
+    parser.add_argument('config', help='JSON list of {"name", "video" or "playlist", "keys"} channels')
+    parser.add_argument('--refuse', action='store_true', help="Refuse channels that don't fit instead of queueing")
+    parser.add_argument('--pin', action='store_true', help="Pin each channel's encoder to its own cores")
+    return parser.parse_args(argv)
+
+
+async def run(args):
+    from playlist import Playlist
+    from stream_command import parse_destinations
+
+    with open(args.config) as f:
+        config = json.load(f)
+    engine = StreamEngine()
+    manager = ChannelManager(engine, policy=REFUSE if args.refuse else QUEUE, pin=args.pin,
+                             log=lambda message: print(message, flush=True))
+    engine.subscribe(lambda event: event['type'] == 'state' and print(
+        f"[{event['stream']}] {event['state']}" + (f": {event['error']}" if event.get('error') else ''), flush=True))
+    for entry in config:
+        urls = [url for key in entry['keys'] for url in parse_destinations(key)]
+        options = {'playlist': Playlist(entry['playlist'])} if entry.get('playlist') else {}
+        try:
+            await manager.start(entry['name'], entry.get('video'), urls, **options)
+        except AdmissionError as e:
+            print(e, flush=True)
+    try:
+        while engine.has_live_stream() or manager.queue:
+            await asyncio.sleep(REPORT_INTERVAL)
+            print(describe(manager.utilization()), flush=True)
+    finally:
+        await engine.stop_all()
+    return 0
+
+
+def main(argv=None):
+    try:
+        return asyncio.run(run(parse_args(argv)))
+    except KeyboardInterrupt:
+        return 130
+
+
+if __name__ == '__main__':
+    sys.exit(main())
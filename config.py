@@ -0,0 +1,10 @@
+import os
+
+ffmpeg_default = r"C:/ffmpeg/bin/ffmpeg.exe"  # Replace with the correct path
+
+FFMPEG_PATH = os.environ.get('FFMPEG_PATH', ffmpeg_default)
+FFPROBE_PATH = os.environ.get('FFPROBE_PATH', os.path.join(os.path.dirname(FFMPEG_PATH), 'ffprobe' + os.path.splitext(FFMPEG_PATH)[1]))
+
+YOUTUBE_RTMP_URL = "rtmp://a.rtmp.youtube.com/live2/"
+
+DATA_DIR = os.environ.get('AUTOMATED_OBS_HOME', os.path.join(os.path.expanduser('~'), '.automated_obs'))
@@ -0,0 +1,328 @@
+import argparse
+import asyncio
+import json
+import signal
+import sys
+import time
+from urllib.parse import parse_qs, urlparse
+
+from stream_engine import EngineError, StreamEngine
+
+HOST = '127.0.0.1'
+PORT = 8765
+MAX_BODY = 64 * 1024
+IDLE_TIMEOUT = 30        # close keep-alive connections that go quiet
+FEED_QUEUE = 256         # events held per feed client; a slow client loses the oldest
+FEED_HEARTBEAT = 15
+DEFAULT_FEED_TYPES = ('state', 'metrics', 'job')
+
+REASONS = {200: 'OK', 201: 'Created', 400: 'Bad Request', 404: 'Not Found', 405: 'Method Not Allowed',
+           409: 'Conflict', 413: 'Payload Too Large', 500: 'Internal Server Error'}
+
+
+class HttpError(Exception):
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+
+async def read_request(reader):
+    # (method, path, query, headers, body), or None once the client is gone
+    try:
+        line = await asyncio.wait_for(reader.readline(), IDLE_TIMEOUT)
+    except asyncio.TimeoutError:
+        return None
+    if not line.strip():
+        return None
+    try:
+        method, target, _ = line.decode('latin-1').split(' ', 2)
+    except ValueError:
+        raise HttpError(400, "Malformed request line")
+    headers = {}
+    while True:
+        line = await reader.readline()
+        if line in (b'\r\n', b'\n', b''):
+            break
+        key, _, value = line.decode('latin-1').partition(':')
+        headers[key.strip().lower()] = value.strip()
+    length = int(headers.get('content-length') or 0)
+    if length > MAX_BODY:
+        raise HttpError(413, f"Request body over {MAX_BODY} bytes")
+    body = await reader.readexactly(length) if length else b''
+    url = urlparse(target)
+    return method.upper(), url.path.rstrip('/') or '/', parse_qs(url.query), headers, body
+
+
+def parse_start_time(value):
+    # Seconds since the epoch, or local "YYYY-MM-DD HH:MM" like the GUI's picker
+    if isinstance(value, (int, float)):
+        return float(value)
+    return time.mktime(time.strptime(value, '%Y-%m-%d %H:%M'))
+
+
+def destinations(body):
+    from stream_command import parse_destinations
+
+    keys = body.get('keys') or []
+    if isinstance(keys, str):
+        keys = [keys]
+    urls = [url for key in keys for url in parse_destinations(key)]
+    if not urls:
+        raise ValueError("'keys' must hold at least one stream key or URL")
+    return urls
+
+
+class ControlServer:
+    # Local HTTP control for the engine, served from the engine's own loop.
+    # Handlers only read in-memory state or submit the same engine/scheduler
+    # calls the GUI buttons make, so a flood of status requests costs the
+    # encoders nothing but a few milliseconds of loop time: ffmpeg runs in its
+    # own processes and progress lines simply wait their turn.
+    def __init__(self, engine, scheduler=None, manager=None, host=HOST, port=PORT, socket_path=None):
+        self.engine = engine
+        self.scheduler = scheduler
+        self.manager = manager
+        self.host = host
+        self.port = port
+        self.socket_path = socket_path
+        self.server = None
+        self.connections = set()
+        self.closing = False
+        self.requests = 0
+
+    async def start(self):
+        if self.socket_path:
+            self.server = await asyncio.start_unix_server(self.handle, self.socket_path)
+        else:
+            self.server = await asyncio.start_server(self.handle, self.host, self.port)
+            self.port = self.server.sockets[0].getsockname()[1]
+        return self
+
+    async def close(self):
+        self.closing = True
+        if self.server:
+            self.server.close()
+            # Keep-alive and feed connections would otherwise outlive the server
+            for task in list(self.connections):
+                task.cancel()
+            await asyncio.gather(*self.connections, return_exceptions=True)
+            await self.server.wait_closed()
+
+    @property
+    def address(self):
+        return self.socket_path or f"http://{self.host}:{self.port}"
+
+    async def handle(self, reader, writer):
+        task = asyncio.current_task()
+        self.connections.add(task)
+        try:
+            while not self.closing:
+                try:
+                    request = await read_request(reader)
+                except HttpError as e:
+                    await self.respond(writer, e.status, {'error': str(e)}, keep_alive=False)
+                    return
+                if request is None:
+                    return
+                method, path, query, headers, body = request
+                self.requests += 1
+                if method == 'GET' and path == '/events':
+                    await self.feed(writer, query)
+                    return
+                try:
+                    status, payload = await self.dispatch(method, path, body)
+                except HttpError as e:
+                    status, payload = e.status, {'error': str(e)}
+                except KeyError as e:
+                    status, payload = 400, {'error': f"Missing {e.args[0]}"}
+                except EngineError as e:
+                    status, payload = 409, {'error': str(e)}
+                except (ValueError, TypeError) as e:
+                    status, payload = 400, {'error': str(e)}
+                except Exception as e:
+                    status, payload = 500, {'error': f"{type(e).__name__}: {e}"}
+                keep_alive = headers.get('connection', '').lower() != 'close'
+                await self.respond(writer, status, payload, keep_alive)
+                if not keep_alive:
+                    return
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        except asyncio.CancelledError:
+            # close(); ending quietly keeps asyncio from logging the connection as failed
+            pass
+        finally:
+            self.connections.discard(task)
+            writer.close()
+
+    async def respond(self, writer, status, payload, keep_alive=True):
+        body = json.dumps(payload).encode()
+        writer.write(f"HTTP/1.1 {status} {REASONS.get(status, '')}\r\nContent-Type: application/json\r\n"
+                     f"Content-Length: {len(body)}\r\nConnection: {'keep-alive' if keep_alive else 'close'}\r\n"
+                     f"\r\n".encode() + body)
+        await writer.drain()
+
+    async def dispatch(self, method, path, body):
+        parts = path.strip('/').split('/')
+        data = json.loads(body) if body else {}
+        if not isinstance(data, dict):
+            raise ValueError("Request body must be a JSON object")
+        if parts == ['status'] and method == 'GET':
+            return 200, self.status()
+        if parts[0] == 'streams':
+            if len(parts) == 1 and method == 'GET':
+                return 200, self.engine.status()
+            if len(parts) == 2 and method == 'GET':
+                if parts[1] not in self.engine.streams:
+                    raise HttpError(404, f"Unknown stream {parts[1]}")
+                return 200, self.engine.status(parts[1])
+            if len(parts) == 3 and method == 'POST' and parts[2] == 'start':
+                return 201, await self.start_stream(parts[1], data)
+            if len(parts) == 3 and method == 'POST' and parts[2] == 'stop':
+                return 200, await (self.manager or self.engine).stop(parts[1])
+        if parts[0] == 'schedule' and self.scheduler:
+            if len(parts) == 1 and method == 'GET':
+                return 200, [job.to_dict() for job in self.scheduler.upcoming()]
+            if len(parts) == 1 and method == 'POST':
+                return 201, await self.schedule(data)
+            if len(parts) == 2 and method == 'DELETE':
+                if parts[1] not in self.scheduler.jobs:
+                    raise HttpError(404, f"Unknown job {parts[1]}")
+                job = await asyncio.get_running_loop().run_in_executor(None, self.scheduler.cancel, parts[1])
+                return 200, job.to_dict()
+        raise HttpError(404, f"No route for {method} {path}")
+
+    def status(self):
+        status = {'time': time.time(), 'streams': self.engine.status()}
+        if self.scheduler:
+            status['scheduled'] = [job.to_dict() for job in self.scheduler.upcoming()]
+        if self.manager:
+            status['channels'] = self.manager.utilization()
+        return status
+
+    async def start_stream(self, name, data):
+        # Same options as the apps' start buttons and the CLI
+        urls = destinations(data)
+        options = {'ticker_path': data.get('ticker'), 'adaptive': bool(data.get('adaptive')),
+                   'start_offset': float(data.get('start_offset') or 0),
+                   'end_at': float(data['end_at']) if data.get('end_at') else None}
+        video_path = data.get('video')
+        if data.get('playlist'):
+            from playlist import Playlist
+
+            options = {'playlist': Playlist(data['playlist'], loop=bool(data.get('loop')))}
+        elif not video_path:
+            raise ValueError("'video' or 'playlist' is required")
+        return await (self.manager or self.engine).start(name, video_path, urls, **options)
+
+    async def schedule(self, data):
+        from scheduler import JOIN, ScheduledJob
+
+        if not data.get('video'):
+            raise ValueError("'video' is required")
+        job = ScheduledJob(parse_start_time(data['start_at']), data['video'], destinations(data),
+                           ticker_path=data.get('ticker'), ticker_text=data.get('ticker_text', ''),
+                           name=data.get('name', 'main'), catch_up=data.get('catch_up', JOIN),
+                           in_point=float(data.get('in_point') or 0),
+                           out_point=float(data['out_point']) if data.get('out_point') else None)
+        # add() saves the schedule file; keep the disk write off the loop
+        await asyncio.get_running_loop().run_in_executor(None, self.scheduler.add, job)
+        return job.to_dict()
+
+    async def feed(self, writer, query):
+        # Server-sent events: one "data: {json}" block per engine/scheduler event
+        types = set(query.get('types', [','.join(DEFAULT_FEED_TYPES)])[0].split(','))
+        name = query.get('stream', [None])[0]
+        loop = asyncio.get_running_loop()
+        queue = asyncio.Queue(FEED_QUEUE)
+
+        def put(event):
+            if queue.full():
+                queue.get_nowait()
+            queue.put_nowait(event)
+
+        def on_event(event):
+            # Scheduler events come from its own thread; hop onto the loop
+            if event['type'] in types and (name is None or event['stream'] == name):
+                loop.call_soon_threadsafe(put, event)
+
+        sources = [source for source in (self.engine, self.scheduler) if source]
+        for source in sources:
+            source.subscribe(on_event)
+        getter = None
+        try:
+            writer.write(b"HTTP/1.1 200 OK\r\nContent-Type: text/event-stream\r\nCache-Control: no-cache\r\n"
+                         b"Connection: close\r\n\r\n")
+            await writer.drain()
+            # asyncio.wait rather than wait_for: wait_for can swallow close()'s
+            # cancel when an event lands at the same moment
+            while not self.closing:
+                getter = getter or asyncio.ensure_future(queue.get())
+                done, _ = await asyncio.wait({getter}, timeout=FEED_HEARTBEAT)
+                if done:
+                    writer.write(f"data: {json.dumps(getter.result(), default=str)}\n\n".encode())
+                    getter = None
+                else:
+                    writer.write(b": keep-alive\n\n")
+                await writer.drain()
+        finally:
+            if getter:
+                getter.cancel()
+            for source in sources:
+                source.unsubscribe(on_event)
+
+
+def text_ticker(text):
+    # Scheduled slots with ticker text get a live strip, if Pillow is around
+    from text_ticker import TextTicker
+
+    try:
+        ticker = TextTicker()
+    except RuntimeError:
+        return None
+    ticker.set_text(text)
+    return ticker
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Serve a local HTTP API to start, stop and schedule streams.")
+    parser.add_argument('--host', default=HOST, help="Address to listen on (keep it local)")
+    parser.add_argument('--port', type=int, default=PORT)
+    parser.add_argument('--socket', help="Listen on this Unix socket instead of TCP")
+    return parser.parse_args(argv)
+
+
+async def run(args):
+    from channels import ChannelManager
+    from scheduler import Scheduler
+
+    engine = StreamEngine()
+    engine.loop = asyncio.get_running_loop()
+    # Every start, API or scheduled, is admitted against the host's CPU budget
+    manager = ChannelManager(engine, log=lambda message: print(message, flush=True))
+    scheduler = Scheduler(engine, ticker_factory=text_ticker, manager=manager).load().start()
+    server = await ControlServer(engine, scheduler, manager, args.host, args.port, args.socket).start()
+    print(f"Control API on {server.address}", flush=True)
+    stopped = asyncio.Event()
+    try:
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            engine.loop.add_signal_handler(sig, stopped.set)
+    except NotImplementedError:
+        pass
+    try:
+        await stopped.wait()
+    finally:
+        scheduler.stop()
+        await server.close()
+        await engine.stop_all()
+    return 0
+
+
+def main(argv=None):
+    try:
+        return asyncio.run(run(parse_args(argv)))
+    except KeyboardInterrupt:
+        return 130
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,190 @@
+import argparse
+import functools
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+
+from config import DATA_DIR, FFMPEG_PATH
+
+PROFILE_PATH = os.path.join(DATA_DIR, 'encoder_profiles.json')
+PRESETS = ['ultrafast', 'superfast', 'veryfast', 'faster', 'fast', 'medium', 'slow']
+DEFAULT_PRESET = 'veryfast'
+SAFETY_MARGIN = 1.3   # trial speed needed to count as real time with room to spare
+TRIAL_SECONDS = 8
+TRIAL_FPS = 25
+
+
+def cpu_model():
+    try:
+        with open('/proc/cpuinfo') as f:
+            for line in f:
+                if line.startswith('model name'):
+                    return line.split(':', 1)[1].strip()
+    except OSError:
+        pass
+    return platform.processor() or platform.machine()
+
+
+@functools.lru_cache(maxsize=None)
+def fingerprint(ffmpeg_path=FFMPEG_PATH):
+    # A profile is only valid on the hardware and ffmpeg build it was measured with
+    try:
+        version = subprocess.run([ffmpeg_path, '-version'], capture_output=True, text=True).stdout.split('\n')[0]
+    except OSError:
+        version = None
+    return {'host': platform.node(), 'cpu': cpu_model(), 'cpus': os.cpu_count(), 'ffmpeg': version}
+
+
+def profile_key(height):
+    return f"{platform.node()}|{height}p"
+
+
+loaded = {}   # path: ((mtime_ns, size), profiles), parsed once per change of the file
+
+
+def load_profiles(path=PROFILE_PATH):
+    # Every stream and playlist item plan asks; the file is only re-read after
+    # a calibration (here or in another process) rewrites it
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return {}
+    version = (stat.st_mtime_ns, stat.st_size)
+    cached = loaded.get(path)
+    if cached and cached[0] == version:
+        return cached[1]
+    try:
+        with open(path) as f:
+            profiles = json.load(f)
+    except (OSError, ValueError):
+        profiles = {}
+    loaded[path] = (version, profiles)
+    return profiles
+
+
+def save_profile(height, profile, path=PROFILE_PATH):
+    profiles = dict(load_profiles(path))
+    profiles[profile_key(height)] = profile
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'w') as f:
+        json.dump(profiles, f, indent=1)
+    os.replace(tmp_path, path)
+
+
+def cached_profile(profiles, height):
+    profile = profiles.get(profile_key(height))
+    if profile and profile.get('fingerprint') == fingerprint():
+        return profile
+    return None
+
+
+def tuned_profile(height, path=PROFILE_PATH):
+    # The calibrated profile for the nearest calibrated height at or above this
+    # one; an unknown height gets the largest, which is the safe side
+    profiles = load_profiles(path)
+    heights = sorted(int(key.rsplit('|', 1)[1][:-1]) for key in profiles if key.startswith(f"{platform.node()}|"))
+    for candidate in (height and [h for h in heights if h >= height]) or heights[-1:]:
+        profile = cached_profile(profiles, candidate)
+        if profile:
+            return profile
+    return None
+
+
+def trial(width, height, preset, threads, ffmpeg_path=FFMPEG_PATH, seconds=TRIAL_SECONDS, fps=TRIAL_FPS):
+    # Encode a generated pattern at the output size and return the speed factor
+    from stream_command import VIDEO_ENCODE_ARGS, with_option
+
+    args = with_option(VIDEO_ENCODE_ARGS, '-preset', preset)
+    if threads:
+        args = with_option(args, '-threads', str(threads))
+    command = [ffmpeg_path, '-hide_banner', '-loglevel', 'error', '-nostdin', '-nostats', '-progress', 'pipe:1',
+               '-f', 'lavfi', '-i', f"testsrc2=size={width}x{height}:rate={fps}:duration={seconds}"]
+    command += args + ['-f', 'null', '-']
+    started = time.perf_counter()
+    result = subprocess.run(command, capture_output=True, text=True, check=True)
+    elapsed = time.perf_counter() - started
+    out_time = 0.0
+    for line in result.stdout.splitlines():
+        key, _, value = line.partition('=')
+        if key == 'out_time_us' and value.isdigit():
+            out_time = int(value) / 1e6
+    return out_time / elapsed if elapsed else 0.0
+
+
+def thread_options():
+    cpus = os.cpu_count() or 1
+    return sorted({max(cpus // 4, 1), max(cpus // 2, 1), cpus})
+
+
+def calibrate(width, height, margin=SAFETY_MARGIN, ffmpeg_path=FFMPEG_PATH, log=print):
+    # Walk from the default preset towards slower ones while some thread count
+    # still holds the margin, falling back to faster presets if even the
+    # default can't. Fewer threads win a tie: they leave room for other channels.
+    def best_threads(preset):
+        for threads in thread_options():
+            speed = trial(width, height, preset, threads, ffmpeg_path)
+            log(f"{preset:10} {threads:2} threads: {speed:.2f}x")
+            if speed >= margin:
+                return threads, speed
+        return None, None
+
+    start = PRESETS.index(DEFAULT_PRESET)
+    chosen = None
+    threads, speed = best_threads(PRESETS[start])
+    if threads:
+        chosen = (PRESETS[start], threads, speed)
+        for preset in PRESETS[start + 1:]:
+            threads, speed = best_threads(preset)
+            if not threads:
+                break
+            chosen = (preset, threads, speed)
+    else:
+        for preset in reversed(PRESETS[:start]):
+            threads, speed = best_threads(preset)
+            if threads:
+                chosen = (preset, threads, speed)
+                break
+    if not chosen:
+        chosen = (PRESETS[0], os.cpu_count() or 1, speed or 0.0)
+        log(f"Even {PRESETS[0]} can't hold {margin}x at {width}x{height}; this host is too slow for that size")
+    preset, threads, speed = chosen
+    profile = {'preset': preset, 'threads': threads, 'speed': speed, 'margin': margin, 'size': f"{width}x{height}",
+               'fingerprint': fingerprint(ffmpeg_path), 'calibrated': time.strftime('%Y-%m-%dT%H:%M:%S')}
+    save_profile(height, profile)
+    return profile
+
+
+def apply_profile(video_args, height):
+    # Swap in the host's calibrated preset and threads, if it has been calibrated
+    from stream_command import with_option
+
+    profile = tuned_profile(height)
+    if not profile:
+        return video_args
+    args = with_option(video_args, '-preset', profile['preset'])
+    return with_option(args, '-threads', str(profile['threads']))
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Pick the slowest x264 preset this host can run in real time.")
+    parser.add_argument('--resolution', action='append', default=None,
+                        help="Output size to calibrate, e.g. 1280x720; repeat for several (default 1280x720)")
+    parser.add_argument('--margin', type=float, default=SAFETY_MARGIN, help="Required speed factor")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    for size in args.resolution or ['1280x720']:
+        width, height = map(int, size.lower().split('x'))
+        profile = calibrate(width, height, args.margin)
+        print(f"{size}: preset {profile['preset']}, {profile['threads']} threads ({profile['speed']:.2f}x)")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,96 @@
+import hashlib
+import json
+import os
+import threading
+
+from config import DATA_DIR
+
+
+def file_key(path):
+    stat = os.stat(path)
+    return f"{os.path.abspath(path)}|{stat.st_size}|{stat.st_mtime_ns}"
+
+
+def file_identity(path):
+    # The same file for as long as it isn't rewritten, wherever it is moved
+    # on the filesystem; costs a stat, not a read
+    stat = os.stat(path)
+    return f"{stat.st_dev}|{stat.st_ino}|{stat.st_size}|{stat.st_mtime_ns}"
+
+
+class FileKeyedCache:
+    # Results of an expensive per-file computation, persisted as JSON and
+    # keyed by path+size+mtime so an edited file is recomputed.
+    def __init__(self, path, compute):
+        self.path = path
+        self.compute = compute
+        self.entries = None
+        self.lock = threading.Lock()
+
+    def load(self):
+        if self.entries is None:
+            try:
+                with open(self.path) as f:
+                    self.entries = json.load(f)
+            except (OSError, ValueError):
+                self.entries = {}
+        return self.entries
+
+    def save(self):
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump(self.entries, f)
+        os.replace(tmp_path, self.path)
+
+    def key_for(self, file_path):
+        return file_key(file_path)
+
+    def peek(self, file_path):
+        key = self.key_for(file_path)
+        with self.lock:
+            return self.load().get(key)
+
+    def get(self, file_path):
+        key = self.key_for(file_path)
+        with self.lock:
+            value = self.load().get(key)
+        if value is not None:
+            return value
+        value = self.compute(file_path)
+        self.store(key, value)
+        return value
+
+    def put(self, file_path, value):
+        # For values worked out elsewhere, e.g. the media library's probe
+        self.store(self.key_for(file_path), value)
+
+    def store(self, key, value):
+        self.store_many({key: value})
+
+    def store_many(self, values):
+        # One write for a whole batch of results
+        with self.lock:
+            entries = self.load()
+            for key, value in values.items():
+                # Drop stale entries for the same path so the file doesn't grow forever
+                prefix = key.rsplit('|', 2)[0] + '|'
+                for old_key in [k for k in entries if k.startswith(prefix)]:
+                    del entries[old_key]
+                entries[key] = value
+            self.save()
+
+
+def sha256_file(path, chunk_size=1 << 20):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+hash_cache = FileKeyedCache(os.path.join(DATA_DIR, 'content_hashes.json'), sha256_file)
+
+
+def content_hash(path):
+    return hash_cache.get(path)
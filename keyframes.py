@@ -0,0 +1,183 @@
+import argparse
+import bisect
+import concurrent.futures
+import hashlib
+import os
+import struct
+import subprocess
+import sys
+import threading
+from array import array
+
+from config import DATA_DIR, FFPROBE_PATH
+
+KEYFRAME_DIR = os.path.join(DATA_DIR, 'keyframes')
+HEADER = struct.Struct('=qq')   # size and mtime_ns of the file the index was built from
+SCAN_TIMEOUT = 3600
+LOADED_MAX = 32                 # indexes kept in memory for resumes of the same file
+BACKGROUND_WORKERS = 1          # a scan reads the whole file; one at a time keeps the disk free for airing
+EPSILON = 0.001                 # an offset this close past a keyframe still starts at it
+
+
+def index_path(path, directory=KEYFRAME_DIR):
+    # One file per source, named after its path like the library's thumbnails
+    name = hashlib.sha1(os.path.abspath(path).encode('utf-8', 'surrogateescape')).hexdigest()
+    return os.path.join(directory, f"{name}.idx")
+
+
+def scan(path, ffprobe_path=FFPROBE_PATH, timeout=SCAN_TIMEOUT):
+    # Time of every video keyframe from the start of the file, the way -ss
+    # counts it, sorted. Packet flags only: the file is demuxed, not decoded.
+    command = [ffprobe_path, '-v', 'error', '-select_streams', 'v:0',
+               '-show_entries', 'packet=pts_time,flags:format=start_time', '-of', 'csv=p=1', path]
+    result = subprocess.run(command, capture_output=True, text=True, timeout=timeout, check=True)
+    times = []
+    start_time = 0.0
+    for line in result.stdout.splitlines():
+        section, _, fields = line.partition(',')
+        pts, _, flags = fields.partition(',')
+        try:
+            pts = float(pts)
+        except ValueError:
+            continue
+        if section == 'format':
+            start_time = pts
+        elif 'K' in flags:
+            times.append(pts)
+    times.sort()
+    return array('d', (max(t - start_time, 0.0) for t in times))
+
+
+def save(path, times, size, mtime_ns, directory=KEYFRAME_DIR):
+    # Written whole and swapped in, so a reader never sees half an index;
+    # library workers in other processes write their own files the same way
+    target = index_path(path, directory)
+    os.makedirs(directory, exist_ok=True)
+    tmp_path = f"{target}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(tmp_path, 'wb') as f:
+        f.write(HEADER.pack(size, mtime_ns))
+        times.tofile(f)
+    os.replace(tmp_path, target)
+
+
+def build(path, ffprobe_path=FFPROBE_PATH, directory=KEYFRAME_DIR):
+    # Stat first: a file edited during the scan then fails lookup() and is scanned again
+    stat = os.stat(path)
+    times = scan(path, ffprobe_path)
+    save(path, times, stat.st_size, stat.st_mtime_ns, directory)
+    return times
+
+
+loaded = {}
+loaded_lock = threading.Lock()
+
+
+def lookup(path, directory=KEYFRAME_DIR):
+    # For stream planning: the index if one was built for the file as it is
+    # now, else None. Never scans, so it costs a stat and, the first time, one read.
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    key = (os.path.abspath(path), stat.st_size, stat.st_mtime_ns)
+    with loaded_lock:
+        times = loaded.get(key)
+    if times is not None:
+        return times
+    try:
+        with open(index_path(path, directory), 'rb') as f:
+            data = f.read()
+    except OSError:
+        return None
+    if len(data) < HEADER.size or HEADER.unpack_from(data) != (stat.st_size, stat.st_mtime_ns):
+        return None
+    times = array('d')
+    times.frombytes(data[HEADER.size:])
+    with loaded_lock:
+        if len(loaded) >= LOADED_MAX:
+            del loaded[next(iter(loaded))]
+        loaded[key] = times
+    return times
+
+
+def keyframe_before(times, offset):
+    # The last keyframe at or before offset (0 when there is none): a binary search, no scanning
+    index = bisect.bisect_right(times, offset + EPSILON) - 1
+    return times[index] if index >= 0 else 0.0
+
+
+def ensure(paths, workers=None, progress=None):
+    # Builds the missing indexes; progress(done, total) is called from this thread
+    stats = {'files': len(paths), 'built': 0, 'cached': 0, 'failed': 0}
+    missing = [path for path in paths if lookup(path) is None]
+    stats['cached'] = len(paths) - len(missing)
+    with concurrent.futures.ThreadPoolExecutor(workers or BACKGROUND_WORKERS) as pool:
+        futures = [pool.submit(build, path) for path in missing]
+        for done, future in enumerate(concurrent.futures.as_completed(futures), 1):
+            try:
+                future.result()
+            except (OSError, subprocess.SubprocessError):
+                stats['failed'] += 1
+            else:
+                stats['built'] += 1
+            if progress:
+                progress(done, len(futures))
+    return stats
+
+
+background = None
+
+
+def build_later(paths):
+    # Queues files as they're picked in the UI, so a resume or a mid-file
+    # start finds the index ready
+    global background
+    if background is None:
+        background = concurrent.futures.ThreadPoolExecutor(BACKGROUND_WORKERS, thread_name_prefix='keyframes')
+    return background.submit(ensure, list(paths), 1)
+
+
+def summary(path):
+    times = lookup(path)
+    if not times:
+        return "no keyframe index"
+    gaps = [b - a for a, b in zip(times, times[1:])]
+    return f"{len(times)} keyframes, longest GOP {max(gaps, default=0):.1f}s"
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Index the keyframes of videos for starting mid-file.")
+    commands = parser.add_subparsers(dest='command', required=True)
+    build_parser = commands.add_parser('build', help="Index files and folders not indexed yet")
+    build_parser.add_argument('paths', nargs='+')
+    build_parser.add_argument('--workers', type=int, help=f"Parallel scans (default: {BACKGROUND_WORKERS})")
+    show = commands.add_parser('show', help="Print a file's index, or where given offsets would start")
+    show.add_argument('path')
+    show.add_argument('offsets', nargs='*', type=float)
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    from media_library import walk
+
+    args = parse_args(argv)
+    if args.command == 'show':
+        print(f"{args.path}: {summary(args.path)}")
+        times = lookup(args.path)
+        for offset in args.offsets if times else []:
+            print(f"{offset:.3f}s starts at {keyframe_before(times, offset):.3f}s")
+        return 0
+    paths = []
+    for path in args.paths:
+        paths += [found for found, _, _ in walk(path)] if os.path.isdir(path) else [path]
+
+    def progress(done, total):
+        print(f"\rIndexed {done}/{total}", end='', flush=True)
+
+    stats = ensure(paths, args.workers, progress)
+    print(f"\n{stats['built']} indexed, {stats['cached']} already indexed, {stats['failed']} failed")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,82 @@
+import collections
+import itertools
+import logging
+import logging.handlers
+import os
+import threading
+import time
+
+from config import DATA_DIR
+
+LOG_PATH = os.path.join(DATA_DIR, 'logs', 'app.log')
+MAX_BYTES = 5 * 1024 * 1024
+BACKUP_COUNT = 5          # app.log.1 ... app.log.5, so at most 30 MB on disk
+RING_LINES = 5000
+LOGGER_NAME = 'automated_obs'
+FILE_FORMAT = '%(asctime)s - %(levelname)s - %(message)s'
+
+
+class LogRing:
+    # The last N lines, numbered so readers on other threads can ask for
+    # whatever arrived since they last looked. Older lines fall off the end.
+    def __init__(self, capacity=RING_LINES):
+        self.lines = collections.deque(maxlen=capacity)
+        self.total = 0
+        self.lock = threading.Lock()
+
+    def append(self, line):
+        with self.lock:
+            self.lines.append(line)
+            self.total += 1
+
+    def since(self, total):
+        # (lines after the first `total` still held, new total, lines already dropped)
+        with self.lock:
+            new = self.total - total
+            held = min(new, len(self.lines))
+            lines = list(itertools.islice(self.lines, len(self.lines) - held, None))
+            return lines, self.total, new - held
+
+    def tail(self, count):
+        with self.lock:
+            return list(itertools.islice(self.lines, max(len(self.lines) - count, 0), None))
+
+
+def file_logger(path=LOG_PATH, max_bytes=MAX_BYTES, backups=BACKUP_COUNT):
+    # One rotating handler per process, however many pipelines share it;
+    # earlier runs are kept as app.log.1, app.log.2 ... instead of truncated
+    logger = logging.getLogger(LOGGER_NAME)
+    if not logger.handlers:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        handler = logging.handlers.RotatingFileHandler(path, maxBytes=max_bytes, backupCount=backups,
+                                                       encoding='utf-8')
+        handler.setFormatter(logging.Formatter(FILE_FORMAT))
+        logger.addHandler(handler)
+        logger.setLevel(logging.DEBUG)
+        logger.propagate = False
+    return logger
+
+
+class LogPipeline:
+    # Every message goes to the bounded ring (what the UI shows) and the
+    # rotating file (what's kept). write() is safe from any thread and never
+    # touches Qt, so the engine, the scheduler and ffmpeg readers call it directly.
+    def __init__(self, path=LOG_PATH, capacity=RING_LINES):
+        self.ring = LogRing(capacity)
+        self.logger = file_logger(path) if path else None
+
+    def write(self, message, level=logging.INFO, stream=None):
+        text = f"[{stream}] {message}" if stream else message
+        self.ring.append(f"{time.strftime('%H:%M:%S')} {text}")
+        if self.logger:
+            self.logger.log(level, text)
+
+    def on_event(self, event):
+        # Engine/scheduler listener: ffmpeg's own output is kept at debug level
+        if event['type'] == 'log':
+            level = logging.DEBUG if event.get('source') == 'ffmpeg' else logging.INFO
+            self.write(event['message'], level, event.get('stream'))
+        elif event['type'] == 'state':
+            error = event.get('error')
+            self.write(f"{event['state']}" + (f": {error}" if error else ''),
+                       logging.ERROR if error else logging.INFO, event.get('stream'))
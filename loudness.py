@@ -0,0 +1,173 @@
+import argparse
+import concurrent.futures
+import json
+import os
+import re
+import subprocess
+import sys
+
+from config import DATA_DIR, FFMPEG_PATH
+from file_cache import FileKeyedCache, content_hash, file_key, hash_cache, sha256_file
+
+LOUDNESS_CACHE_PATH = os.path.join(DATA_DIR, 'loudness.json')
+TARGET_I = -14.0     # LUFS, where YouTube turns playback down to anyway
+TARGET_TP = -1.0     # dBTP
+TARGET_LRA = 11.0
+TOLERANCE = 1.0      # LU off target before an airing gets corrected
+SILENCE = -70.0      # quieter than this is a silent track, left alone
+MEASURE_TIMEOUT = 3600
+BATCH_SIZE = 50      # measurements per cache write
+BACKGROUND_WORKERS = 2
+
+FIELDS = ('input_i', 'input_tp', 'input_lra', 'input_thresh', 'target_offset')
+
+
+def targets():
+    return f"I={TARGET_I}:TP={TARGET_TP}:LRA={TARGET_LRA}"
+
+
+def measure(path, ffmpeg_path=FFMPEG_PATH, timeout=MEASURE_TIMEOUT):
+    # The loudnorm analysis pass over the first audio stream; decodes the audio only
+    command = [ffmpeg_path, '-hide_banner', '-nostats', '-nostdin', '-i', path, '-map', '0:a:0', '-vn',
+               '-af', f"loudnorm={targets()}:print_format=json", '-f', 'null', '-']
+    result = subprocess.run(command, capture_output=True, text=True, timeout=timeout, check=True)
+    found = re.search(r'\{[^{}]*"input_i"[^{}]*\}', result.stderr)
+    if not found:
+        raise ValueError(f"No loudness measurement for {path}")
+    values = json.loads(found.group(0))
+    return {field: float(values[field]) for field in FIELDS}
+
+
+def correction(measured):
+    # Single-pass linear loudnorm from a cached measurement; None when the
+    # file is already close enough to the target, or silent
+    if not measured or measured['input_i'] < SILENCE or abs(measured['input_i'] - TARGET_I) <= TOLERANCE:
+        return None
+    return (f"loudnorm={targets()}:measured_I={measured['input_i']}:measured_TP={measured['input_tp']}:"
+            f"measured_LRA={measured['input_lra']}:measured_thresh={measured['input_thresh']}:"
+            f"offset={measured['target_offset']}:linear=true")
+
+
+class LoudnessCache(FileKeyedCache):
+    # Measurements keyed by content hash, so a renamed or copied upload isn't
+    # measured again. Nothing here measures on a miss: that is analyze()'s job.
+    def __init__(self, path=LOUDNESS_CACHE_PATH):
+        super().__init__(path, compute=None)
+
+    def key_for(self, file_path):
+        return content_hash(file_path)
+
+    def lookup(self, file_path):
+        # For stream planning: never hashes or measures, so it costs a stat
+        try:
+            digest = hash_cache.peek(file_path)
+        except OSError:
+            return None
+        if not digest:
+            return None
+        with self.lock:
+            return self.load().get(digest)
+
+    def record(self, results):
+        # (file key, content hash, measurement) tuples from pool workers; one write per cache
+        hash_cache.store_many({key: digest for key, digest, _ in results})
+        self.store_many({digest: measured for _, digest, measured in results})
+
+
+loudness_cache = LoudnessCache()
+
+
+def analyze_file(path):
+    # Pool job: hash the file unless that's known, measure it unless that's known
+    key = file_key(path)
+    known = hash_cache.peek(path)
+    digest = known or sha256_file(path)
+    with loudness_cache.lock:
+        measured = loudness_cache.load().get(digest)
+    if measured is not None:
+        return key, digest, measured, False, not known
+    return key, digest, measure(path), True, True
+
+
+def analyze(paths, workers=None, progress=None):
+    # Measures files in parallel ahead of airing; progress(done, total) is
+    # called from this thread. Each worker mostly waits on its ffmpeg, so
+    # threads are enough.
+    stats = {'files': len(paths), 'measured': 0, 'cached': 0, 'failed': 0}
+    batch = []
+    with concurrent.futures.ThreadPoolExecutor(workers or os.cpu_count()) as pool:
+        futures = [pool.submit(analyze_file, path) for path in paths]
+        for done, future in enumerate(concurrent.futures.as_completed(futures), 1):
+            try:
+                key, digest, measured, fresh, unrecorded = future.result()
+            except (OSError, ValueError, KeyError, subprocess.SubprocessError):
+                stats['failed'] += 1
+            else:
+                stats['measured' if fresh else 'cached'] += 1
+                # A copy of a measured file still needs its hash remembered
+                if unrecorded:
+                    batch.append((key, digest, measured))
+            if batch and (len(batch) >= BATCH_SIZE or done == len(futures)):
+                loudness_cache.record(batch)
+                batch = []
+            if progress:
+                progress(done, len(futures))
+    return stats
+
+
+background = None
+
+
+def measure_later(paths):
+    # Queues files on a small shared pool, e.g. as they're picked in the UI,
+    # so they are measured by the time they air
+    global background
+    if background is None:
+        background = concurrent.futures.ThreadPoolExecutor(BACKGROUND_WORKERS, thread_name_prefix='loudness')
+    return background.submit(analyze, list(paths), 1)
+
+
+def summary(path):
+    # One line for the UI
+    measured = loudness_cache.lookup(path)
+    if not measured:
+        return "loudness not measured yet"
+    if measured['input_i'] < SILENCE:
+        return "silent"
+    text = f"{measured['input_i']:.1f} LUFS"
+    return f"{text}, aired at {TARGET_I:g} LUFS" if correction(measured) else text
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Measure EBU R128 loudness ahead of airing.")
+    commands = parser.add_subparsers(dest='command', required=True)
+    analyze_parser = commands.add_parser('analyze', help="Measure files and folders not measured yet")
+    analyze_parser.add_argument('paths', nargs='+')
+    analyze_parser.add_argument('--workers', type=int, help="Parallel measurements (default: one per CPU)")
+    show = commands.add_parser('show', help="Print the cached measurement of files")
+    show.add_argument('paths', nargs='+')
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    from media_library import walk
+
+    args = parse_args(argv)
+    if args.command == 'show':
+        for path in args.paths:
+            print(f"{path}: {summary(path)}")
+        return 0
+    paths = []
+    for path in args.paths:
+        paths += [found for found, _, _ in walk(path)] if os.path.isdir(path) else [path]
+
+    def progress(done, total):
+        print(f"\rMeasured {done}/{total}", end='', flush=True)
+
+    stats = analyze(paths, args.workers, progress)
+    print(f"\n{stats['measured']} measured, {stats['cached']} already known, {stats['failed']} failed")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,267 @@
+import argparse
+import concurrent.futures
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import subprocess
+import sys
+import time
+from contextlib import closing
+
+from config import DATA_DIR, FFMPEG_PATH
+from file_cache import file_key, hash_cache, sha256_file
+from keyframes import build as build_keyframes
+from loudness import loudness_cache, measure
+from probe import check_compatibility, run_ffprobe
+
+LIBRARY_PATH = os.path.join(DATA_DIR, 'library.sqlite3')
+THUMBNAIL_DIR = os.path.join(DATA_DIR, 'thumbnails')
+MEDIA_EXTENSIONS = {'.mp4', '.mkv', '.mov', '.m4v', '.avi', '.flv', '.ts', '.webm', '.wmv', '.mpg', '.mpeg'}
+THUMBNAIL_WIDTH = 160
+BATCH_SIZE = 200          # rows per write transaction during a scan
+SEARCH_LIMIT = 200
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS roots (path TEXT PRIMARY KEY);
+CREATE TABLE IF NOT EXISTS media (
+    path TEXT PRIMARY KEY,
+    size INTEGER NOT NULL,
+    mtime_ns INTEGER NOT NULL,
+    name TEXT NOT NULL,
+    duration REAL,
+    video_codec TEXT,
+    audio_codec TEXT,
+    width INTEGER,
+    height INTEGER,
+    fps REAL,
+    loudness REAL,
+    thumbnail TEXT,
+    stream_copy INTEGER,
+    info TEXT,
+    error TEXT,
+    scanned_at REAL
+);
+CREATE INDEX IF NOT EXISTS media_name ON media (name);
+'''
+
+COLUMNS = ('path', 'size', 'mtime_ns', 'name', 'duration', 'video_codec', 'audio_codec', 'width', 'height', 'fps',
+           'loudness', 'thumbnail', 'stream_copy', 'info', 'error', 'scanned_at')
+
+
+def make_thumbnail(path, duration, ffmpeg_path=FFMPEG_PATH, directory=THUMBNAIL_DIR):
+    # One frame a tenth of the way in (past any fade from black), named after the path
+    name = hashlib.sha1(path.encode('utf-8', 'surrogateescape')).hexdigest()
+    thumbnail = os.path.join(directory, f"{name}.jpg")
+    os.makedirs(directory, exist_ok=True)
+    command = [ffmpeg_path, '-hide_banner', '-loglevel', 'error', '-nostdin', '-y',
+               '-ss', f"{min(duration * 0.1, 30):.2f}", '-i', path, '-frames:v', '1',
+               '-vf', f"scale={THUMBNAIL_WIDTH}:-2", thumbnail]
+    subprocess.run(command, capture_output=True, check=True)
+    return thumbnail
+
+
+def index_file(job):
+    # Runs in a pool worker: everything the library keeps about one file
+    path, size, mtime_ns, loudness, keyframes = job
+    row = {'path': path, 'size': size, 'mtime_ns': mtime_ns, 'name': os.path.basename(path).lower(),
+           'scanned_at': time.time()}
+    try:
+        info = run_ffprobe(path)
+        video = info['video'] or {}
+        audio = info['audio'] or {}
+        video_problems, audio_problems = check_compatibility(info)
+        row.update(duration=info['duration'], video_codec=video.get('codec'), audio_codec=audio.get('codec'),
+                   width=video.get('width'), height=video.get('height'), fps=video.get('fps'),
+                   stream_copy=int(not video_problems and not audio_problems), info=json.dumps(info))
+    except (OSError, ValueError, KeyError, subprocess.CalledProcessError) as e:
+        row['error'] = e.stderr.strip().splitlines()[-1] if getattr(e, 'stderr', None) else str(e)
+        return row
+    # A file that probes fine is still usable without these
+    try:
+        if video:
+            row['thumbnail'] = make_thumbnail(path, info['duration'])
+        if audio and loudness:
+            # The full measurement goes to the loudness cache for the airings; the table keeps the headline figure
+            measured = measure(path)
+            row['loudness'] = measured['input_i']
+            row['measurement'] = (file_key(path), hash_cache.peek(path) or sha256_file(path), measured)
+    except (OSError, ValueError, subprocess.SubprocessError):
+        pass
+    try:
+        if video and keyframes:
+            # Written straight to its own file, like the thumbnail
+            build_keyframes(path)
+    except (OSError, subprocess.SubprocessError):
+        pass
+    return row
+
+
+def walk(root):
+    # (path, size, mtime_ns) of every media file under root; scandir reuses
+    # the directory listing, so this is one stat per file and nothing more
+    stack = [root]
+    while stack:
+        try:
+            entries = os.scandir(stack.pop())
+        except OSError:
+            continue
+        with entries:
+            for entry in entries:
+                try:
+                    if entry.is_dir(follow_symlinks=False):
+                        stack.append(entry.path)
+                    elif os.path.splitext(entry.name)[1].lower() in MEDIA_EXTENSIONS:
+                        stat = entry.stat()
+                        yield entry.path, stat.st_size, stat.st_mtime_ns
+                except OSError:
+                    continue
+
+
+class MediaLibrary:
+    # Media under the configured folders, indexed in SQLite by path, size and
+    # mtime. A rescan lists the folders, compares against the table in one
+    # query and only probes what is new or changed, in a process pool.
+    def __init__(self, path=LIBRARY_PATH):
+        self.path = path
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with closing(self.connect()) as db, db:
+            db.executescript(SCHEMA)
+
+    def connect(self):
+        # One connection per call: the GUI searches while a scan thread writes,
+        # and WAL lets readers carry on during the write transactions
+        db = sqlite3.connect(self.path, timeout=30)
+        db.execute('PRAGMA journal_mode=WAL')
+        db.row_factory = sqlite3.Row
+        return db
+
+    def roots(self):
+        with closing(self.connect()) as db:
+            return [row['path'] for row in db.execute('SELECT path FROM roots ORDER BY path')]
+
+    def add_root(self, path):
+        with closing(self.connect()) as db, db:
+            db.execute('INSERT OR IGNORE INTO roots VALUES (?)', (os.path.abspath(path),))
+
+    def remove_root(self, path):
+        path = os.path.abspath(path)
+        with closing(self.connect()) as db, db:
+            db.execute('DELETE FROM roots WHERE path = ?', (path,))
+            db.execute("DELETE FROM media WHERE path LIKE ? ESCAPE '\\'", (escape_like(path + os.sep) + '%',))
+
+    def scan(self, workers=None, loudness=True, progress=None, keyframes=True):
+        # progress(done, total) is called from this thread as files are indexed
+        started = time.monotonic()
+        with closing(self.connect()) as db:
+            known = {row[0]: (row[1], row[2]) for row in db.execute('SELECT path, size, mtime_ns FROM media')}
+        seen = set()
+        jobs = []
+        for root in self.roots():
+            for path, size, mtime_ns in walk(root):
+                seen.add(path)
+                if known.get(path) != (size, mtime_ns):
+                    jobs.append((path, size, mtime_ns, loudness, keyframes))
+        removed = [path for path in known if path not in seen]
+        failed = 0
+        with closing(self.connect()) as db:
+            with db:
+                db.executemany('DELETE FROM media WHERE path = ?', ((path,) for path in removed))
+            if jobs:
+                with concurrent.futures.ProcessPoolExecutor(workers) as pool:
+                    insert = f"INSERT OR REPLACE INTO media VALUES ({', '.join('?' * len(COLUMNS))})"
+                    batch = []
+                    measurements = []
+                    for done, row in enumerate(pool.map(index_file, jobs, chunksize=4), 1):
+                        failed += bool(row.get('error'))
+                        batch.append(tuple(row.get(column) for column in COLUMNS))
+                        if row.get('measurement'):
+                            measurements.append(row['measurement'])
+                        if len(batch) >= BATCH_SIZE or done == len(jobs):
+                            with db:
+                                db.executemany(insert, batch)
+                            batch = []
+                            # Workers only return results; the caches are written here, by one process
+                            if measurements:
+                                loudness_cache.record(measurements)
+                                measurements = []
+                        if progress:
+                            progress(done, len(jobs))
+        return {'files': len(seen), 'indexed': len(jobs), 'removed': len(removed), 'failed': failed,
+                'seconds': time.monotonic() - started}
+
+    def search(self, text='', limit=SEARCH_LIMIT):
+        # Every word has to appear in the file name, in any order
+        terms = text.lower().split()
+        where = ' AND '.join("name LIKE ? ESCAPE '\\'" for _ in terms) or '1'
+        with closing(self.connect()) as db:
+            return [dict(row) for row in db.execute(f"SELECT * FROM media WHERE {where} ORDER BY name LIMIT ?",
+                                                    [f"%{escape_like(term)}%" for term in terms] + [limit])]
+
+    def get(self, path):
+        with closing(self.connect()) as db:
+            row = db.execute('SELECT * FROM media WHERE path = ?', (path,)).fetchone()
+            return dict(row) if row else None
+
+    def count(self):
+        with closing(self.connect()) as db:
+            return db.execute('SELECT COUNT(*) FROM media').fetchone()[0]
+
+
+def escape_like(text):
+    return re.sub(r'([\\%_])', r'\\\1', text)
+
+
+def describe(entry):
+    if entry['error']:
+        return f"unreadable: {entry['error']}"
+    minutes, seconds = divmod(int(entry['duration'] or 0), 60)
+    parts = [f"{minutes // 60}:{minutes % 60:02}:{seconds:02}"]
+    if entry['width']:
+        parts.append(f"{entry['width']}x{entry['height']} {entry['fps'] or 0:.3g}fps {entry['video_codec']}")
+    if entry['audio_codec']:
+        parts.append(entry['audio_codec'] + (f" {entry['loudness']:.1f} LUFS" if entry['loudness'] is not None else ''))
+    parts.append('stream copy' if entry['stream_copy'] else 're-encode')
+    return ', '.join(parts)
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Index the media folders for searching and picking videos.")
+    commands = parser.add_subparsers(dest='command', required=True)
+    add = commands.add_parser('add', help="Add a folder to the library")
+    add.add_argument('folder')
+    remove = commands.add_parser('remove', help="Remove a folder and its entries")
+    remove.add_argument('folder')
+    scan = commands.add_parser('scan', help="Index new and changed files")
+    scan.add_argument('--workers', type=int, help="Probe processes (default: one per CPU)")
+    scan.add_argument('--no-loudness', action='store_true', help="Skip the loudness measurement (faster)")
+    scan.add_argument('--no-keyframes', action='store_true', help="Skip the keyframe index (faster)")
+    search = commands.add_parser('search', help="Find files by name")
+    search.add_argument('text', nargs='*')
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    library = MediaLibrary()
+    if args.command == 'add':
+        library.add_root(args.folder)
+    elif args.command == 'remove':
+        library.remove_root(args.folder)
+    elif args.command == 'scan':
+        def progress(done, total):
+            print(f"\rIndexed {done}/{total}", end='', flush=True)
+
+        stats = library.scan(args.workers, loudness=not args.no_loudness, progress=progress,
+                             keyframes=not args.no_keyframes)
+        print(f"\n{stats['files']} files, {stats['indexed']} indexed, {stats['removed']} removed, "
+              f"{stats['failed']} unreadable in {stats['seconds']:.1f}s")
+    else:
+        for entry in library.search(' '.join(args.text)):
+            print(f"{entry['path']}  [{describe(entry)}]")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
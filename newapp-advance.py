@@ -1,27 +1,30 @@
 import sys
 import os
-import logging
 from PyQt5.QtWidgets import (QApplication, QWidget, QPushButton, QFileDialog, QLabel, QVBoxLayout, 
                              QMessageBox, QHBoxLayout, QLineEdit)
 from PyQt5.QtGui import QFont
 from PyQt5.QtCore import Qt, QTimer, QUrl
 from PyQt5.QtMultimedia import QMediaPlayer, QMediaContent
 from PyQt5.QtMultimediaWidgets import QVideoWidget
-import subprocess
-import threading
 
-# Importing the speedtest module directly instead of as 'speedtest' to avoid confusion
-import speedtest as st
+from bandwidth import BandwidthMonitor
+from keyframes import build_later, lookup as lookup_keyframes
+from log_pipeline import LogPipeline
+from loudness import loudness_cache, measure_later, summary
+from preview import PreviewTap
+from qt_support import EngineBridge, LibraryDialog, PreviewWidget, ResourceSparklines
+from resources import ResourceSampler, engine_sources
+from stream_command import parse_destinations
+from stream_engine import FAILED, LIVE, RECONNECTING, STOPPED, StreamEngine
+from telemetry import describe
 
-# Setup logging
-logging.basicConfig(level=logging.DEBUG, filename='app.log', filemode='w',
-                    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+STREAM_NAME = 'main'
 
 class StreamApp(QWidget):
     def __init__(self):
         super().__init__()
         self.initUI()
-        self.update_speed_test()
+        self.update_speed_label()
         
     def initUI(self):
         self.setGeometry(100, 100, 800, 600)
@@ -31,6 +34,9 @@ class StreamApp(QWidget):
         self.status_label.setFixedSize(20, 20)
         self.status_label.setStyleSheet("background-color: red; border-radius: 10px;")
 
+        self.metrics_label = QLabel(self)
+        self.metrics_label.setFont(QFont('Arial', 10))
+
         self.speed_label = QLabel('Checking internet speed...', self)
         self.speed_label.setFont(QFont('Arial', 10))
         
@@ -38,7 +44,7 @@ class StreamApp(QWidget):
         self.label.setFont(QFont('Arial', 14))
         self.label.setAlignment(Qt.AlignCenter)
 
-        self.key_label = QLabel('YouTube Streaming Key:', self)
+        self.key_label = QLabel('YouTube Streaming Key(s) or URL(s), comma separated:', self)
         self.key_label.setFont(QFont('Arial', 12))
 
         self.key_input = QLineEdit(self)
@@ -67,12 +73,21 @@ class StreamApp(QWidget):
         self.stop_video_btn.setEnabled(False)
         self.stop_video_btn.clicked.connect(self.stopVideo)
 
+        self.preview_btn = QPushButton('On-Air Preview', self)
+        self.preview_btn.setFont(QFont('Arial', 12))
+        self.preview_btn.setCheckable(True)
+        self.preview_btn.toggled.connect(self.togglePreview)
+
         self.video_widget = QVideoWidget(self)
         self.media_player = QMediaPlayer(None, QMediaPlayer.VideoSurface)
         self.media_player.setVideoOutput(self.video_widget)
 
+        self.sparklines = ResourceSparklines(STREAM_NAME, self)
+
         hbox = QHBoxLayout()
         hbox.addWidget(self.status_label)
+        hbox.addWidget(self.sparklines)
+        hbox.addWidget(self.metrics_label)
         hbox.addStretch(1)
 
         top_left_box = QVBoxLayout()
@@ -92,67 +107,84 @@ class StreamApp(QWidget):
         video_control_box = QHBoxLayout()
         video_control_box.addWidget(self.play_btn)
         video_control_box.addWidget(self.stop_video_btn)
+        video_control_box.addWidget(self.preview_btn)
         vbox.addLayout(video_control_box)
         
         self.setLayout(vbox)
+        self.video_box = vbox
         
         self.video_path = None
-        self.ffmpeg_process = None
-
+        self.preview = None
+        self.preview_tap = None
+        # Rotating log under ~/.automated_obs/logs; earlier runs are kept, not truncated
+        self.logs = LogPipeline()
+        self.engine = StreamEngine().run_in_background()
+        self.sampler = ResourceSampler(engine_sources(self.engine)).start()
+        self.sparklines.setSampler(self.sampler)
+        self.engine.subscribe(self.logs.on_event)
+        self.bridge = EngineBridge(self.engine, skip=('log',))
+        self.bridge.event.connect(self.onEngineEvent)
+
+        # Probes run on the monitor's own worker; the label just shows its latest result
+        self.bandwidth = BandwidthMonitor(engine=self.engine, on_probe=self.logs.write).start()
         self.timer = QTimer()
-        self.timer.timeout.connect(self.update_speed_test)
-        self.timer.start(60000)  # Update internet speed every minute
+        self.timer.timeout.connect(self.update_speed_label)
+        self.timer.start(5000)
     
     def showDialog(self):
-        options = QFileDialog.Options()
-        self.video_path, _ = QFileDialog.getOpenFileName(self, "Select Video File", "", "All Files (*);;MP4 Files (*.mp4)", options=options)
+        self.video_path = LibraryDialog.pick(self)
         if self.video_path:
-            self.label.setText(f"Selected file: {self.video_path}")
+            self.label.setText(f"Selected file: {self.video_path} ({summary(self.video_path)})")
+            if not loudness_cache.lookup(self.video_path):
+                measure_later([self.video_path])
+            if lookup_keyframes(self.video_path) is None:
+                build_later([self.video_path])
             self.media_player.setMedia(QMediaContent(QUrl.fromLocalFile(self.video_path)))
             self.play_btn.setEnabled(True)
             self.stop_video_btn.setEnabled(True)
     
     def startStreaming(self):
-        if self.video_path and self.key_input.text():
+        if self.video_path and parse_destinations(self.key_input.text()):
             self.start_btn.setEnabled(False)
             self.stop_btn.setEnabled(True)
             self.updateStatusLabel("green")
-            threading.Thread(target=self.run_ffmpeg).start()
+            # The on-air preview replaces local playback: no second decode of the source
+            self.media_player.stop()
+            self.play_btn.setEnabled(False)
+            self.stop_video_btn.setEnabled(False)
+            # The tap is an extra encoder output, so it is only planned in while the preview is shown
+            self.preview_tap = PreviewTap().start() if self.preview_btn.isChecked() else None
+            if self.preview:
+                self.preview.setTap(self.preview_tap)
+            stream_urls = parse_destinations(self.key_input.text())
+            self.engine.submit(self.engine.start(STREAM_NAME, self.video_path, stream_urls,
+                                                 preview=self.preview_tap))
         else:
             self.showMessageBox("Error", "Please select a video file and enter the YouTube streaming key.")
-    
-    def run_ffmpeg(self):
-        stream_key = self.key_input.text()
-        stream_url = f"rtmp://a.rtmp.youtube.com/live2/{stream_key}"
-        ffmpeg_path = r"C:/ffmpeg/bin/ffmpeg.exe"  # Replace with the correct path
-        command = [
-            ffmpeg_path, '-re', '-i', self.video_path, '-c:v', 'libx264', '-preset', 'veryfast', 
-            '-maxrate', '3000k', '-bufsize', '6000k', '-pix_fmt', 'yuv420p', '-g', '50', '-c:a', 'aac', 
-            '-b:a', '128k', '-ar', '44100', '-f', 'flv', stream_url
-        ]
-        logging.debug(f"Running command: {command}")
-        try:
-            self.ffmpeg_process = subprocess.Popen(command)
-            self.ffmpeg_process.wait()
-        except FileNotFoundError as e:
-            logging.error(f"FileNotFoundError: {e}")
-            self.showMessageBox("File Not Found", f"FileNotFoundError: {e}")
-        except Exception as e:
-            logging.error(f"An error occurred: {e}")
-            self.showMessageBox("Error", f"An error occurred: {e}")
-        finally:
+
+    def onEngineEvent(self, event):
+        if event['type'] == 'metrics':
+            self.metrics_label.setText(describe(event['sample']))
+        elif event['state'] == RECONNECTING:
+            self.updateStatusLabel("orange")
+        elif event['state'] == LIVE:
+            self.updateStatusLabel("green")
+        elif event['state'] in (STOPPED, FAILED):
+            self.metrics_label.clear()
             self.updateStatusLabel("red")
             self.start_btn.setEnabled(True)
             self.stop_btn.setEnabled(False)
+            self.play_btn.setEnabled(bool(self.video_path))
+            if self.preview_tap:
+                self.preview_tap.stop()
+                self.preview_tap = None
+            if event['state'] == FAILED:
+                self.showMessageBox("Error", f"An error occurred: {event['error']}")
     
     def stopStreaming(self):
-        if self.ffmpeg_process:
-            self.ffmpeg_process.terminate()
-            self.ffmpeg_process = None
+        if self.engine.is_active(STREAM_NAME):
+            self.engine.submit(self.engine.stop(STREAM_NAME))
             self.showMessageBox("Stopped", "Streaming stopped successfully!")
-            self.updateStatusLabel("red")
-            self.start_btn.setEnabled(True)
-            self.stop_btn.setEnabled(False)
 
     def playVideo(self):
         self.media_player.play()
@@ -164,20 +196,28 @@ class StreamApp(QWidget):
         self.play_btn.setEnabled(True)
         self.stop_video_btn.setEnabled(False)
 
-    def update_speed_test(self):
-        threading.Thread(target=self.run_speed_test).start()
-
-    def run_speed_test(self):
-        try:
-            logging.debug("Starting speed test...")
-            speed_test = st.Speedtest()
-            download_speed = speed_test.download() / 1_000_000  # Convert to Mbps
-            upload_speed = speed_test.upload() / 1_000_000  # Convert to Mbps
-            logging.debug(f"Download speed: {download_speed:.2f} Mbps, Upload speed: {upload_speed:.2f} Mbps")
-            self.speed_label.setText(f'Download: {download_speed:.2f} Mbps / Upload: {upload_speed:.2f} Mbps')
-        except Exception as e:
-            logging.error(f"Speed test failed: {e}")
-            self.speed_label.setText('Speed test failed')
+    def togglePreview(self, checked):
+        # Built the first time it's asked for; hidden, it doesn't even run its timer
+        if checked and not self.preview:
+            self.preview = PreviewWidget(self.preview_tap, self)
+            self.video_box.insertWidget(self.video_box.indexOf(self.video_widget) + 1, self.preview)
+        if self.preview:
+            self.preview.setVisible(checked)
+        self.video_widget.setVisible(not checked)
+        if self.engine.is_active(STREAM_NAME) and checked != bool(self.preview_tap):
+            self.swapPreviewTap(PreviewTap().start() if checked else None)
+
+    def swapPreviewTap(self, tap):
+        # Mid-stream the encoder restarts with or without the tap
+        old, self.preview_tap = self.preview_tap, tap
+        if self.preview:
+            self.preview.setTap(tap)
+        self.engine.submit(self.engine.set_preview(STREAM_NAME, tap))
+        if old:
+            old.stop()
+
+    def update_speed_label(self):
+        self.speed_label.setText(self.bandwidth.describe())
 
     def updateStatusLabel(self, color):
         self.status_label.setStyleSheet(f"background-color: {color}; border-radius: 10px;")
@@ -185,6 +225,12 @@ class StreamApp(QWidget):
     def showMessageBox(self, title, message):
         QMessageBox.information(self, title, message)
 
+    def closeEvent(self, event):
+        self.bandwidth.stop()
+        self.sampler.stop()
+        self.engine.submit(self.engine.stop_all()).result(10)
+        super().closeEvent(event)
+
 if __name__ == '__main__':
     app = QApplication(sys.argv)
     ex = StreamApp()
@@ -0,0 +1,269 @@
+import collections
+import os
+import subprocess
+import threading
+import time
+
+from config import FFMPEG_PATH
+from encoder_tuning import apply_profile
+from loudness import correction, loudness_cache
+from procfs import set_affinity
+from probe import probe_cache, probe_duration
+from stream_command import (AUDIO_ENCODE_ARGS, KEYFRAMES_ONLY, SOURCE_MAPS, VIDEO_ENCODE_ARGS, StreamPlan,
+                            output_args, with_option)
+
+OUTPUT_SIZE = (1280, 720)
+OUTPUT_FPS = 25
+BUFFER_BYTES = 8 * 1024 * 1024   # ~20 s at the usual bitrate, enough to hide the next encoder's startup
+CHUNK_BYTES = 65536
+BOUNDARY = None  # marks the end of an item in the buffer
+
+
+class Playlist:
+    # Ordered, editable queue. The feeder asks for the next item only at an
+    # item boundary, so edits take effect there without touching the stream.
+    def __init__(self, items=(), loop=True):
+        self.items = list(items)
+        self.loop = loop
+        self.position = 0
+        self.current = None
+        self.lock = threading.Lock()
+
+    def add(self, path):
+        with self.lock:
+            self.items.append(path)
+
+    def insert(self, index, path):
+        with self.lock:
+            self.items.insert(index, path)
+            if index < self.position:
+                self.position += 1
+
+    def remove(self, index):
+        with self.lock:
+            del self.items[index]
+            if index < self.position:
+                self.position -= 1
+
+    def move(self, index, new_index):
+        with self.lock:
+            upcoming = self.items[self.position] if self.position < len(self.items) else None
+            self.items.insert(new_index, self.items.pop(index))
+            if upcoming is not None:
+                self.position = self.items.index(upcoming)
+
+    def clear(self):
+        with self.lock:
+            self.items = []
+            self.position = 0
+
+    def rewind(self):
+        with self.lock:
+            self.position = 0
+
+    def snapshot(self):
+        with self.lock:
+            return list(self.items), self.position
+
+    def next(self):
+        with self.lock:
+            if self.position >= len(self.items):
+                if not self.loop or not self.items:
+                    self.current = None
+                    return None
+                self.position = 0
+            self.current = self.items[self.position]
+            self.position += 1
+            return self.current
+
+
+def item_args(video_path, offset, probe_cache=probe_cache, size=OUTPUT_SIZE, fps=OUTPUT_FPS, threads=None):
+    # Every item is normalised to the same size, rate and codec settings and
+    # shifted to start where the previous one ended, so the muxer downstream
+    # sees one continuous MPEG-TS stream it can copy.
+    width, height = size
+    inputs = ['-i', video_path]
+    try:
+        has_audio = bool(probe_cache.get(video_path)['audio'])
+    except (OSError, ValueError, KeyError, TypeError, subprocess.CalledProcessError):
+        has_audio = True
+    if not has_audio:
+        # A silent track keeps the audio stream continuous across items
+        inputs += ['-f', 'lavfi', '-i', 'anullsrc=channel_layout=stereo:sample_rate=44100']
+    video_args = apply_profile(VIDEO_ENCODE_ARGS, height)
+    if threads:
+        video_args = with_option(video_args, '-threads', str(threads))
+    video_filter = (f"scale={width}:{height}:force_original_aspect_ratio=decrease,"
+                    f"pad={width}:{height}:(ow-iw)/2:(oh-ih)/2,setsar=1,fps={fps}")
+    # Items measured off the loudness target are brought to it, so the volume doesn't jump between them
+    audio_filter = 'aresample=async=1'
+    level = correction(loudness_cache.lookup(video_path)) if has_audio else None
+    if level:
+        audio_filter = f"{level},{audio_filter}"
+    return inputs + [
+        '-map', '0:v:0', '-map', '0:a:0' if has_audio else '1:a:0', '-shortest',
+        '-vf', video_filter, '-af', audio_filter, '-ac', '2',
+    ] + video_args + AUDIO_ENCODE_ARGS + [
+        '-output_ts_offset', f"{offset:.6f}", '-muxdelay', '0', '-f', 'mpegts', 'pipe:1',
+    ]
+
+
+class PlaylistFeeder:
+    # Encodes the items one after another, faster than real time, into a
+    # bounded buffer; a second thread drains it into the muxer's stdin. The
+    # muxer's -re paces the whole thing, so the encoder only runs ahead by
+    # the buffer and the next item's startup happens while the buffer plays.
+    def __init__(self, playlist, ffmpeg_path=FFMPEG_PATH, log=None, buffer_bytes=BUFFER_BYTES, threads=None,
+                 affinity=None):
+        self.playlist = playlist
+        self.threads = threads
+        self.affinity = affinity
+        self.ffmpeg_path = ffmpeg_path
+        self.log = log or (lambda message: None)
+        self.buffer_bytes = buffer_bytes
+        self.chunks = collections.deque()
+        self.buffered = 0
+        self.condition = threading.Condition()
+        self.encoding_done = False
+        self.running = False
+        self.process = None
+        self.offset = 0.0
+        self.items_played = 0
+        # Seconds the muxer sat waiting for data at each item boundary
+        self.boundary_stalls = []
+
+    def attach(self, pipe):
+        self.running = True
+        threading.Thread(target=self.encode, daemon=True).start()
+        threading.Thread(target=self.drain, args=(pipe,), daemon=True).start()
+
+    def detach(self):
+        self.running = False
+        with self.condition:
+            self.condition.notify_all()
+        process = self.process
+        if process and process.poll() is None:
+            process.kill()
+
+    def encode(self):
+        try:
+            while self.running:
+                video_path = self.playlist.next()
+                if video_path is None:
+                    self.log("Playlist finished")
+                    break
+                try:
+                    duration = probe_duration(video_path)
+                except (OSError, ValueError, subprocess.CalledProcessError) as e:
+                    self.log(f"Skipping {video_path}: {e}")
+                    continue
+                self.log(f"Playlist item {self.items_played + 1}: {video_path} at {self.offset:.1f}s")
+                ok, sent = self.encode_item(video_path)
+                if not ok and self.running:
+                    self.log(f"Encoding {video_path} failed, skipping the rest of it")
+                if not sent:
+                    continue
+                # Whatever part of it went out, the next item starts after its slot
+                self.offset += duration
+                self.items_played += 1
+                with self.condition:
+                    self.chunks.append(BOUNDARY)
+                    self.condition.notify_all()
+        finally:
+            with self.condition:
+                self.encoding_done = True
+                self.condition.notify_all()
+
+    def encode_item(self, video_path):
+        command = [self.ffmpeg_path, '-hide_banner', '-loglevel', 'error', '-nostdin', '-nostats']
+        command += item_args(video_path, self.offset, threads=self.threads)
+        self.process = subprocess.Popen(command, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+        if self.affinity:
+            set_affinity(self.process.pid, self.affinity)
+        errors = threading.Thread(target=self.read_errors, args=(self.process.stderr, video_path),
+                                  name='playlist-stderr', daemon=True)
+        errors.start()
+        sent = 0
+        try:
+            while self.running:
+                chunk = self.process.stdout.read(CHUNK_BYTES)
+                if not chunk:
+                    break
+                with self.condition:
+                    while self.running and self.buffered >= self.buffer_bytes:
+                        self.condition.wait()
+                    self.chunks.append(chunk)
+                    self.buffered += len(chunk)
+                    self.condition.notify_all()
+                sent += len(chunk)
+        finally:
+            self.process.stdout.close()
+            returncode = self.process.wait()
+            errors.join()
+        return returncode == 0, sent
+
+    def read_errors(self, pipe, video_path):
+        name = os.path.basename(video_path)
+        with pipe:
+            for line in pipe:
+                text = line.decode('utf-8', 'replace').strip()
+                if text:
+                    self.log(f"{name}: {text}")
+
+    def drain(self, pipe):
+        boundary = False
+        try:
+            while True:
+                with self.condition:
+                    waited = None
+                    while self.running and not self.chunks and not self.encoding_done:
+                        waited = waited or time.perf_counter()
+                        self.condition.wait()
+                    if not self.running or not self.chunks:
+                        break
+                    chunk = self.chunks.popleft()
+                    if chunk is BOUNDARY:
+                        boundary = True
+                        continue
+                    if boundary:
+                        boundary = False
+                        self.boundary_stalls.append(time.perf_counter() - waited if waited else 0.0)
+                    self.buffered -= len(chunk)
+                    self.condition.notify_all()
+                pipe.write(chunk)
+            pipe.flush()
+        except (BrokenPipeError, OSError, ValueError):
+            pass
+        finally:
+            self.running = False
+            try:
+                pipe.close()
+            except OSError:
+                pass
+
+
+def plan_playlist(playlist, urls, ffmpeg_path=FFMPEG_PATH, log=None, threads=None, affinity=None, preview=None):
+    # The muxer is the long-lived process the engine watches; it never sees
+    # an item boundary, so the RTMP session stays up across the whole list.
+    if not urls:
+        raise ValueError("At least one stream destination is required")
+    keyframes = KEYFRAMES_ONLY if preview else []
+    command = [ffmpeg_path, '-re', '-f', 'mpegts'] + keyframes + ['-i', 'pipe:0'] + SOURCE_MAPS + ['-c', 'copy']
+    command += output_args(urls)
+    if preview:
+        command += preview.output_args('0:v:0')
+    return StreamPlan(command, log=log, feeder=PlaylistFeeder(playlist, ffmpeg_path, log, threads=threads,
+                                                              affinity=affinity))
+
+
+def read_playlist(path):
+    # One file per line, relative to the list; blank lines and # comments skipped (.m3u works)
+    base = os.path.dirname(os.path.abspath(path))
+    paths = []
+    # utf-8-sig drops the byte order mark some editors put before the first line
+    with open(path, encoding='utf-8-sig') as f:
+        for line in f:
+            entry = line.strip()
+            if entry and not entry.startswith('#'):
+                paths.append(os.path.join(base, entry))
+    return paths
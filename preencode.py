@@ -0,0 +1,204 @@
+import os
+import shutil
+import subprocess
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from config import FFMPEG_PATH
+from probe import probe_duration
+from rendition_cache import rendition_cache
+from stream_command import cache_key_for, codec_args, overlay_args, with_option
+
+MIN_CHUNK_SECONDS = 10
+MAX_CHUNK_SECONDS = 120
+
+
+def chunk_seconds(duration, workers):
+    # A few chunks per worker keeps every core busy until the tail end
+    return max(MIN_CHUNK_SECONDS, min(MAX_CHUNK_SECONDS, duration / (workers * 4) if duration else MAX_CHUNK_SECONDS))
+
+
+def format_eta(seconds):
+    if seconds is None:
+        return "?"
+    minutes, seconds = divmod(int(seconds), 60)
+    hours, minutes = divmod(minutes, 60)
+    return f"{hours}h{minutes:02d}m{seconds:02d}s" if hours else f"{minutes}m{seconds:02d}s"
+
+
+class PreencodeJob:
+    # Encodes a source into the rendition cache ahead of its slot: the video is
+    # cut at keyframes with stream copy, the pieces are encoded side by side,
+    # and the encoded pieces are joined back losslessly with the audio.
+    def __init__(self, video_path, ticker_path=None, workers=None, on_progress=None, ffmpeg_path=FFMPEG_PATH,
+                 cache=rendition_cache):
+        self.video_path = video_path
+        self.ticker_path = ticker_path
+        self.workers = workers or os.cpu_count() or 1
+        self.on_progress = on_progress
+        self.ffmpeg_path = ffmpeg_path
+        self.cache = cache
+        self.state = 'queued'
+        self.error = None
+        self.output_path = None
+        self.duration = 0.0
+        self.chunk_durations = []
+        self.chunk_done = []
+        self.started = None
+        self.cancelled = False
+        self.processes = set()
+        self.lock = threading.Lock()
+        self.thread = None
+
+    def start(self):
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+        return self
+
+    def cancel(self):
+        self.cancelled = True
+        with self.lock:
+            for process in list(self.processes):
+                process.kill()
+
+    @property
+    def progress(self):
+        if self.state == 'done':
+            return 1.0
+        if not self.duration or not self.chunk_durations:
+            return 0.0
+        # Video chunks carry the weight; audio and muxing are a small tail
+        return min(sum(self.chunk_done) / self.duration, 1.0) * 0.95
+
+    @property
+    def eta(self):
+        progress = self.progress
+        if not self.started or progress <= 0:
+            return None
+        elapsed = time.monotonic() - self.started
+        return elapsed * (1 - progress) / progress
+
+    def describe(self):
+        name = os.path.basename(self.video_path)
+        if self.state == 'failed':
+            return f"Pre-encode {name}: failed ({self.error})"
+        if self.state in ('done', 'cached', 'cancelled', 'not needed'):
+            return f"Pre-encode {name}: {self.state}"
+        return f"Pre-encode {name}: {self.state} {self.progress * 100:.0f}% (ETA {format_eta(self.eta)})"
+
+    @property
+    def running(self):
+        return self.state in ('queued', 'splitting', 'encoding', 'muxing')
+
+    def report(self, state=None):
+        if state:
+            self.state = state
+        if self.on_progress:
+            self.on_progress(self)
+
+    def run_ffmpeg(self, args, chunk_index=None):
+        command = [self.ffmpeg_path, '-hide_banner', '-loglevel', 'error', '-nostats', '-y']
+        if chunk_index is not None:
+            command += ['-progress', 'pipe:1']
+        command += args
+        process = subprocess.Popen(command, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
+        with self.lock:
+            if self.cancelled:
+                process.kill()
+            self.processes.add(process)
+        try:
+            if chunk_index is not None:
+                for line in process.stdout:
+                    key, _, value = line.strip().partition('=')
+                    if key == 'out_time_us' and value.isdigit():
+                        self.chunk_done[chunk_index] = min(int(value) / 1e6, self.chunk_durations[chunk_index])
+            stderr = process.communicate()[1]
+        finally:
+            with self.lock:
+                self.processes.discard(process)
+        if self.cancelled:
+            raise RuntimeError("cancelled")
+        if process.returncode != 0:
+            raise RuntimeError(stderr.strip().splitlines()[-1] if stderr.strip() else f"ffmpeg exited with {process.returncode}")
+
+    def run(self):
+        self.started = time.monotonic()
+        workdir = None
+        try:
+            args, _ = codec_args(self.video_path, overlay=bool(self.ticker_path))
+            # Copied video costs next to nothing live; an audio-only encode isn't worth the cache
+            if args == ['-c', 'copy'] or args[:2] == ['-c:v', 'copy']:
+                self.report('not needed')
+                return
+            key = cache_key_for(self.video_path, args, self.ticker_path)
+            if self.cache.contains(key):
+                self.report('cached')
+                return
+            audio_index = args.index('-c:a')
+            video_args, audio_args = args[:audio_index], args[audio_index:]
+            self.duration = probe_duration(self.video_path)
+            os.makedirs(self.cache.directory, exist_ok=True)
+            workdir = tempfile.mkdtemp(prefix='preencode-', dir=self.cache.directory)
+            self.report('splitting')
+            chunks = self.split(workdir)
+            self.report('encoding')
+            encoded = self.encode_chunks(chunks, video_args, workdir)
+            self.report('muxing')
+            self.output_path = self.cache.recording_path(key)
+            self.mux(encoded, audio_args, workdir)
+            self.output_path = self.cache.commit(key, self.output_path, source=self.video_path)
+            self.report('done' if self.output_path else 'failed')
+        except Exception as e:
+            if self.output_path:
+                self.cache.discard(self.output_path)
+            self.error = e
+            self.report('cancelled' if self.cancelled else 'failed')
+        finally:
+            if workdir:
+                shutil.rmtree(workdir, ignore_errors=True)
+
+    def split(self, workdir):
+        segment_list = os.path.join(workdir, 'segments.csv')
+        self.run_ffmpeg([
+            '-i', self.video_path, '-map', '0:v:0', '-c', 'copy', '-f', 'segment',
+            '-segment_time', f"{chunk_seconds(self.duration, self.workers):.0f}", '-reset_timestamps', '1',
+            '-segment_list', segment_list, '-segment_list_type', 'csv',
+            os.path.join(workdir, 'chunk_%05d.mkv'),
+        ])
+        chunks = []
+        with open(segment_list) as f:
+            for line in f:
+                name, start, end = line.strip().rsplit(',', 2)
+                chunks.append(os.path.join(workdir, name))
+                self.chunk_durations.append(float(end) - float(start))
+        self.chunk_done = [0.0] * len(chunks)
+        self.duration = sum(self.chunk_durations) or self.duration
+        return chunks
+
+    def encode_chunks(self, chunks, video_args, workdir):
+        overlay = overlay_args(self.video_path, self.ticker_path)
+
+        def encode(index):
+            output = os.path.join(workdir, f"encoded_{index:05d}.mkv")
+            args = ['-i', chunks[index]] + overlay
+            # One encoder thread per chunk; the parallelism comes from the pool
+            self.run_ffmpeg(args + with_option(video_args, '-threads', '1') + ['-an', output], chunk_index=index)
+            self.chunk_done[index] = self.chunk_durations[index]
+            self.report()
+            return output
+
+        with ThreadPoolExecutor(max_workers=self.workers) as pool:
+            return list(pool.map(encode, range(len(chunks))))
+
+    def mux(self, encoded, audio_args, workdir):
+        concat_list = os.path.join(workdir, 'concat.txt')
+        with open(concat_list, 'w') as f:
+            for path in encoded:
+                escaped = path.replace("'", "'\\''")
+                f.write(f"file '{escaped}'\n")
+        self.run_ffmpeg([
+            '-f', 'concat', '-safe', '0', '-i', concat_list, '-i', self.video_path,
+            '-map', '0:v:0', '-map', '1:a:0?', '-c:v', 'copy',
+        ] + audio_args + ['-f', 'flv', self.output_path])
@@ -0,0 +1,97 @@
+import contextlib
+import socket
+import threading
+
+PREVIEW_SIZE = (320, 180)
+PREVIEW_FPS = 5
+BUFFERS = 3   # one being filled, the newest complete frame, one lent to the viewer
+
+
+class PreviewTap:
+    # Receives a small rgb24 copy of what goes to air. ffmpeg writes it as a
+    # second output to tcp://127.0.0.1:port (a plain pipe can't be handed to
+    # ffmpeg on Windows); the reader thread always drains it, so a viewer that
+    # falls behind never backs up the encoder. Frames land in a few buffers
+    # allocated once and reused for the life of the tap.
+    def __init__(self, size=PREVIEW_SIZE, fps=PREVIEW_FPS):
+        self.width, self.height = size
+        self.fps = fps
+        self.frame_bytes = self.width * self.height * 3
+        self.buffers = [bytearray(self.frame_bytes) for _ in range(BUFFERS)]
+        self.lock = threading.Lock()
+        self.ready = None     # index of the newest complete frame
+        self.lent = None      # index the viewer is reading from
+        self.frames = 0
+        self.listener = None
+        self.thread = None
+        self.running = False
+
+    @property
+    def url(self):
+        return f"tcp://127.0.0.1:{self.listener.getsockname()[1]}"
+
+    def start(self):
+        # Must be listening before ffmpeg opens its outputs
+        self.listener = socket.create_server(('127.0.0.1', 0))
+        self.running = True
+        self.thread = threading.Thread(target=self.run, name='preview-tap', daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        # Stops taking connections; one already open is drained until ffmpeg
+        # closes it, since cutting it short would fail the stream's output
+        self.running = False
+        if self.listener:
+            self.listener.close()
+
+    def output_args(self, source):
+        # ffmpeg output options for the tap; source is a stream specifier or a filter graph label
+        args = ['-map', source]
+        if not source.startswith('['):
+            args += ['-vf', self.filter()]
+        return args + ['-an', '-c:v', 'rawvideo', '-f', 'rawvideo', self.url]
+
+    def filter(self):
+        # Fixed size whatever the source's shape, so every frame is frame_bytes long
+        return (f"fps={self.fps},scale={self.width}:{self.height}:force_original_aspect_ratio=decrease,"
+                f"pad={self.width}:{self.height}:(ow-iw)/2:(oh-ih)/2,format=rgb24")
+
+    def run(self):
+        # One ffmpeg connection at a time; a restarted encoder simply connects again
+        while self.running:
+            try:
+                connection, _ = self.listener.accept()
+            except OSError:
+                return
+            with connection:
+                self.receive(connection)
+
+    def receive(self, connection):
+        while True:
+            with self.lock:
+                index = next(i for i in range(BUFFERS) if i != self.ready and i != self.lent)
+            view = memoryview(self.buffers[index])
+            filled = 0
+            while filled < self.frame_bytes:
+                try:
+                    count = connection.recv_into(view[filled:])
+                except OSError:
+                    count = 0
+                if not count:
+                    return
+                filled += count
+            with self.lock:
+                self.ready = index
+                self.frames += 1
+
+    @contextlib.contextmanager
+    def frame(self):
+        # The newest frame as a memoryview (None before the first one), valid inside the with block
+        with self.lock:
+            self.lent = self.ready
+        try:
+            yield memoryview(self.buffers[self.lent]) if self.lent is not None else None
+        finally:
+            with self.lock:
+                self.lent = None
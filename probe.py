@@ -0,0 +1,122 @@
+import json
+import os
+import subprocess
+
+from config import DATA_DIR, FFPROBE_PATH
+from file_cache import FileKeyedCache
+
+PROBE_CACHE_PATH = os.path.join(DATA_DIR, 'probe_cache.json')
+
+# What YouTube ingests without complaint and what our own encode would produce
+VIDEO_CODECS = {'h264'}
+VIDEO_PROFILES = {'Baseline', 'Constrained Baseline', 'Main', 'High'}
+PIXEL_FORMATS = {'yuv420p', 'yuvj420p'}
+MAX_GOP_SECONDS = 4.0
+MAX_VIDEO_BITRATE = 3000000  # Same ceiling as the encoder's -maxrate 3000k
+AUDIO_CODECS = {'aac'}
+AUDIO_SAMPLE_RATES = {44100, 48000}
+GOP_SCAN_SECONDS = 30
+
+
+def run_ffprobe(path, ffprobe_path=FFPROBE_PATH):
+    command = [ffprobe_path, '-v', 'error', '-show_streams', '-show_format', '-of', 'json', path]
+    result = subprocess.run(command, capture_output=True, text=True, check=True)
+    data = json.loads(result.stdout)
+    video = next((s for s in data.get('streams', []) if s.get('codec_type') == 'video'), None)
+    audio = next((s for s in data.get('streams', []) if s.get('codec_type') == 'audio'), None)
+    fmt = data.get('format', {})
+    info = {
+        'duration': float(fmt.get('duration') or 0),
+        'format_bit_rate': int(fmt.get('bit_rate') or 0),
+        'video': None,
+        'audio': None,
+    }
+    if video:
+        info['video'] = {
+            'codec': video.get('codec_name'),
+            'profile': video.get('profile'),
+            'pix_fmt': video.get('pix_fmt'),
+            'width': video.get('width'),
+            'height': video.get('height'),
+            'fps': parse_rate(video.get('avg_frame_rate') or video.get('r_frame_rate')),
+            'bit_rate': int(video.get('bit_rate') or 0),
+            'gop_seconds': scan_gop(path, ffprobe_path),
+        }
+    if audio:
+        info['audio'] = {
+            'codec': audio.get('codec_name'),
+            'sample_rate': int(audio.get('sample_rate') or 0),
+            'channels': audio.get('channels'),
+            'bit_rate': int(audio.get('bit_rate') or 0),
+        }
+    return info
+
+
+def parse_rate(rate):
+    try:
+        num, _, den = (rate or '0/1').partition('/')
+        return float(num) / float(den or 1)
+    except (ValueError, ZeroDivisionError):
+        return 0.0
+
+
+def scan_gop(path, ffprobe_path=FFPROBE_PATH):
+    # Packet flags only, so nothing is decoded; the opening seconds are enough
+    # to tell a 2 s GOP from a 10 s one.
+    command = [ffprobe_path, '-v', 'error', '-select_streams', 'v:0', '-read_intervals', f"%+{GOP_SCAN_SECONDS}",
+               '-show_entries', 'packet=pts_time,flags', '-of', 'csv=p=0', path]
+    result = subprocess.run(command, capture_output=True, text=True, check=True)
+    keyframes = []
+    last_pts = 0.0
+    for line in result.stdout.splitlines():
+        pts, _, flags = line.partition(',')
+        try:
+            pts = float(pts)
+        except ValueError:
+            continue
+        last_pts = max(last_pts, pts)
+        if 'K' in flags:
+            keyframes.append(pts)
+    keyframes.sort()
+    if len(keyframes) < 2:
+        return last_pts
+    return max(b - a for a, b in zip(keyframes, keyframes[1:]))
+
+
+probe_cache = FileKeyedCache(PROBE_CACHE_PATH, run_ffprobe)
+
+
+def probe_duration(path, ffprobe_path=FFPROBE_PATH):
+    command = [ffprobe_path, '-v', 'error', '-show_entries', 'format=duration', '-of', 'csv=p=0', path]
+    try:
+        result = subprocess.run(command, capture_output=True, text=True, check=True)
+        return float(result.stdout.strip() or 0)
+    except (OSError, ValueError, subprocess.CalledProcessError):
+        return 0.0
+
+
+def check_compatibility(info):
+    video_problems = []
+    audio_problems = []
+    video = info.get('video')
+    audio = info.get('audio')
+    if not video:
+        video_problems.append("no video stream")
+    else:
+        if video['codec'] not in VIDEO_CODECS:
+            video_problems.append(f"codec {video['codec']}")
+        if video['profile'] not in VIDEO_PROFILES:
+            video_problems.append(f"profile {video['profile']}")
+        if video['pix_fmt'] not in PIXEL_FORMATS:
+            video_problems.append(f"pixel format {video['pix_fmt']}")
+        if not 0 < video['gop_seconds'] <= MAX_GOP_SECONDS:
+            video_problems.append(f"GOP {video['gop_seconds']:.1f}s")
+        bit_rate = video['bit_rate'] or info['format_bit_rate'] - ((audio or {}).get('bit_rate') or 0)
+        if not 0 < bit_rate <= MAX_VIDEO_BITRATE:
+            video_problems.append(f"bitrate {bit_rate // 1000}k")
+    if audio:
+        if audio['codec'] not in AUDIO_CODECS:
+            audio_problems.append(f"codec {audio['codec']}")
+        if audio['sample_rate'] not in AUDIO_SAMPLE_RATES:
+            audio_problems.append(f"sample rate {audio['sample_rate']}")
+    return video_problems, audio_problems
@@ -0,0 +1,82 @@
+import os
+
+# Linux /proc readers; elsewhere they return None and callers carry on without
+try:
+    CLOCK_TICKS = os.sysconf('SC_CLK_TCK')
+    PAGE_SIZE = os.sysconf('SC_PAGE_SIZE')
+except (AttributeError, ValueError, OSError):
+    CLOCK_TICKS = 100
+    PAGE_SIZE = 4096
+
+
+def read_stat(pid):
+    # Fields after the "(comm)" part, which may itself contain spaces
+    with open(f"/proc/{pid}/stat") as f:
+        data = f.read()
+    return data[data.rindex(')') + 2:].split()
+
+
+def cpu_seconds(pid):
+    # User + system time of the process
+    try:
+        fields = read_stat(pid)
+    except (OSError, ValueError):
+        return None
+    return (int(fields[11]) + int(fields[12])) / CLOCK_TICKS
+
+
+def rss_bytes(pid):
+    try:
+        fields = read_stat(pid)
+    except (OSError, ValueError):
+        return None
+    return int(fields[21]) * PAGE_SIZE
+
+
+def system_cpu_times():
+    # (busy, total) jiffies across all cores since boot
+    try:
+        with open('/proc/stat') as f:
+            values = [int(value) for value in f.readline().split()[1:]]
+    except (OSError, ValueError):
+        return None
+    idle = values[3] + (values[4] if len(values) > 4 else 0)
+    return sum(values) - idle, sum(values)
+
+
+def available_cpus():
+    if hasattr(os, 'sched_getaffinity'):
+        return sorted(os.sched_getaffinity(0))
+    return list(range(os.cpu_count() or 1))
+
+
+def set_affinity(pid, cpus):
+    if not hasattr(os, 'sched_setaffinity'):
+        return False
+    try:
+        os.sched_setaffinity(pid, cpus)
+    except OSError:
+        return False
+    return True
+
+
+def process_sample(pid):
+    # (cpu seconds, rss bytes, threads, disk read bytes, disk write bytes),
+    # or None once the process is gone
+    try:
+        fields = read_stat(pid)
+    except (OSError, ValueError):
+        return None
+    read_bytes = write_bytes = 0
+    try:
+        with open(f"/proc/{pid}/io") as f:
+            for line in f:
+                key, _, value = line.partition(':')
+                if key == 'read_bytes':
+                    read_bytes = int(value)
+                elif key == 'write_bytes':
+                    write_bytes = int(value)
+    except (OSError, ValueError):
+        pass  # io needs ptrace access to the process; without it the I/O reads as zero
+    return ((int(fields[11]) + int(fields[12])) / CLOCK_TICKS, int(fields[21]) * PAGE_SIZE, int(fields[17]),
+            read_bytes, write_bytes)
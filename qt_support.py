@@ -0,0 +1,330 @@
+import json
+import os
+import threading
+
+from PyQt5.QtCore import QObject, QPointF, QSize, Qt, QTimer, pyqtSignal
+from PyQt5.QtGui import QColor, QIcon, QImage, QPainter, QPixmap, QPolygonF
+from PyQt5.QtWidgets import (QAbstractItemView, QDialog, QFileDialog, QHBoxLayout, QLabel, QLineEdit, QMenu,
+                             QMessageBox, QPlainTextEdit, QPushButton, QTableWidget, QTableWidgetItem, QVBoxLayout,
+                             QWidget)
+
+from preview import PREVIEW_FPS, PREVIEW_SIZE
+from resources import APP
+
+LOG_VIEW_LINES = 2000
+LOG_VIEW_INTERVAL_MS = 250
+SEARCH_DELAY_MS = 150
+SPARKLINE_POINTS = 60
+SPARKLINE_SIZE = (60, 20)
+
+
+class EngineBridge(QObject):
+    # Engine events arrive on the engine's thread; re-emitting them as a Qt
+    # signal queues them onto the GUI thread. Pass skip=('log',) when a
+    # LogView shows the log, so chatty ffmpeg output doesn't queue a signal per line.
+    event = pyqtSignal(dict)
+
+    def __init__(self, engine, parent=None, skip=()):
+        super().__init__(parent)
+        self.skip = skip
+        engine.subscribe(self.forward)
+
+    def forward(self, event):
+        if event['type'] not in self.skip:
+            self.event.emit(event)
+
+
+class LogView(QPlainTextEdit):
+    # Shows a LogRing. A GUI-thread timer pulls whatever arrived since the
+    # last tick and appends it as one block, so a burst costs one repaint
+    # per tick and the document never holds more than max_lines.
+    def __init__(self, ring, parent=None, max_lines=LOG_VIEW_LINES, interval_ms=LOG_VIEW_INTERVAL_MS):
+        super().__init__(parent)
+        self.ring = ring
+        self.max_lines = max_lines
+        self.seen = 0
+        self.setReadOnly(True)
+        self.setMaximumBlockCount(max_lines)
+        self.timer = QTimer(self)
+        self.timer.timeout.connect(self.flush)
+        self.timer.start(interval_ms)
+
+    def flush(self):
+        lines, self.seen, dropped = self.ring.since(self.seen)
+        if dropped:
+            lines.insert(0, f"... {dropped} earlier lines not shown")
+        if lines:
+            self.appendPlainText('\n'.join(lines[-self.max_lines:]))
+
+
+class PreviewWidget(QLabel):
+    # Shows a PreviewTap. The timer only runs while the widget is visible and
+    # skips ticks with no new frame; the frame goes from the tap's buffer
+    # into a pixmap without an intermediate copy.
+    def __init__(self, tap=None, parent=None):
+        super().__init__(parent)
+        self.tap = tap
+        self.shown = 0
+        self.setAlignment(Qt.AlignCenter)
+        self.setMinimumSize(*PREVIEW_SIZE)
+        self.setStyleSheet('background-color: black;')
+        self.timer = QTimer(self)
+        self.timer.timeout.connect(self.refresh)
+
+    def setTap(self, tap):
+        # Each stream start or preview toggle brings a new tap (None while hidden)
+        self.tap = tap
+        self.shown = 0
+        self.clear()
+
+    def showEvent(self, event):
+        self.timer.start(1000 // (self.tap.fps if self.tap else PREVIEW_FPS))
+        super().showEvent(event)
+
+    def hideEvent(self, event):
+        self.timer.stop()
+        super().hideEvent(event)
+
+    def refresh(self):
+        tap = self.tap
+        if not tap or tap.frames == self.shown:
+            return
+        with tap.frame() as frame:
+            if frame is None:
+                return
+            self.shown = tap.frames
+            image = QImage(frame, tap.width, tap.height, tap.width * 3, QImage.Format_RGB888)
+            # fromImage copies, so the buffer can go back to the tap right after
+            pixmap = QPixmap.fromImage(image)
+        self.setPixmap(pixmap.scaled(self.size(), Qt.KeepAspectRatio, Qt.FastTransformation))
+
+
+class Sparkline(QWidget):
+    # The last few samples of one field of a ResourceSampler series as a
+    # tiny line, scaled to its own peak; the tooltip has the latest value.
+    def __init__(self, label, name, field, unit, parent=None, points=SPARKLINE_POINTS):
+        super().__init__(parent)
+        self.label = label
+        self.name = name
+        self.field = field
+        self.unit = unit
+        self.points = points
+        self.sampler = None
+        self.setFixedSize(*SPARKLINE_SIZE)
+
+    def refresh(self):
+        latest = self.sampler.latest(self.name) if self.sampler else None
+        self.setToolTip(f"{self.label}: {latest[self.field]:.1f}{self.unit}" if latest else f"{self.label}: no data")
+        self.update()
+
+    def paintEvent(self, event):
+        values = self.sampler.sparkline(self.name, self.field, self.points) if self.sampler else []
+        painter = QPainter(self)
+        painter.fillRect(self.rect(), QColor('#202020'))
+        if len(values) > 1:
+            top = max(values) or 1.0
+            height = self.height() - 2
+            step = (self.width() - 1) / (self.points - 1)
+            start = self.points - len(values)
+            painter.setPen(QColor('#4caf50'))
+            painter.drawPolyline(QPolygonF([QPointF((start + index) * step, 1 + height - value / top * height)
+                                            for index, value in enumerate(values)]))
+        painter.end()
+
+
+class ResourceSparklines(QWidget):
+    # CPU and memory of one stream's ffmpeg, and the app's own CPU, for next
+    # to the status light. Redrawn once per sample while visible;
+    # right-click exports the whole history.
+    def __init__(self, name, parent=None):
+        super().__init__(parent)
+        self.sampler = None
+        self.lines = [Sparkline('ffmpeg CPU', name, 'cpu', '%', self),
+                      Sparkline('ffmpeg memory', name, 'rss_mb', ' MB', self),
+                      Sparkline('App CPU', APP, 'cpu', '%', self)]
+        layout = QHBoxLayout()
+        layout.setContentsMargins(0, 0, 0, 0)
+        for line in self.lines:
+            layout.addWidget(line)
+        self.setLayout(layout)
+        self.timer = QTimer(self)
+        self.timer.timeout.connect(self.refresh)
+
+    def setSampler(self, sampler):
+        self.sampler = sampler
+        for line in self.lines:
+            line.sampler = sampler
+        self.timer.setInterval(int(sampler.interval * 1000))
+        if self.isVisible():
+            self.timer.start()
+
+    def showEvent(self, event):
+        if self.sampler:
+            self.timer.start()
+        super().showEvent(event)
+
+    def hideEvent(self, event):
+        self.timer.stop()
+        super().hideEvent(event)
+
+    def refresh(self):
+        for line in self.lines:
+            line.refresh()
+
+    def contextMenuEvent(self, event):
+        menu = QMenu(self)
+        export = menu.addAction('Export resource history...')
+        if self.sampler and menu.exec_(event.globalPos()) == export:
+            path, _ = QFileDialog.getSaveFileName(self, 'Export Resource History', 'resources.csv',
+                                                  'CSV Files (*.csv);;JSON Files (*.json)')
+            if path:
+                self.sampler.export(path)
+
+
+class LibraryDialog(QDialog):
+    # Pick a video from the media library by name. Search results come
+    # straight from SQLite; rescans run on a worker thread and report back
+    # through signals. "Browse File..." is still there for one-off files.
+    progressed = pyqtSignal(int, int)
+    scanned = pyqtSignal(dict)
+
+    def __init__(self, library=None, parent=None):
+        from media_library import MediaLibrary
+
+        super().__init__(parent)
+        self.library = library or MediaLibrary()
+        self.path = None
+        self.entries = []
+        self.setWindowTitle('Media Library')
+        self.resize(900, 600)
+
+        self.search_input = QLineEdit(self)
+        self.search_input.setPlaceholderText('Search by file name')
+        self.search_timer = QTimer(self)
+        self.search_timer.setSingleShot(True)
+        self.search_timer.setInterval(SEARCH_DELAY_MS)
+        self.search_timer.timeout.connect(self.refresh)
+        self.search_input.textChanged.connect(self.search_timer.start)
+
+        self.results = QTableWidget(0, 3, self)
+        self.results.setHorizontalHeaderLabels(['File', 'Details', 'Folder'])
+        self.results.setIconSize(QSize(80, 45))
+        self.results.setSelectionBehavior(QAbstractItemView.SelectRows)
+        self.results.setSelectionMode(QAbstractItemView.SingleSelection)
+        self.results.setEditTriggers(QAbstractItemView.NoEditTriggers)
+        self.results.horizontalHeader().setStretchLastSection(True)
+        self.results.doubleClicked.connect(self.choose)
+
+        self.status = QLabel(self)
+        self.add_btn = QPushButton('Add Folder...', self)
+        self.add_btn.clicked.connect(self.addFolder)
+        self.rescan_btn = QPushButton('Rescan', self)
+        self.rescan_btn.clicked.connect(self.rescan)
+        self.browse_btn = QPushButton('Browse File...', self)
+        self.browse_btn.clicked.connect(self.browse)
+        self.select_btn = QPushButton('Select', self)
+        self.select_btn.clicked.connect(self.choose)
+
+        buttons = QHBoxLayout()
+        for button in (self.add_btn, self.rescan_btn, self.browse_btn):
+            buttons.addWidget(button)
+        buttons.addStretch(1)
+        buttons.addWidget(self.select_btn)
+        layout = QVBoxLayout()
+        layout.addWidget(self.search_input)
+        layout.addWidget(self.results)
+        layout.addWidget(self.status)
+        layout.addLayout(buttons)
+        self.setLayout(layout)
+
+        self.progressed.connect(self.onProgress)
+        self.scanned.connect(self.onScanned)
+        self.refresh()
+
+    def refresh(self):
+        from media_library import describe
+
+        self.entries = self.library.search(self.search_input.text())
+        self.results.setRowCount(len(self.entries))
+        for row, entry in enumerate(self.entries):
+            name = QTableWidgetItem(os.path.basename(entry['path']))
+            if entry['thumbnail'] and os.path.exists(entry['thumbnail']):
+                name.setIcon(QIcon(entry['thumbnail']))
+            details = QTableWidgetItem(describe(entry))
+            if entry['error']:
+                details.setForeground(QColor('red'))
+            self.results.setItem(row, 0, name)
+            self.results.setItem(row, 1, details)
+            self.results.setItem(row, 2, QTableWidgetItem(os.path.dirname(entry['path'])))
+        self.results.resizeColumnsToContents()
+        roots = self.library.roots()
+        if not roots:
+            self.status.setText('No folders yet: use "Add Folder..." to index your videos.')
+        else:
+            self.status.setText(f"{len(self.entries)} shown of {self.library.count()} in {len(roots)} folder(s)")
+
+    def addFolder(self):
+        folder = QFileDialog.getExistingDirectory(self, "Add Media Folder")
+        if folder:
+            self.library.add_root(folder)
+            self.rescan()
+
+    def rescan(self):
+        self.rescan_btn.setEnabled(False)
+        self.add_btn.setEnabled(False)
+        self.status.setText('Scanning...')
+        threading.Thread(target=self.runScan, name='library-scan', daemon=True).start()
+
+    def runScan(self):
+        try:
+            stats = self.library.scan(progress=self.progressed.emit)
+        except Exception as e:
+            stats = {'error': f"{type(e).__name__}: {e}"}
+        self.scanned.emit(stats)
+
+    def onProgress(self, done, total):
+        self.status.setText(f"Indexing {done}/{total}...")
+
+    def onScanned(self, stats):
+        self.rescan_btn.setEnabled(True)
+        self.add_btn.setEnabled(True)
+        self.refresh()
+        if 'error' in stats:
+            self.status.setText(f"Scan failed: {stats['error']}")
+        else:
+            self.status.setText(f"{stats['files']} files, {stats['indexed']} indexed, {stats['removed']} removed, "
+                                f"{stats['failed']} unreadable ({stats['seconds']:.1f}s)")
+
+    def browse(self):
+        options = QFileDialog.Options()
+        path, _ = QFileDialog.getOpenFileName(self, "Select Video File", "", "All Files (*);;MP4 Files (*.mp4)",
+                                              options=options)
+        if path:
+            self.path = path
+            self.accept()
+
+    def choose(self):
+        from file_cache import file_key
+        from probe import probe_cache
+
+        row = self.results.currentRow()
+        if row < 0:
+            return
+        entry = self.entries[row]
+        if entry['error'] and QMessageBox.question(
+                self, "Unreadable file", f"ffprobe couldn't read this file ({entry['error']}). Use it anyway?"
+        ) != QMessageBox.Yes:
+            return
+        # The library already probed it; spare the stream start a second probe
+        try:
+            if entry['info'] and file_key(entry['path']).endswith(f"|{entry['size']}|{entry['mtime_ns']}"):
+                probe_cache.put(entry['path'], json.loads(entry['info']))
+        except OSError:
+            pass
+        self.path = entry['path']
+        self.accept()
+
+    @classmethod
+    def pick(cls, parent=None):
+        dialog = cls(parent=parent)
+        return dialog.path if dialog.exec_() == QDialog.Accepted else None
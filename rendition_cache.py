@@ -0,0 +1,130 @@
+import hashlib
+import json
+import os
+import threading
+import time
+
+from config import DATA_DIR
+from file_cache import file_identity
+
+RENDITION_DIR = os.path.join(DATA_DIR, 'renditions')
+RENDITION_BUDGET = int(os.environ.get('RENDITION_CACHE_BUDGET_MB', '20480')) * 1024 * 1024
+RECENCY_SAVE_INTERVAL = 600   # hits only update memory; the index is written with the next commit, or this often
+
+
+def rendition_key(video_path, encode_args, ticker_path=None):
+    # Looked up on every stream start, so the files are told apart by inode,
+    # size and mtime rather than by reading them through a hash
+    parts = {
+        'source': file_identity(video_path),
+        'args': list(encode_args),
+        'ticker': file_identity(ticker_path) if ticker_path else None,
+    }
+    return hashlib.sha256(json.dumps(parts, sort_keys=True).encode()).hexdigest()
+
+
+class RenditionCache:
+    # YouTube-ready FLV renditions of aired files, evicted least recently used
+    # first once the directory goes over its disk budget.
+    def __init__(self, directory=RENDITION_DIR, budget=RENDITION_BUDGET):
+        self.directory = directory
+        self.budget = budget
+        self.index_path = os.path.join(directory, 'index.json')
+        self.lock = threading.Lock()
+        self.index = None
+        self.saved_at = time.monotonic()
+        self.hits = 0
+        self.misses = 0
+        self.bytes_served = 0
+
+    def load(self):
+        if self.index is None:
+            try:
+                with open(self.index_path) as f:
+                    self.index = json.load(f)
+            except (OSError, ValueError):
+                self.index = {}
+            # Forget entries whose file was removed behind our back
+            for key in [k for k, entry in self.index.items() if not os.path.exists(self.file_path(k))]:
+                del self.index[key]
+        return self.index
+
+    def save(self):
+        os.makedirs(self.directory, exist_ok=True)
+        tmp_path = f"{self.index_path}.tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump(self.index, f)
+        os.replace(tmp_path, self.index_path)
+        self.saved_at = time.monotonic()
+
+    def file_path(self, key):
+        return os.path.join(self.directory, f"{key}.flv")
+
+    def contains(self, key):
+        with self.lock:
+            return key in self.load()
+
+    def lookup(self, key):
+        with self.lock:
+            entry = self.load().get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            # A hit is on the stream-start path: no index rewrite just for the recency
+            entry['last_used'] = time.time()
+            self.hits += 1
+            self.bytes_served += entry['size']
+            if time.monotonic() - self.saved_at > RECENCY_SAVE_INTERVAL:
+                try:
+                    self.save()
+                except OSError:
+                    pass
+            return self.file_path(key)
+
+    def recording_path(self, key):
+        os.makedirs(self.directory, exist_ok=True)
+        return os.path.join(self.directory, f"{key}.{os.getpid()}.{threading.get_ident()}.partial.flv")
+
+    def commit(self, key, recorded_path, source=None):
+        size = os.path.getsize(recorded_path)
+        if size > self.budget:
+            os.remove(recorded_path)
+            return None
+        with self.lock:
+            os.replace(recorded_path, self.file_path(key))
+            self.load()[key] = {'size': size, 'last_used': time.time(), 'source': source}
+            self.evict()
+            self.save()
+        return self.file_path(key)
+
+    def discard(self, recorded_path):
+        try:
+            os.remove(recorded_path)
+        except OSError:
+            pass
+
+    def evict(self):
+        entries = sorted(self.index.items(), key=lambda item: item[1]['last_used'])
+        total = sum(entry['size'] for _, entry in entries)
+        for key, entry in entries:
+            if total <= self.budget:
+                break
+            try:
+                os.remove(self.file_path(key))
+            except OSError:
+                pass
+            total -= entry['size']
+            del self.index[key]
+
+    def total_size(self):
+        with self.lock:
+            return sum(entry['size'] for entry in self.load().values())
+
+    def stats_message(self):
+        mb = 1024 * 1024
+        return (f"Rendition cache: {self.hits} hits / {self.misses} misses, "
+                f"{self.bytes_served / mb:.1f} MB served, "
+                f"{self.total_size() / mb:.1f} of {self.budget / mb:.0f} MB used")
+
+
+rendition_cache = RenditionCache()
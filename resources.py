@@ -0,0 +1,176 @@
+import csv
+import json
+import os
+import threading
+import time
+from array import array
+
+from procfs import process_sample
+from telemetry import MetricsRing
+
+SAMPLE_INTERVAL = 2.0
+FIELDS = ('time', 'cpu', 'rss_mb', 'threads', 'read_kbps', 'write_kbps')
+# (capacity, samples of the tier before averaged into one): at the default
+# interval, 2 s samples for 20 minutes, 1 minute for a day, 15 minutes for a month
+TIERS = ((600, 1), (1440, 30), (2976, 15))
+APP = 'app'
+
+
+class ResourceSeries:
+    # A MetricsRing per resolution. Every `factor` samples of one tier are
+    # averaged into one sample of the next, so months of history stay a few
+    # hundred kB of arrays and appending never allocates.
+    def __init__(self, tiers=TIERS):
+        self.rings = [MetricsRing(capacity, FIELDS) for capacity, _ in tiers]
+        self.factors = [factor for _, factor in tiers]
+        self.sums = [array('d', bytes(8 * len(FIELDS))) for _ in tiers]
+        self.pending = [0] * len(tiers)
+
+    def append(self, values, tier=0):
+        self.rings[tier].append(values)
+        tier += 1
+        if tier == len(self.rings):
+            return
+        sums = self.sums[tier]
+        for index, field in enumerate(FIELDS):
+            sums[index] += values[field]
+        self.pending[tier] += 1
+        if self.pending[tier] == self.factors[tier]:
+            averaged = {field: sums[index] / self.factors[tier] for index, field in enumerate(FIELDS)}
+            averaged['time'] = values['time']
+            for index in range(len(FIELDS)):
+                sums[index] = 0.0
+            self.pending[tier] = 0
+            self.append(averaged, tier)
+
+    def series(self, field, limit=None, tier=0):
+        return self.rings[tier].series(field, limit)
+
+    def latest(self):
+        return self.rings[0].latest()
+
+    def rows(self, tier=0):
+        ring = self.rings[tier]
+        return [dict(zip(FIELDS, values)) for values in zip(*(ring.series(field) for field in FIELDS))]
+
+
+class ResourceSampler:
+    # Reads /proc for each source's processes every interval on its own
+    # thread. sources() returns {name: [pids]}; a stream's ffmpeg and its
+    # playlist encoder add up to one series. Rates need two readings of the
+    # same processes, so a restarted ffmpeg starts a fresh baseline. On
+    # systems without /proc nothing is recorded.
+    def __init__(self, sources, interval=SAMPLE_INTERVAL, tiers=TIERS):
+        self.sources = sources
+        self.interval = interval
+        self.tiers = tiers
+        self.series = {}
+        self.previous = {}
+        self.lock = threading.Lock()
+        self.stop_event = threading.Event()
+        self.thread = None
+        self.started_at = None
+        self.cpu_used = 0.0
+
+    def start(self):
+        self.started_at = time.monotonic()
+        self.thread = threading.Thread(target=self.run, name='resource-sampler', daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.stop_event.set()
+
+    def run(self):
+        while not self.stop_event.wait(self.interval):
+            self.sample()
+
+    def sample(self):
+        begun = time.thread_time()
+        now = time.time()
+        for name, pids in self.sources().items():
+            totals = [0.0] * 5
+            found = []
+            for pid in pids:
+                reading = process_sample(pid)
+                if reading:
+                    found.append(pid)
+                    for index, value in enumerate(reading):
+                        totals[index] += value
+            if not found:
+                continue
+            last = self.previous.get(name)
+            self.previous[name] = (now, found, totals)
+            if not last or last[1] != found:
+                continue
+            elapsed = now - last[0]
+            before = last[2]
+            values = {
+                'time': now,
+                'cpu': (totals[0] - before[0]) / elapsed * 100,   # percent of one core
+                'rss_mb': totals[1] / 1e6,
+                'threads': totals[2],
+                'read_kbps': (totals[3] - before[3]) * 8 / 1000 / elapsed,
+                'write_kbps': (totals[4] - before[4]) * 8 / 1000 / elapsed,
+            }
+            with self.lock:
+                if name not in self.series:
+                    self.series[name] = ResourceSeries(self.tiers)
+                self.series[name].append(values)
+        self.cpu_used += time.thread_time() - begun
+
+    def overhead(self):
+        # The sampler thread's own CPU use, in percent of one core
+        if not self.started_at:
+            return 0.0
+        return self.cpu_used / max(time.monotonic() - self.started_at, 1e-9) * 100
+
+    def latest(self, name):
+        with self.lock:
+            series = self.series.get(name)
+            return series.latest() if series else None
+
+    def sparkline(self, name, field, points):
+        with self.lock:
+            series = self.series.get(name)
+            return series.series(field, points) if series else []
+
+    def to_dict(self):
+        # Every tier of every source, keyed by the tier's sample spacing in seconds
+        result = {}
+        with self.lock:
+            for name, series in self.series.items():
+                spacing = self.interval
+                tiers = {}
+                for tier, factor in enumerate(series.factors):
+                    spacing *= factor
+                    tiers[f"{spacing:g}"] = series.rows(tier)
+                result[name] = tiers
+        return result
+
+    def export(self, path):
+        # .json keeps the nesting; anything else is one CSV row per sample
+        data = self.to_dict()
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, 'w', newline='') as f:
+            if path.lower().endswith('.json'):
+                json.dump({'interval': self.interval, 'sources': data}, f)
+            else:
+                writer = csv.writer(f)
+                writer.writerow(('source', 'spacing_seconds') + FIELDS)
+                for name, tiers in data.items():
+                    for spacing, rows in tiers.items():
+                        writer.writerows((name, spacing) + tuple(row[field] for field in FIELDS) for row in rows)
+        os.replace(tmp_path, path)
+
+
+def engine_sources(engine, app=True):
+    # The engine's running streams plus, unless app=False, this process
+    def sources():
+        found = {APP: [os.getpid()]} if app else {}
+        for name, stream in list(engine.streams.items()):
+            pids = stream.pids()
+            if pids:
+                found[name] = pids
+        return found
+    return sources
@@ -0,0 +1,432 @@
+import heapq
+import itertools
+import json
+import os
+import queue
+import socket
+import subprocess
+import threading
+import time
+import uuid
+from urllib.parse import urlparse
+
+from config import DATA_DIR
+from stream_engine import FAILED as STREAM_FAILED
+
+SCHEDULE_PATH = os.path.join(DATA_DIR, 'schedule.json')
+PREFLIGHT_LEAD = 15 * 60   # probe and check the ingest this long before a slot
+WARM_LEAD = 30             # plan and dry-run the stream this long before a slot
+GRACE_SECONDS = 60         # later than this counts as a missed start
+MAX_SLEEP = 300            # re-check the clock now and then in case it jumped (suspend, NTP)
+HISTORY_SECONDS = 7 * 24 * 3600
+
+PENDING = 'pending'
+PREFLIGHT = 'preflight'
+STARTED = 'started'
+WARM = 'warm'   # a heap action only; the job stays pending meanwhile
+MISSED = 'missed'
+FAILED = 'failed'
+CANCELLED = 'cancelled'
+
+WAITING_STATES = (PENDING, PREFLIGHT)
+
+# What to do with a slot whose start time passed while we weren't running
+SKIP = 'skip'    # mark it missed
+RUN = 'run'      # start it now from the beginning
+JOIN = 'join'    # start it now at the point it would have reached, like a TV schedule
+CATCH_UP_POLICIES = (SKIP, RUN, JOIN)
+
+RTMP_PORT = 1935
+
+
+class ScheduledJob:
+    def __init__(self, start_at, video_path, urls, ticker_path=None, ticker_text='', name='main', catch_up=JOIN,
+                 job_id=None, status=PENDING, error=None, in_point=0.0, out_point=None):
+        # in_point/out_point: seconds into the file, to air a clip of it
+        if catch_up not in CATCH_UP_POLICIES:
+            raise ValueError(f"Unknown catch-up policy {catch_up!r}")
+        if out_point is not None and out_point <= in_point:
+            raise ValueError(f"Out point {out_point:g}s isn't after the in point {in_point:g}s")
+        self.id = job_id or uuid.uuid4().hex[:12]
+        self.start_at = start_at
+        self.video_path = video_path
+        self.urls = list(urls)
+        self.ticker_path = ticker_path
+        self.ticker_text = ticker_text
+        self.name = name
+        self.catch_up = catch_up
+        self.in_point = in_point
+        self.out_point = out_point
+        self.status = status
+        self.error = error
+        self.preencode = None
+        self.text_ticker = None
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(data['start_at'], data['video_path'], data['urls'], data.get('ticker_path'),
+                   data.get('ticker_text', ''), data.get('name', 'main'), data.get('catch_up', JOIN),
+                   data['id'], data.get('status', PENDING), data.get('error'), data.get('in_point', 0.0),
+                   data.get('out_point'))
+
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'start_at': self.start_at,
+            'video_path': self.video_path,
+            'urls': self.urls,
+            'ticker_path': self.ticker_path,
+            'ticker_text': self.ticker_text,
+            'name': self.name,
+            'catch_up': self.catch_up,
+            'in_point': self.in_point,
+            'out_point': self.out_point,
+            'status': self.status,
+            'error': self.error,
+        }
+
+    def describe(self):
+        when = time.strftime('%Y-%m-%d %H:%M', time.localtime(self.start_at))
+        text = f"{when} {os.path.basename(self.video_path)}"
+        if self.in_point or self.out_point:
+            text += f" {clock(self.in_point)}-{clock(self.out_point) if self.out_point else 'end'}"
+        text += f" [{self.status}]"
+        return f"{text}: {self.error}" if self.error else text
+
+
+def clock(seconds):
+    minutes, seconds = divmod(int(seconds), 60)
+    return f"{minutes // 60}:{minutes % 60:02}:{seconds:02}"
+
+
+def parse_clock(text):
+    # "1:20:00", "80:00" or plain seconds
+    seconds = 0.0
+    for part in text.strip().split(':'):
+        seconds = seconds * 60 + float(part)
+    return seconds
+
+
+def parse_clip(text):
+    # "START" or "START-END" as (in_point, out_point); empty airs the whole file
+    start, _, end = (text or '').partition('-')
+    return parse_clock(start) if start.strip() else 0.0, parse_clock(end) if end.strip() else None
+
+
+def warm_up(urls, timeout=5):
+    # Resolve and connect to every ingest ahead of time; returns the problems
+    problems = []
+    for url in urls:
+        parsed = urlparse(url)
+        if not parsed.hostname:
+            continue
+        try:
+            socket.create_connection((parsed.hostname, parsed.port or RTMP_PORT), timeout).close()
+        except OSError as e:
+            problems.append(f"{parsed.hostname}: {e}")
+    return problems
+
+
+def progress_logger(log):
+    # Log pre-encode state changes and every tenth of progress, not every chunk
+    logged = []
+
+    def report(preencode):
+        step = (preencode.state, int(preencode.progress * 10))
+        if not logged or step != logged[-1]:
+            logged.append(step)
+            log(preencode.describe())
+    return report
+
+
+def preflight(job, log):
+    # Default pre-flight: warm the probe cache, check the ingest, measure the
+    # loudness (so the airing gets corrected), index the keyframes (so a clip
+    # or a late join opens at once)
+    from keyframes import ensure
+    from loudness import analyze
+    from probe import probe_cache
+
+    try:
+        probe_cache.get(job.video_path)
+    except (OSError, ValueError, subprocess.CalledProcessError) as e:
+        log(f"Pre-flight probe of {job.video_path} failed: {e}")
+    for problem in warm_up(job.urls):
+        log(f"Pre-flight: can't reach {problem}")
+    if analyze([job.video_path], workers=1)['failed']:
+        log(f"Pre-flight: couldn't measure the loudness of {job.video_path}, airing it as it is")
+    if ensure([job.video_path])['failed']:
+        log(f"Pre-flight: couldn't index the keyframes of {job.video_path}, a mid-file start will seek slowly")
+
+
+def preencode(job, log):
+    # Default pre-encode, run as soon as the slot is added: the whole file into
+    # the rendition cache. A live text ticker can't come from a pre-encoded
+    # rendition, and a clip doesn't air the whole one.
+    from loudness import analyze
+    from preencode import PreencodeJob
+
+    if job.ticker_text or job.in_point or job.out_point:
+        return None
+    # The loudness correction is part of the encode, so it's measured first
+    analyze([job.video_path], workers=1)
+    return PreencodeJob(job.video_path, job.ticker_path, on_progress=progress_logger(log))
+
+
+class Scheduler:
+    # Jobs sit in a heap of (deadline, seq, action, job id); the worker thread
+    # sleeps on a condition until the earliest deadline or until the schedule
+    # changes. Jobs are saved on every change so a restart picks them up.
+    # Pre-encodes run on a second thread, one at a time, soonest slot first.
+    def __init__(self, engine, path=SCHEDULE_PATH, lead=PREFLIGHT_LEAD, grace=GRACE_SECONDS, preflight=preflight,
+                 ticker_factory=None, warm_lead=WARM_LEAD, manager=None, preencode=preencode):
+        self.engine = engine
+        # With a channel manager, slots go through its admission like any other start
+        self.manager = manager
+        self.path = path
+        self.lead = lead
+        self.warm_lead = warm_lead
+        self.grace = grace
+        self.preflight = preflight
+        self.preencode = preencode
+        self.preencodes = queue.PriorityQueue()
+        self.ticker_factory = ticker_factory
+        self.jobs = {}
+        self.heap = []
+        self.seq = itertools.count()
+        self.condition = threading.Condition()
+        self.listeners = []
+        self.running = False
+        self.thread = None
+
+    def subscribe(self, callback):
+        self.listeners.append(callback)
+
+    def unsubscribe(self, callback):
+        if callback in self.listeners:
+            self.listeners.remove(callback)
+
+    def emit(self, event_type, job, **data):
+        event = {'type': event_type, 'stream': job.name, 'job': job.to_dict(), 'time': time.time()}
+        event.update(data)
+        for callback in list(self.listeners):
+            callback(event)
+
+    def log(self, job, message):
+        self.emit('log', job, message=message)
+
+    def load(self):
+        try:
+            with open(self.path) as f:
+                entries = json.load(f)
+        except (OSError, ValueError):
+            entries = []
+        cutoff = time.time() - HISTORY_SECONDS
+        with self.condition:
+            for entry in entries:
+                job = ScheduledJob.from_dict(entry)
+                if job.status in WAITING_STATES:
+                    # A pre-flight that was interrupted is simply redone
+                    job.status = PENDING
+                    self.push(job)
+                    self.queue_preencode(job)
+                elif job.start_at < cutoff:
+                    continue
+                self.jobs[job.id] = job
+        return self
+
+    def save(self):
+        with self.condition:
+            entries = [job.to_dict() for job in self.jobs.values()]
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            tmp_path = f"{self.path}.tmp"
+            with open(tmp_path, 'w') as f:
+                json.dump(entries, f, indent=1)
+            os.replace(tmp_path, self.path)
+
+    def push(self, job):
+        now = time.time()
+        if job.start_at > now:
+            heapq.heappush(self.heap, (max(job.start_at - self.lead, now), next(self.seq), PREFLIGHT, job.id))
+            if self.warm_lead:
+                heapq.heappush(self.heap, (max(job.start_at - self.warm_lead, now), next(self.seq), WARM, job.id))
+        heapq.heappush(self.heap, (job.start_at, next(self.seq), STARTED, job.id))
+
+    def queue_preencode(self, job):
+        self.preencodes.put((job.start_at, next(self.seq), job.id))
+
+    def add(self, job):
+        with self.condition:
+            self.jobs[job.id] = job
+            self.push(job)
+            self.condition.notify()
+        self.queue_preencode(job)
+        self.save()
+        self.emit('job', job)
+        return job
+
+    def cancel(self, job_id):
+        with self.condition:
+            job = self.jobs[job_id]
+            if job.status not in WAITING_STATES:
+                return job
+            # The heap entries stay behind and are skipped when they come up
+            job.status = CANCELLED
+            self.condition.notify()
+        if job.preencode:
+            job.preencode.cancel()
+        self.save()
+        self.emit('job', job)
+        return job
+
+    def upcoming(self):
+        with self.condition:
+            return sorted((job for job in self.jobs.values() if job.status in WAITING_STATES),
+                          key=lambda job: job.start_at)
+
+    def start(self):
+        self.running = True
+        self.thread = threading.Thread(target=self.run, name='scheduler', daemon=True)
+        self.thread.start()
+        threading.Thread(target=self.run_preencodes, name='preencode', daemon=True).start()
+        return self
+
+    def stop(self):
+        with self.condition:
+            self.running = False
+            self.condition.notify()
+        self.preencodes.put((float('-inf'), next(self.seq), None))
+
+    def run(self):
+        while True:
+            with self.condition:
+                due = []
+                while self.running:
+                    now = time.time()
+                    due = self.pop_due(now)
+                    if due:
+                        break
+                    timeout = min(self.heap[0][0] - now, MAX_SLEEP) if self.heap else MAX_SLEEP
+                    self.condition.wait(timeout)
+                if not self.running:
+                    return
+            self.dispatch(due, now)
+
+    def run_preencodes(self):
+        # Each pre-encode already uses every core, so they don't run side by side
+        while True:
+            _, _, job_id = self.preencodes.get()
+            if job_id is None:
+                return
+            job = self.jobs.get(job_id)
+            if not job or job.status not in WAITING_STATES:
+                continue
+            try:
+                job.preencode = self.preencode(job, lambda message, job=job: self.log(job, message))
+                # Cancelled or started while the loudness was measured
+                if job.preencode and job.status in WAITING_STATES:
+                    job.preencode.run()
+            except Exception as e:
+                self.log(job, f"Pre-encode failed: {type(e).__name__}: {e}")
+
+    def pop_due(self, now):
+        # Caller holds the condition
+        due = []
+        while self.heap and self.heap[0][0] <= now:
+            due.append(heapq.heappop(self.heap))
+        return due
+
+    def dispatch(self, due, now):
+        for _, _, action, job_id in due:
+            job = self.jobs.get(job_id)
+            if job and job.status in WAITING_STATES:
+                try:
+                    if action == PREFLIGHT:
+                        self.run_preflight(job)
+                    elif action == WARM:
+                        self.run_warm_up(job)
+                    else:
+                        self.fire(job, now)
+                except Exception as e:
+                    # One broken slot must not end the thread every other slot waits on
+                    self.fail(job, action, e)
+
+    def fail(self, job, action, error):
+        message = f"{action} failed: {type(error).__name__}: {error}"
+        self.log(job, message)
+        try:
+            self.finish(job, FAILED, message)
+        except OSError as e:
+            self.log(job, f"Couldn't save the schedule: {e}")
+
+    def run_preflight(self, job):
+        job.status = PREFLIGHT
+        self.emit('job', job)
+        self.log(job, f"Pre-flight for {job.describe()}")
+        # Off the scheduler thread so a slow probe can't delay another slot
+        threading.Thread(target=self.preflight, args=(job, lambda message: self.log(job, message)),
+                         daemon=True).start()
+
+    def run_warm_up(self, job):
+        # The engine plans and dry-runs the stream now, so the start only spawns ffmpeg
+        if job.ticker_text and self.ticker_factory:
+            job.text_ticker = self.ticker_factory(job.ticker_text)
+        starter = self.manager or self.engine
+        future = self.engine.submit(starter.prewarm(job.name, job.video_path, job.urls,
+                                                    ticker_path=job.ticker_path, text_ticker=job.text_ticker,
+                                                    start_offset=job.in_point, end_at=job.out_point))
+        future.add_done_callback(lambda future: self.warmed(job, future))
+
+    def warmed(self, job, future):
+        if not future.cancelled() and future.exception():
+            self.log(job, f"Warm-up failed, the start will plan from scratch: {future.exception()}")
+
+    def fire(self, job, now):
+        from probe import probe_duration
+
+        late = now - job.start_at
+        offset = job.in_point
+        if late > self.grace:
+            if job.catch_up == SKIP:
+                return self.finish(job, MISSED, f"missed by {late:.0f}s")
+            if job.catch_up == JOIN:
+                offset += late
+                try:
+                    duration = job.out_point or probe_duration(job.video_path)
+                except (OSError, ValueError, subprocess.CalledProcessError):
+                    duration = 0
+                if duration and offset >= duration:
+                    return self.finish(job, MISSED, f"missed by {late:.0f}s, the slot is already over")
+            joining = f", joining at {offset:.0f}s" if offset > job.in_point else ""
+            self.log(job, f"Starting {late:.0f}s late{joining}")
+        if job.preencode and job.preencode.running:
+            # Not ready in time; free the cores for the live encode
+            job.preencode.cancel()
+            self.log(job, "Pre-encode not finished, encoding live instead.")
+        text_ticker = job.text_ticker
+        if not text_ticker and job.ticker_text and self.ticker_factory:
+            text_ticker = self.ticker_factory(job.ticker_text)
+        job.status = STARTED
+        self.save()
+        self.emit('job', job)
+        starter = self.manager or self.engine
+        future = self.engine.submit(starter.start(job.name, job.video_path, job.urls, ticker_path=job.ticker_path,
+                                                  text_ticker=text_ticker, start_offset=offset, end_at=job.out_point))
+        future.add_done_callback(lambda future: self.started(job, future))
+
+    def started(self, job, future):
+        try:
+            status = future.result()
+        except Exception as e:  # EngineError when the stream name is still busy
+            return self.finish(job, FAILED, str(e))
+        if status['state'] == STREAM_FAILED:
+            self.finish(job, FAILED, status['error'])
+        elif status['state'] == 'queued':
+            self.log(job, f"Queued by the channel manager: {status['reason']}")
+
+    def finish(self, job, status, error=None):
+        job.status = status
+        job.error = error
+        self.save()
+        self.emit('job', job)
+        self.log(job, job.describe())
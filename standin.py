@@ -0,0 +1,243 @@
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+from config import FFMPEG_PATH
+from stream_command import plan_stream
+
+# The RTMP handshake and the connect/publish commands stay well under this,
+# so the upload crossing it means audio and video are on their way
+MEDIA_AFTER_BYTES = 16384
+
+
+class StandInListener:
+    # A local ingest that accepts one publisher, like YouTube's RTMP endpoint
+    # would, and records what arrives so a stream can be checked offline.
+    def __init__(self, port, scheme='rtmp', key='standin', output_path=None, ffmpeg_path=FFMPEG_PATH):
+        self.port = port
+        self.scheme = scheme
+        self.key = key
+        self.output_path = output_path
+        self.ffmpeg_path = ffmpeg_path
+        self.process = None
+
+    @property
+    def url(self):
+        if self.scheme == 'rtmp':
+            return f"rtmp://127.0.0.1:{self.port}/live/{self.key}"
+        return f"tcp://127.0.0.1:{self.port}"
+
+    def start(self):
+        if self.scheme == 'rtmp':
+            source = ['-listen', '1', '-f', 'flv', '-i', self.url]
+        else:
+            source = ['-f', 'flv', '-i', f"{self.url}?listen=1"]
+        if self.output_path:
+            sink = ['-c', 'copy', '-f', 'flv', '-y', self.output_path]
+        else:
+            sink = ['-c', 'copy', '-f', 'null', '-']
+        command = [self.ffmpeg_path, '-hide_banner', '-loglevel', 'error'] + source + sink
+        self.process = subprocess.Popen(command)
+        # Give the listener a moment to bind before a publisher connects
+        time.sleep(0.5)
+        return self
+
+    def stop(self):
+        if self.process:
+            self.process.terminate()
+            try:
+                self.process.wait(5)
+            except subprocess.TimeoutExpired:
+                self.process.kill()
+            self.process = None
+
+    def received_bytes(self):
+        if self.output_path and os.path.exists(self.output_path):
+            return os.path.getsize(self.output_path)
+        return 0
+
+
+class ThrottledProxy:
+    # TCP relay in front of a stand-in listener that caps the publisher's
+    # upload rate, to play a congested uplink. The rate can be changed while
+    # a stream is running; None forwards at full speed.
+    def __init__(self, listener, port, rate_kbps=None, burst_seconds=0.25):
+        self.listener = listener
+        self.port = port
+        self.rate_kbps = rate_kbps
+        self.burst_seconds = burst_seconds
+        self.server = None
+        self.running = False
+        self.send_at = 0.0
+        self.bytes_forwarded = 0
+        self.first_byte_time = None
+        self.first_media_time = None
+
+    @property
+    def url(self):
+        return self.listener.url.replace(f":{self.listener.port}", f":{self.port}", 1)
+
+    def set_rate(self, rate_kbps):
+        self.rate_kbps = rate_kbps
+
+    def start(self):
+        self.server = socket.create_server(('127.0.0.1', self.port))
+        self.running = True
+        threading.Thread(target=self.accept_loop, daemon=True).start()
+        return self
+
+    def stop(self):
+        self.running = False
+        if self.server:
+            self.server.close()
+            self.server = None
+
+    def accept_loop(self):
+        while self.running:
+            try:
+                client, _ = self.server.accept()
+            except OSError:
+                return
+            try:
+                upstream = socket.create_connection(('127.0.0.1', self.listener.port))
+            except OSError:
+                client.close()
+                continue
+            threading.Thread(target=self.pump, args=(client, upstream, True), daemon=True).start()
+            threading.Thread(target=self.pump, args=(upstream, client, False), daemon=True).start()
+
+    def pump(self, source, target, throttled):
+        try:
+            while self.running:
+                data = source.recv(16384)
+                if not data:
+                    break
+                if throttled:
+                    self.throttle(len(data))
+                    if self.first_byte_time is None:
+                        self.first_byte_time = time.time()
+                    self.bytes_forwarded += len(data)
+                    if self.first_media_time is None and self.bytes_forwarded >= MEDIA_AFTER_BYTES:
+                        self.first_media_time = time.time()
+                target.sendall(data)
+        except OSError:
+            pass
+        finally:
+            for sock in (source, target):
+                try:
+                    sock.shutdown(socket.SHUT_RDWR)
+                except OSError:
+                    pass
+                sock.close()
+
+    def throttle(self, size):
+        # Token bucket: each chunk books airtime at the current rate and the
+        # sender waits once it is more than a burst ahead of the clock.
+        if not self.rate_kbps:
+            return
+        now = time.monotonic()
+        self.send_at = max(self.send_at, now) + size * 8 / (self.rate_kbps * 1000)
+        delay = self.send_at - now - self.burst_seconds
+        if delay > 0:
+            time.sleep(delay)
+
+
+class BandwidthHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        size = int(parse_qs(urlparse(self.path).query).get('bytes', ['1000000'])[0])
+        self.send_response(200)
+        self.send_header('Content-Length', str(size))
+        self.end_headers()
+        block = bytes(65536)
+        while size > 0:
+            self.wfile.write(block[:size])
+            size -= len(block)
+
+    def do_POST(self):
+        remaining = int(self.headers.get('Content-Length', 0))
+        while remaining > 0:
+            chunk = self.rfile.read(min(remaining, 65536))
+            if not chunk:
+                break
+            remaining -= len(chunk)
+        self.send_response(204)
+        self.end_headers()
+
+    def log_message(self, format, *args):
+        pass
+
+
+class BandwidthStandIn:
+    # Local probe target for bandwidth.HttpTarget: GET ?bytes=N returns N
+    # zero bytes, POST swallows the body.
+    def __init__(self, port):
+        self.port = port
+        self.server = None
+
+    @property
+    def url(self):
+        return f"http://127.0.0.1:{self.port}/"
+
+    def start(self):
+        self.server = ThreadingHTTPServer(('127.0.0.1', self.port), BandwidthHandler)
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        return self
+
+    def stop(self):
+        if self.server:
+            self.server.shutdown()
+            self.server.server_close()
+            self.server = None
+
+
+def free_port():
+    # A port nothing listens on right now, so parallel runs don't collide
+    with socket.create_server(('127.0.0.1', 0)) as server:
+        return server.getsockname()[1]
+
+
+def make_sample(path, duration=10, size='1280x720', rate=25, gop=None, ffmpeg_path=FFMPEG_PATH):
+    # Synthetic test pattern with a sine tone, so nothing depends on real media
+    command = [
+        ffmpeg_path, '-hide_banner', '-loglevel', 'error', '-y',
+        '-f', 'lavfi', '-i', f"testsrc2=duration={duration}:size={size}:rate={rate}",
+        '-f', 'lavfi', '-i', f"sine=frequency=440:sample_rate=44100:duration={duration}",
+        '-c:v', 'libx264', '-preset', 'ultrafast', '-pix_fmt', 'yuv420p',
+    ]
+    if gop:
+        command += ['-g', str(gop)]
+    command += ['-c:a', 'aac', '-shortest', path]
+    subprocess.run(command, check=True)
+    return path
+
+
+def self_check(duration=8):
+    # Fan one encode out to two live stand-ins plus one port nobody listens on;
+    # both live stand-ins must still receive the stream.
+    workdir = tempfile.mkdtemp(prefix='standin-')
+    sample = make_sample(os.path.join(workdir, 'sample.mp4'), duration=duration)
+    listeners = [StandInListener(free_port(), output_path=os.path.join(workdir, f"out{i}.flv")).start()
+                 for i in range(2)]
+    urls = [listener.url for listener in listeners] + [f"rtmp://127.0.0.1:{free_port()}/live/dead"]
+    try:
+        subprocess.run(plan_stream(sample, urls, rendition_cache=None).command, timeout=duration * 4)
+    finally:
+        time.sleep(1)
+        for listener in listeners:
+            listener.stop()
+    ok = True
+    for listener in listeners:
+        received = listener.received_bytes()
+        print(f"{listener.url}: {received} bytes")
+        ok = ok and received > 0
+    return ok
+
+
+if __name__ == '__main__':
+    sys.exit(0 if self_check() else 1)
@@ -0,0 +1,81 @@
+import argparse
+import asyncio
+import signal
+import sys
+
+from stream_engine import FAILED, STOPPED, StreamEngine
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Stream a video to YouTube without the GUI.")
+    parser.add_argument('video', nargs='+', help="Video file to stream; several play back to back in one session")
+    parser.add_argument('-k', '--key', action='append', required=True,
+                        help="YouTube stream key or full RTMP URL; repeat to simulcast")
+    parser.add_argument('--ticker', help="Ticker image overlaid at the bottom of the frame")
+    parser.add_argument('--name', default='main', help="Stream name used in the log")
+    parser.add_argument('--metrics', action='store_true', help="Print encoder telemetry as it arrives")
+    parser.add_argument('--loop', action='store_true', help="Play the videos as a gapless 24/7 playlist")
+    parser.add_argument('--adaptive', action='store_true',
+                        help="Step down the bitrate ladder when the uplink can't keep up")
+    args = parser.parse_args(argv)
+    # A playlist's items are encoded one by one into a copying muxer: no overlay, no ladder
+    if len(args.video) > 1 or args.loop:
+        for option in ('ticker', 'adaptive'):
+            if getattr(args, option):
+                parser.error(f"--{option} works with a single video, not with a playlist (--loop or several videos)")
+    return args
+
+
+def print_event(event, metrics=False):
+    if event['type'] == 'log':
+        print(f"[{event['stream']}] {event['message']}", flush=True)
+    elif event['type'] == 'metrics':
+        if metrics:
+            from telemetry import describe
+            print(f"[{event['stream']}] {describe(event['sample'])}", flush=True)
+    else:
+        print(f"[{event['stream']}] {event['state']}" + (f": {event['error']}" if event.get('error') else ''), flush=True)
+
+
+async def run(args):
+    from stream_command import parse_destinations
+
+    engine = StreamEngine()
+    finished = asyncio.Event()
+
+    def on_event(event):
+        print_event(event, args.metrics)
+        if event['type'] == 'state' and event['state'] in (STOPPED, FAILED):
+            finished.set()
+
+    engine.subscribe(on_event)
+    loop = asyncio.get_running_loop()
+    try:
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            loop.add_signal_handler(sig, lambda: asyncio.ensure_future(engine.stop_all()))
+    except NotImplementedError:  # Windows: Ctrl+C arrives as KeyboardInterrupt instead
+        pass
+    urls = [url for key in args.key for url in parse_destinations(key)]
+    if len(args.video) > 1 or args.loop:
+        from playlist import Playlist
+
+        await engine.start(args.name, None, urls, playlist=Playlist(args.video, loop=args.loop))
+    else:
+        await engine.start(args.name, args.video[0], urls, ticker_path=args.ticker, adaptive=args.adaptive)
+    try:
+        await finished.wait()
+    finally:
+        await engine.stop_all()
+    return 0 if engine.status(args.name)['state'] == STOPPED else 1
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    try:
+        return asyncio.run(run(args))
+    except KeyboardInterrupt:
+        return 130
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,309 @@
+import os
+import re
+import subprocess
+
+from config import FFMPEG_PATH, YOUTUBE_RTMP_URL
+from encoder_tuning import apply_profile
+from keyframes import keyframe_before, lookup as lookup_keyframes
+from loudness import correction, loudness_cache
+from probe import check_compatibility, probe_cache, probe_duration
+from rendition_cache import rendition_cache, rendition_key
+from ticker_overlay import OVERLAY_FILTER, prepare_ticker
+
+VIDEO_ENCODE_ARGS = ['-c:v', 'libx264', '-preset', 'veryfast', '-maxrate', '3000k', '-bufsize', '6000k',
+                     '-pix_fmt', 'yuv420p', '-g', '50']
+AUDIO_ENCODE_ARGS = ['-c:a', 'aac', '-b:a', '128k', '-ar', '44100']
+
+# Only used when the ticker can't be pre-rendered for the output resolution
+TICKER_FILTER = '[1:v]scale=iw:-1[ticker];[0:v][ticker]overlay=0:H-h'
+
+# Stream copy never decodes; a preview then only needs the keyframes
+KEYFRAMES_ONLY = ['-skip_frame', 'nokey']
+
+# A warm-up runs the planned inputs, filters and encoder this long into a null output
+WARMUP_OUTPUT = ['-t', '1', '-f', 'null', '-']
+WARMUP_TIMEOUT = 60
+
+# The source's first video and, if it has one, first audio stream
+SOURCE_MAPS = ['-map', '0:v:0', '-map', '0:a:0?']
+
+
+def parse_destinations(text):
+    # Keys or full URLs, separated by commas, semicolons or whitespace
+    entries = [entry for entry in re.split(r'[\s,;]+', text or '') if entry]
+    return [destination_url(entry) for entry in entries]
+
+
+def destination_url(entry):
+    if '://' in entry:
+        return entry
+    return f"{YOUTUBE_RTMP_URL}{entry}"
+
+
+def tee_escape(url):
+    return re.sub(r"([\\|\[\]'])", r'\\\1', url)
+
+
+def output_args(urls, recording_path=None):
+    if len(urls) == 1 and not recording_path:
+        return ['-f', 'flv', urls[0]]
+    # One encode, many muxers: every slave gets its own fifo so a slow or dead
+    # endpoint is dropped on its own instead of stalling the others.
+    targets = list(urls) + ([recording_path] if recording_path else [])
+    slaves = '|'.join(f"[f=flv:onfail=ignore]{tee_escape(target)}" for target in targets)
+    # The tee has no codec tag table of its own, so copied MP4 streams would
+    # keep theirs and the FLV slaves refuse them: give them FLV's H.264/AAC ids
+    return ['-flags', '+global_header', '-tag:v', '7', '-tag:a', '10', '-f', 'tee', '-use_fifo', '1', slaves]
+
+
+def stream_maps(filters):
+    # The tee picks no streams by itself, so they're always named; an
+    # unlabeled filter graph output is mapped by ffmpeg on its own
+    if '-filter_complex' in filters:
+        return ['-map', '0:a:0?']
+    return SOURCE_MAPS
+
+
+def with_option(args, name, value):
+    # Copy of args with the option replaced, or appended if it isn't there
+    args = list(args)
+    if name in args:
+        args[args.index(name) + 1] = value
+    else:
+        args += [name, value]
+    return args
+
+
+def video_encode_args(rung=None):
+    # Same encoder settings with a bitrate ladder rung's rate cap
+    if not rung:
+        return VIDEO_ENCODE_ARGS
+    args = with_option(VIDEO_ENCODE_ARGS, '-maxrate', f"{rung['maxrate']}k")
+    return with_option(args, '-bufsize', f"{rung['bufsize']}k")
+
+
+def scale_filter(rung):
+    # Never upscale a source that is already below the rung
+    return f"scale=-2:'min(ih,{rung['height']})'"
+
+
+def codec_args(video_path, overlay=False, probe_cache=probe_cache, rung=None, loudness_cache=loudness_cache):
+    # Copy whatever part of the source is already YouTube-ready and only
+    # re-encode the part that isn't. Audio measured off the loudness target
+    # is re-encoded through a one-pass correction.
+    video_args = video_encode_args(rung)
+    # Output height for the host's encoder profile, None while the source's is unknown
+    height = rung.get('height') if rung else None
+    if probe_cache is None:
+        return apply_profile(video_args, height) + AUDIO_ENCODE_ARGS, "re-encode video and audio"
+    try:
+        info = probe_cache.get(video_path)
+    except (OSError, ValueError, subprocess.CalledProcessError) as e:
+        return apply_profile(video_args, height) + AUDIO_ENCODE_ARGS, f"re-encode video and audio (probe failed: {e})"
+    video_problems, audio_problems = check_compatibility(info)
+    source_height = (info.get('video') or {}).get('height')
+    if source_height:
+        height = min(source_height, height) if height else source_height
+    video_args = apply_profile(video_args, height)
+    if rung:
+        video_problems.insert(0, f"bitrate ladder {rung['name']}")
+    if overlay:
+        video_problems.insert(0, "ticker overlay")
+    audio_filter = None
+    if loudness_cache is not None and info.get('audio'):
+        measured = loudness_cache.lookup(video_path)
+        audio_filter = correction(measured)
+        if audio_filter:
+            audio_problems.insert(0, f"loudness {measured['input_i']:.1f} LUFS")
+    if not video_problems and not audio_problems:
+        return ['-c', 'copy'], "stream copy"
+    args = video_args if video_problems else ['-c:v', 'copy']
+    args = args + (AUDIO_ENCODE_ARGS if audio_problems else ['-c:a', 'copy'])
+    if audio_filter:
+        args += ['-af', audio_filter]
+    parts = []
+    parts.append(f"re-encode video ({', '.join(video_problems)})" if video_problems else "copy video")
+    parts.append(f"re-encode audio ({', '.join(audio_problems)})" if audio_problems else "copy audio")
+    return args, ", ".join(parts)
+
+
+def overlay_args(video_path, ticker_path=None, text_ticker=None, probe_cache=probe_cache, log=None):
+    # Inputs and filter graph for the ticker image and/or the live text strip
+    log = log or (lambda message: None)
+    error = None
+    try:
+        video = probe_cache.get(video_path)['video']
+        width, height = video['width'], video['height']
+    except (OSError, ValueError, TypeError, KeyError, AttributeError, subprocess.CalledProcessError) as e:
+        width = height = None
+        error = e
+    inputs = []
+    graph = []
+    if ticker_path:
+        prepared_path = None
+        if width:
+            try:
+                prepared_path = prepare_ticker(ticker_path, width, height)
+            except (OSError, subprocess.CalledProcessError) as e:
+                error = e
+        if prepared_path:
+            inputs += ['-i', prepared_path]
+            graph.append(OVERLAY_FILTER)
+        else:
+            log(f"Ticker pre-render unavailable ({error}), scaling it in the stream instead")
+            inputs += ['-i', ticker_path]
+            graph.append(TICKER_FILTER)
+    if text_ticker:
+        if width:
+            text_ticker.configure(width)
+            main = '0:v'
+            if graph:
+                graph[-1] += '[base]'
+                main = 'base'
+            graph.append(text_ticker.overlay_filter(main, f"{1 + bool(ticker_path)}:v"))
+            inputs += text_ticker.input_args()
+        else:
+            log(f"Text ticker needs the source resolution ({error}), streaming without it")
+    if not graph:
+        return []
+    return inputs + ['-filter_complex', ';'.join(graph)]
+
+
+def preview_args(filters, preview):
+    # Splits the composited picture so the preview shows what goes to air.
+    # Returns the filters, the maps the main output then needs, and the
+    # preview's own output; without a filter graph ffmpeg decodes the source
+    # once and hands the frames to both outputs anyway.
+    if '-filter_complex' not in filters:
+        return filters, [], preview.output_args('0:v:0')
+    graph = f"{filters[-1]},split[air][tap];[tap]{preview.filter()}[preview]"
+    return filters[:-1] + [graph], ['-map', '[air]', '-map', '0:a:0?'], preview.output_args('[preview]')
+
+
+def cache_key_for(video_path, args, ticker_path=None):
+    return rendition_key(video_path, args + [OVERLAY_FILTER if ticker_path else ''], ticker_path)
+
+
+class StreamPlan:
+    # feeder: anything with attach(pipe)/detach() that writes ffmpeg's stdin,
+    # e.g. the text ticker strip or a playlist
+    def __init__(self, command, cache=None, cache_key=None, recording_path=None, video_path=None, log=None,
+                 feeder=None, warmup=None, offset=0.0):
+        self.command = command
+        self.offset = offset   # source time the command starts at
+        self.warmup = warmup
+        self.feeder = feeder
+        self.cache = cache
+        self.cache_key = cache_key
+        self.recording_path = recording_path
+        self.video_path = video_path
+        self.log = log
+
+    def started(self, stdin_pipe):
+        if self.feeder:
+            self.feeder.attach(stdin_pipe)
+
+    def finish(self, success):
+        if self.feeder:
+            self.feeder.detach()
+        # Keep the recorded rendition only if the whole file went out
+        if not self.recording_path:
+            return
+        expected = probe_duration(self.video_path)
+        recorded = probe_duration(self.recording_path) if os.path.exists(self.recording_path) else 0
+        if success and recorded and recorded >= expected - 1:
+            self.cache.commit(self.cache_key, self.recording_path, source=self.video_path)
+        else:
+            self.cache.discard(self.recording_path)
+        if self.log:
+            self.log(self.cache.stats_message())
+
+
+def seek_args(video_path, start_offset=0, end_at=None):
+    # Input options to air the source from start_offset to end_at (seconds).
+    # With a keyframe index the start snaps back to the keyframe at or before
+    # start_offset, which ffmpeg opens without decoding anything in between;
+    # without one it decodes from that keyframe up to the exact offset.
+    # Returns where the airing really starts along with the options.
+    start = start_offset
+    args = []
+    if start_offset:
+        times = lookup_keyframes(video_path)
+        if times:
+            start = keyframe_before(times, start_offset)
+            args = ['-ss', f"{start:.6f}", '-noaccurate_seek'] if start else []
+        else:
+            args = ['-ss', f"{start_offset:.3f}"]
+    if end_at:
+        args += ['-t', f"{max(end_at - start, 0):.3f}"]
+    return start, args
+
+
+def plan_stream(video_path, urls, ticker_path=None, text_ticker=None, ffmpeg_path=FFMPEG_PATH,
+                probe_cache=probe_cache, rendition_cache=rendition_cache, log=None, rung=None, start_offset=0,
+                threads=None, preview=None, end_at=None):
+    # rung: a lower bitrate ladder step (None streams at the usual settings);
+    # start_offset/end_at: seconds into the source, for picking a stream back
+    # up or airing a clip (end_at None runs to the end of the file);
+    # threads: encoder thread budget when several channels share the host;
+    # preview: a PreviewTap to receive a small copy of the output
+    if not urls:
+        raise ValueError("At least one stream destination is required")
+    log = log or (lambda message: None)
+    args, path_taken = codec_args(video_path, overlay=bool(ticker_path or text_ticker), probe_cache=probe_cache,
+                                  rung=rung)
+    log(f"Stream path: {path_taken}")
+    copying = args == ['-c', 'copy']
+    start, seek = seek_args(video_path, start_offset, end_at)
+    if start_offset:
+        log(f"Starting at {start:.3f}s (asked for {start_offset:.3f}s)")
+    cache_key = None
+    # A live text ticker makes every airing different, and a resumed,
+    # clipped or down-rated airing isn't the full rendition, so there is
+    # nothing to cache
+    if (rendition_cache is not None and not copying and not text_ticker and not rung and
+            not start_offset and not end_at):
+        try:
+            cache_key = cache_key_for(video_path, args, ticker_path)
+        except OSError as e:
+            log(f"Rendition cache unavailable: {e}")
+    if cache_key:
+        cached_path = rendition_cache.lookup(cache_key)
+        log(rendition_cache.stats_message())
+        if cached_path:
+            log(f"Streaming cached rendition {cached_path}")
+            command = [ffmpeg_path, '-re'] + (KEYFRAMES_ONLY if preview else []) + ['-i', cached_path]
+            command += SOURCE_MAPS + ['-c', 'copy']
+            command += output_args(urls) + (preview.output_args('0:v:0') if preview else [])
+            return StreamPlan(command, warmup=[ffmpeg_path, '-i', cached_path, '-c', 'copy'] + WARMUP_OUTPUT)
+    keyframes = KEYFRAMES_ONLY if preview and copying else []
+    command = [ffmpeg_path, '-re'] + seek + keyframes + ['-i', video_path]
+    filters = overlay_args(video_path, ticker_path, text_ticker, probe_cache, log)
+    if rung and rung.get('height'):
+        if filters:
+            filters[-1] += f",{scale_filter(rung)}"
+        else:
+            filters = ['-vf', scale_filter(rung)]
+    if threads and not copying:
+        args = with_option(args, '-threads', str(threads))
+    # The live text strip only exists once its feeder is attached, so there is nothing to warm up
+    warmup = None if 'pipe:0' in filters else [ffmpeg_path] + seek + ['-i', video_path] + filters + args + WARMUP_OUTPUT
+    maps = tap = []
+    if preview:
+        filters, maps, tap = preview_args(filters, preview)
+    command += filters + (maps or stream_maps(filters)) + args
+    if cache_key:
+        recording_path = rendition_cache.recording_path(cache_key)
+        command += output_args(urls, recording_path) + tap
+        return StreamPlan(command, rendition_cache, cache_key, recording_path, video_path, log, warmup=warmup)
+    command += output_args(urls) + tap
+    return StreamPlan(command, feeder=text_ticker if 'pipe:0' in command else None, warmup=warmup, offset=start)
+
+
+def warm_up_plan(plan, timeout=WARMUP_TIMEOUT):
+    # Runs a second of the plan into a null output: ffmpeg and its libraries
+    # get loaded, the head of the source lands in the page cache and a filter
+    # graph or encoder that won't open fails now rather than at air time.
+    if plan.warmup:
+        command = plan.warmup[:1] + ['-hide_banner', '-nostdin', '-loglevel', 'error'] + plan.warmup[1:]
+        subprocess.run(command, capture_output=True, text=True, timeout=timeout, check=True)
@@ -0,0 +1,483 @@
+import asyncio
+import functools
+import os
+import random
+import subprocess
+import threading
+import time
+
+from abr import AdaptiveBitrate
+from procfs import set_affinity
+from telemetry import PROGRESS_ARGS, MetricsRing, ProgressParser, TelemetryExporter
+
+IDLE = 'idle'
+STARTING = 'starting'
+LIVE = 'live'
+STOPPING = 'stopping'
+RECONNECTING = 'reconnecting'
+STOPPED = 'stopped'
+FAILED = 'failed'
+
+EXPORT_INTERVAL = 5
+
+# Restarts after ffmpeg dies on its own: 1, 2, 4 ... 60 s, each scaled by a
+# random 50-100% so several streams don't hammer the ingest in step
+BACKOFF_BASE = 1.0
+BACKOFF_MAX = 60.0
+RETRY_LIMIT = 10
+HEALTHY_AFTER = 60  # a run this long resets the retry count
+WARM_TTL = 300      # a standby plan older than this is planned afresh
+
+ACTIVE_STATES = (STARTING, LIVE, STOPPING, RECONNECTING)
+
+
+class EngineError(Exception):
+    pass
+
+
+class Stream:
+    def __init__(self, name, video_path, urls, ticker_path=None, text_ticker=None):
+        self.name = name
+        self.video_path = video_path
+        self.urls = list(urls)
+        self.ticker_path = ticker_path
+        self.text_ticker = text_ticker
+        self.state = IDLE
+        self.process = None
+        self.plan = None
+        self.task = None
+        self.stop_requested = False
+        self.returncode = None
+        self.error = None
+        self.started_at = None
+        self.abr = None
+        self.playlist = None
+        self.threads = None
+        self.affinity = None
+        self.offset = 0.0
+        self.end_at = None
+        self.restarting = False
+        self.supervised = True
+        self.failures = 0
+        self.failed_at = None
+        self.launched_at = None
+        self.launch_total = 0
+        self.recoveries = []
+        self.stop_event = None
+        self.last_stderr = None
+        self.preview = None
+        self.warm_plan = None
+        self.requested_at = None
+        self.startup_seconds = None
+        self.metrics = MetricsRing()
+        self.progress = ProgressParser(self.metrics)
+
+    @property
+    def active(self):
+        return self.state in ACTIVE_STATES
+
+    def fits(self, other):
+        # Whether a plan made for this stream serves other's start as it is
+        return ((self.video_path, self.urls, self.ticker_path, self.text_ticker, self.threads, self.preview,
+                 self.offset, self.end_at) ==
+                (other.video_path, other.urls, other.ticker_path, other.text_ticker, other.threads, other.preview,
+                 other.offset, other.end_at)
+                and not other.playlist)
+
+    def pids(self):
+        # The ffmpeg the engine runs plus, for a playlist, its current item encoder
+        pids = []
+        if self.process and self.process.returncode is None:
+            pids.append(self.process.pid)
+        encoder = getattr(self.plan.feeder, 'process', None) if self.plan else None
+        if encoder and encoder.poll() is None:
+            pids.append(encoder.pid)
+        return pids
+
+    def exit_error(self):
+        # ffmpeg's last stderr line usually says why it gave up
+        return f"ffmpeg exited with code {self.returncode}" + (f": {self.last_stderr}" if self.last_stderr else '')
+
+    def position(self):
+        # Output time the current ffmpeg run got to, from its own progress samples
+        if self.metrics.total > self.launch_total:
+            return self.metrics.latest()['out_time']
+        return 0.0
+
+    def status(self):
+        return {
+            'name': self.name,
+            'state': self.state,
+            'video_path': self.playlist.current if self.playlist else self.video_path,
+            'destinations': len(self.urls),
+            'pid': self.process.pid if self.process else None,
+            'uptime': time.time() - self.started_at if self.started_at and self.state == LIVE else 0,
+            'returncode': self.returncode,
+            'error': self.error,
+            'rung': self.abr.rung['name'] if self.abr else None,
+            'offset': self.offset,
+            'end_at': self.end_at,
+            'restarts': len(self.recoveries),
+            'last_recovery_seconds': self.recoveries[-1] if self.recoveries else None,
+            'startup_seconds': self.startup_seconds,
+            'metrics': self.metrics.latest(),
+        }
+
+
+class StreamEngine:
+    # Owns the ffmpeg child processes and their state; front-ends only call
+    # start/stop/status and listen for events. No Qt in here, so the same
+    # engine runs behind the GUIs and on a headless box.
+    def __init__(self, exporter=None):
+        self.streams = {}
+        self.listeners = []
+        self.loop = None
+        self.thread = None
+        self.exporter = exporter or TelemetryExporter()
+        self.export_task = None
+        self.standby = {}
+
+    def run_in_background(self):
+        # For front-ends that own the main thread (Qt): the engine gets its own loop
+        ready = threading.Event()
+
+        def run():
+            self.loop = asyncio.new_event_loop()
+            asyncio.set_event_loop(self.loop)
+            ready.set()
+            self.loop.run_forever()
+
+        self.thread = threading.Thread(target=run, name='stream-engine', daemon=True)
+        self.thread.start()
+        ready.wait()
+        return self
+
+    def submit(self, coroutine):
+        return asyncio.run_coroutine_threadsafe(coroutine, self.loop)
+
+    def subscribe(self, callback):
+        self.listeners.append(callback)
+
+    def unsubscribe(self, callback):
+        if callback in self.listeners:
+            self.listeners.remove(callback)
+
+    def emit(self, event_type, stream, **data):
+        event = {'type': event_type, 'stream': stream.name, 'time': time.time()}
+        event.update(data)
+        for callback in list(self.listeners):
+            callback(event)
+
+    def log(self, stream, message):
+        self.emit('log', stream, message=message)
+
+    def set_state(self, stream, state, **data):
+        stream.state = state
+        self.emit('state', stream, state=state, **data)
+
+    async def start(self, name, video_path, urls, ticker_path=None, text_ticker=None, adaptive=False,
+                    start_offset=0, playlist=None, supervise=True, threads=None, affinity=None, preview=None,
+                    end_at=None):
+        # With a playlist, video_path is ignored and one muxer plays the whole list;
+        # preview is a started PreviewTap, fed by every launch of this stream;
+        # end_at stops the airing that many seconds into the source
+        self.loop = asyncio.get_running_loop()
+        current = self.streams.get(name)
+        if current and current.active:
+            raise EngineError(f"Stream {name} is already {current.state}")
+        stream = Stream(name, video_path, urls, ticker_path, text_ticker)
+        stream.requested_at = time.monotonic()
+        stream.offset = start_offset
+        stream.end_at = end_at
+        stream.playlist = playlist
+        stream.supervised = supervise
+        stream.threads = threads
+        stream.affinity = affinity
+        stream.preview = preview
+        stream.stop_event = asyncio.Event()
+        if adaptive and not playlist:
+            stream.abr = AdaptiveBitrate()
+        standby = self.standby.pop(name, None)
+        if standby and time.monotonic() - standby.requested_at < WARM_TTL and standby.fits(stream):
+            stream.warm_plan = standby.plan
+        self.streams[name] = stream
+        self.set_state(stream, STARTING)
+        try:
+            if not await self.launch(stream):
+                self.set_state(stream, STOPPED)
+                return stream.status()
+        except Exception as e:
+            stream.error = f"{type(e).__name__}: {e}"
+            self.set_state(stream, FAILED, error=stream.error)
+            return stream.status()
+        stream.started_at = time.time()
+        stream.startup_seconds = time.monotonic() - stream.requested_at
+        self.set_state(stream, LIVE, pid=stream.process.pid)
+        stream.task = asyncio.ensure_future(self.watch(stream))
+        if not self.export_task:
+            self.export_task = asyncio.ensure_future(self.export_metrics())
+        return stream.status()
+
+    async def prewarm(self, name, video_path, urls, ticker_path=None, text_ticker=None, threads=None, preview=None,
+                      start_offset=0, end_at=None):
+        # Everything a start does short of going live: plan the command (probe,
+        # ticker render, rendition lookup) and give it a dry run. A start() with
+        # the same arguments within WARM_TTL then only has to spawn ffmpeg.
+        from stream_command import plan_stream, warm_up_plan
+
+        self.loop = asyncio.get_running_loop()
+        standby = Stream(name, video_path, urls, ticker_path, text_ticker)
+        standby.requested_at = time.monotonic()
+        standby.threads = threads
+        standby.preview = preview
+        standby.offset = start_offset
+        standby.end_at = end_at
+        log = functools.partial(self.call_soon_log, standby)
+        standby.plan = await self.loop.run_in_executor(None, functools.partial(
+            plan_stream, video_path, urls, ticker_path=ticker_path, text_ticker=text_ticker, log=log,
+            threads=threads, preview=preview, start_offset=start_offset, end_at=end_at))
+        try:
+            await self.loop.run_in_executor(None, warm_up_plan, standby.plan)
+        except (OSError, subprocess.SubprocessError) as e:
+            error = e.stderr.strip() if isinstance(e, subprocess.CalledProcessError) else None
+            self.log(standby, f"Warm-up run failed: {error.splitlines()[-1] if error else e}")
+        self.standby[name] = standby
+        seconds = time.monotonic() - standby.requested_at
+        self.log(standby, f"Warm standby ready in {seconds:.2f}s")
+        return {'name': name, 'seconds': seconds}
+
+    async def launch(self, stream):
+        # Command planning pulls in the probe/cache modules; loading them here
+        # keeps the engine itself cheap to import.
+        from stream_command import plan_stream
+
+        log = functools.partial(self.call_soon_log, stream)
+        if stream.playlist:
+            from playlist import plan_playlist
+
+            stream.plan = plan_playlist(stream.playlist, stream.urls, log=log, threads=stream.threads,
+                                        affinity=stream.affinity, preview=stream.preview)
+            self.log(stream, f"Running command: {stream.plan.command}")
+            await self.spawn(stream)
+            return True
+        rung = stream.abr.rung if stream.abr and stream.abr.index else None
+        if stream.warm_plan:
+            stream.plan, stream.warm_plan = stream.warm_plan, None
+            self.log(stream, "Starting from the warm standby plan")
+        else:
+            stream.plan = await self.loop.run_in_executor(None, functools.partial(
+                plan_stream, stream.video_path, stream.urls, ticker_path=stream.ticker_path,
+                text_ticker=stream.text_ticker, log=log, rung=rung, start_offset=stream.offset,
+                threads=stream.threads, preview=stream.preview, end_at=stream.end_at))
+        # A start snapped to a keyframe airs from a little earlier; later resumes count from there
+        stream.offset = stream.plan.offset
+        if stream.stop_requested:
+            return False
+        self.log(stream, f"Running command: {stream.plan.command}")
+        await self.spawn(stream)
+        return True
+
+    async def spawn(self, stream):
+        stream.launched_at = time.monotonic()
+        stream.launch_total = stream.metrics.total
+        stream.last_stderr = None
+        await self.spawn_process(stream)
+        if stream.affinity:
+            set_affinity(stream.process.pid, stream.affinity)
+
+    def call_soon_log(self, stream, message):
+        # Planning runs in an executor thread; events are always sent from the loop
+        self.loop.call_soon_threadsafe(self.log, stream, message)
+
+    async def spawn_process(self, stream):
+        plan = stream.plan
+        command = plan.command[:1] + ['-hide_banner'] + PROGRESS_ARGS + plan.command[1:]
+        if plan.feeder:
+            read_fd, write_fd = os.pipe()
+            try:
+                stream.process = await asyncio.create_subprocess_exec(*command, stdin=read_fd,
+                                                                      stdout=asyncio.subprocess.PIPE,
+                                                                      stderr=asyncio.subprocess.PIPE)
+            except Exception:
+                os.close(write_fd)
+                raise
+            finally:
+                os.close(read_fd)
+            plan.started(os.fdopen(write_fd, 'wb'))
+        else:
+            stream.process = await asyncio.create_subprocess_exec(*command, stdin=asyncio.subprocess.DEVNULL,
+                                                                  stdout=asyncio.subprocess.PIPE,
+                                                                  stderr=asyncio.subprocess.PIPE)
+
+    async def read_progress(self, stream):
+        async for line in stream.process.stdout:
+            if stream.progress.feed(line.decode('ascii', 'replace')):
+                sample = stream.metrics.latest()
+                if stream.failed_at is not None:
+                    self.recovered(stream)
+                self.emit('metrics', stream, sample=sample)
+                if stream.abr and not stream.restarting and not stream.stop_requested:
+                    rung = stream.abr.observe(sample)
+                    if rung:
+                        self.switch_rung(stream, rung, sample)
+
+    async def read_stderr(self, stream):
+        # ffmpeg's own messages, a line at a time, into the same log as everything else
+        async for line in stream.process.stderr:
+            text = line.decode('utf-8', 'replace').strip()
+            if text:
+                stream.last_stderr = text
+                self.emit('log', stream, message=text, source='ffmpeg')
+
+    def switch_rung(self, stream, rung, sample):
+        # x264 can't change resolution mid-stream, so the encoder is restarted
+        # at the new rung from where the old one got to; watch() relaunches it.
+        stream.offset += stream.position()
+        stream.restarting = True
+        self.log(stream, f"Switching to {rung['name']} ({rung['maxrate']} kbit/s, "
+                         f"send rate {stream.abr.send_rate_kbps:.0f} kbit/s) at {stream.offset:.1f}s")
+        stream.process.terminate()
+
+    async def set_preview(self, name, preview):
+        # Adds or drops the preview tap of a running stream. The tap is an
+        # extra output of the encoder, so like a rung switch the encoder is
+        # restarted from where it got to and watch() relaunches it.
+        stream = self.streams.get(name)
+        if not stream or not stream.active:
+            raise EngineError(f"Stream {name} is not running")
+        if preview is stream.preview:
+            return stream.status()
+        stream.preview = preview
+        # Still starting or already restarting: the next launch plans it in
+        if stream.state == LIVE and not stream.restarting and stream.process.returncode is None:
+            if not stream.playlist:
+                stream.offset += stream.position()
+            stream.restarting = True
+            self.log(stream, f"{'Adding' if preview else 'Dropping'} the on-air preview at {stream.offset:.1f}s")
+            stream.process.terminate()
+        return stream.status()
+
+    async def export_metrics(self):
+        while True:
+            await asyncio.sleep(EXPORT_INTERVAL)
+            self.flush_metrics()
+
+    def flush_metrics(self):
+        rings = {name: stream.metrics for name, stream in self.streams.items() if stream.metrics.total}
+        if rings:
+            gauges = {
+                'restarts': {name: len(stream.recoveries) for name, stream in self.streams.items()},
+                'last_recovery_seconds': {name: stream.recoveries[-1] for name, stream in self.streams.items()
+                                          if stream.recoveries},
+            }
+            try:
+                self.exporter.write(rings, gauges)
+            except OSError:
+                pass
+
+    async def watch(self, stream):
+        while True:
+            await asyncio.gather(self.read_progress(stream), self.read_stderr(stream))
+            stream.returncode = await stream.process.wait()
+            self.flush_metrics()
+            await self.loop.run_in_executor(None, stream.plan.finish, stream.returncode == 0)
+            if stream.stop_requested:
+                break
+            if stream.restarting:
+                stream.restarting = False
+            elif stream.returncode != 0 and stream.supervised:
+                if not await self.back_off(stream):
+                    break
+            else:
+                break
+            try:
+                if not await self.launch(stream):
+                    break
+            except Exception as e:
+                stream.error = f"{type(e).__name__}: {e}"
+                self.set_state(stream, FAILED, error=stream.error)
+                return
+            self.set_state(stream, LIVE, pid=stream.process.pid)
+        if stream.stop_requested or stream.returncode == 0:
+            self.set_state(stream, STOPPED, returncode=stream.returncode)
+        else:
+            stream.error = stream.exit_error()
+            self.set_state(stream, FAILED, returncode=stream.returncode, error=stream.error)
+
+    async def back_off(self, stream):
+        # ffmpeg died without being asked to (ingest reset, network blip):
+        # wait, then pick up from the last timestamp it confirmed sending
+        if time.monotonic() - stream.launched_at >= HEALTHY_AFTER:
+            stream.failures = 0
+        if stream.failures >= RETRY_LIMIT:
+            return False
+        stream.failures += 1
+        if stream.failed_at is None:
+            stream.failed_at = time.monotonic()
+        if not stream.playlist:
+            stream.offset += stream.position()
+        delay = min(BACKOFF_MAX, BACKOFF_BASE * 2 ** (stream.failures - 1)) * random.uniform(0.5, 1.0)
+        stream.error = stream.exit_error()
+        self.set_state(stream, RECONNECTING, returncode=stream.returncode, error=stream.error,
+                       attempt=stream.failures, delay=delay)
+        self.log(stream, f"{stream.error}; reconnecting in {delay:.1f}s (attempt {stream.failures}/{RETRY_LIMIT})"
+                         + (f", resuming at {stream.offset:.1f}s" if stream.offset else ""))
+        try:
+            await asyncio.wait_for(stream.stop_event.wait(), delay)
+        except asyncio.TimeoutError:
+            pass
+        return not stream.stop_requested
+
+    def recovered(self, stream):
+        # Time to recover: from the failure to media flowing again
+        seconds = time.monotonic() - stream.failed_at
+        stream.failed_at = None
+        stream.error = None
+        stream.recoveries.append(seconds)
+        self.log(stream, f"Recovered in {seconds:.1f}s")
+
+    async def stop(self, name, timeout=5):
+        stream = self.streams.get(name)
+        if not stream or not stream.active:
+            raise EngineError(f"Stream {name} is not running")
+        stream.stop_requested = True
+        stream.stop_event.set()
+        self.set_state(stream, STOPPING)
+        if stream.process and stream.process.returncode is None:
+            stream.process.terminate()
+            try:
+                await asyncio.wait_for(asyncio.shield(stream.task), timeout)
+            except asyncio.TimeoutError:
+                stream.process.kill()
+        if stream.task:
+            await stream.task
+        return stream.status()
+
+    async def stop_all(self):
+        for name in [name for name, stream in self.streams.items() if stream.active]:
+            await self.stop(name)
+
+    def status(self, name=None):
+        if name is not None:
+            stream = self.streams.get(name)
+            if not stream:
+                raise EngineError(f"Unknown stream {name}")
+            return stream.status()
+        return [stream.status() for stream in self.streams.values()]
+
+    def is_active(self, name):
+        stream = self.streams.get(name)
+        return bool(stream and stream.active)
+
+    def has_live_stream(self):
+        return any(stream.state == LIVE for stream in self.streams.values())
+
+    def send_rate_kbps(self):
+        # ffmpeg's bitrate is the output average; scaled by speed it's what
+        # the muxers are actually getting out right now
+        total = 0.0
+        for stream in list(self.streams.values()):
+            sample = stream.metrics.latest() if stream.state == LIVE else None
+            if sample:
+                total += sample['bitrate_kbps'] * min(sample['speed'], 1.0)
+        return total
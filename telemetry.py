@@ -0,0 +1,122 @@
+import json
+import os
+import time
+from array import array
+
+from config import DATA_DIR
+
+METRICS_DIR = os.path.join(DATA_DIR, 'metrics')
+RING_CAPACITY = 7200  # one hour at ffmpeg's default 0.5 s progress period
+
+FIELDS = ('time', 'frame', 'fps', 'bitrate_kbps', 'total_size', 'out_time', 'dup_frames', 'drop_frames', 'speed')
+
+PROGRESS_ARGS = ['-progress', 'pipe:1', '-nostats']
+
+
+class MetricsRing:
+    # One preallocated array per field; appending overwrites the oldest sample,
+    # so a 24/7 stream never grows its telemetry.
+    def __init__(self, capacity=RING_CAPACITY, fields=FIELDS):
+        self.capacity = capacity
+        self.fields = fields
+        self.columns = {field: array('d', bytes(8 * capacity)) for field in fields}
+        self.count = 0
+        self.next = 0
+        self.total = 0
+        self.exported = 0
+
+    def append(self, values):
+        index = self.next
+        for field, column in self.columns.items():
+            column[index] = values[field]
+        self.next = (index + 1) % self.capacity
+        self.count = min(self.count + 1, self.capacity)
+        self.total += 1
+
+    def latest(self):
+        if not self.count:
+            return None
+        index = (self.next - 1) % self.capacity
+        return {field: column[index] for field, column in self.columns.items()}
+
+    def since(self, total):
+        # Samples appended after the ring had seen `total` samples, oldest first
+        count = min(self.total - total, self.count)
+        rows = [self.series(field, count) for field in self.fields] if count > 0 else []
+        return [dict(zip(self.fields, values)) for values in zip(*rows)]
+
+    def series(self, field, limit=None):
+        count = self.count if limit is None else min(limit, self.count)
+        column = self.columns[field]
+        start = (self.next - count) % self.capacity
+        if start + count <= self.capacity:
+            return column[start:start + count].tolist()
+        return column[start:].tolist() + column[:self.next].tolist()
+
+
+def parse_number(value):
+    # ffmpeg writes "N/A", "2950.3kbits/s", "1.01x" and plain integers
+    value = value.rstrip('kbits/sx')
+    try:
+        return float(value)
+    except ValueError:
+        return 0.0
+
+
+class ProgressParser:
+    # Reads ffmpeg's -progress key=value blocks; each block ends with a
+    # "progress=" line, at which point one sample goes into the ring.
+    def __init__(self, ring):
+        self.ring = ring
+        self.values = dict.fromkeys(FIELDS, 0.0)
+
+    def feed(self, line):
+        key, _, value = line.strip().partition('=')
+        if key == 'progress':
+            self.values['time'] = time.time()
+            self.ring.append(self.values)
+            return True
+        if key == 'bitrate':
+            self.values['bitrate_kbps'] = parse_number(value)
+        elif key == 'out_time_us':
+            self.values['out_time'] = parse_number(value) / 1e6
+        elif key in ('frame', 'fps', 'total_size', 'dup_frames', 'drop_frames', 'speed'):
+            self.values[key] = parse_number(value)
+        return False
+
+
+class TelemetryExporter:
+    # Prometheus textfile (overwritten) plus an append-only JSON lines log
+    def __init__(self, directory=METRICS_DIR):
+        self.directory = directory
+        self.prom_path = os.path.join(directory, 'streams.prom')
+
+    def write(self, rings, gauges=None):
+        # gauges: extra per-stream values, {metric: {stream name: value}}
+        os.makedirs(self.directory, exist_ok=True)
+        lines = []
+        for field in FIELDS[1:]:
+            lines.append(f"# TYPE obs_stream_{field} gauge")
+            for name, ring in rings.items():
+                sample = ring.latest()
+                if sample:
+                    lines.append(f'obs_stream_{field}{{stream="{name}"}} {sample[field]:g}')
+        for metric, values in (gauges or {}).items():
+            lines.append(f"# TYPE obs_stream_{metric} gauge")
+            for name, value in values.items():
+                lines.append(f'obs_stream_{metric}{{stream="{name}"}} {value:g}')
+        tmp_path = f"{self.prom_path}.tmp"
+        with open(tmp_path, 'w') as f:
+            f.write('\n'.join(lines) + '\n')
+        os.replace(tmp_path, self.prom_path)
+        with open(os.path.join(self.directory, 'streams.jsonl'), 'a') as f:
+            for name, ring in rings.items():
+                for sample in ring.since(ring.exported):
+                    sample['stream'] = name
+                    f.write(json.dumps(sample) + '\n')
+                ring.exported = ring.total
+
+
+def describe(sample):
+    return (f"{sample['fps']:.1f} fps | {sample['bitrate_kbps']:.0f} kbit/s | speed {sample['speed']:.2f}x | "
+            f"dropped {sample['drop_frames']:.0f} | dup {sample['dup_frames']:.0f}")
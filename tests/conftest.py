@@ -0,0 +1,25 @@
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+
+# Caches, schedules and profiles go to a throwaway home, never the user's
+os.environ['AUTOMATED_OBS_HOME'] = tempfile.mkdtemp(prefix='automated-obs-tests-')
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pytest
+
+from config import FFMPEG_PATH, FFPROBE_PATH
+
+
+def have_ffmpeg():
+    # Planning probes every source, so ffprobe has to be there as well
+    if not (shutil.which(FFMPEG_PATH) and shutil.which(FFPROBE_PATH)):
+        return False
+    # The stand-ins are ffmpeg's own RTMP listener
+    result = subprocess.run([FFMPEG_PATH, '-hide_banner', '-protocols'], capture_output=True, text=True)
+    return ' rtmp\n' in result.stdout
+
+
+requires_ffmpeg = pytest.mark.skipif(not have_ffmpeg(), reason="needs ffmpeg with RTMP and ffprobe (set FFMPEG_PATH)")
@@ -0,0 +1,116 @@
+import asyncio
+import time
+
+from abr import COOLDOWN, DEFAULT_LADDER, DOWN_AFTER, UP_AFTER, AdaptiveBitrate
+from conftest import requires_ffmpeg
+from standin import StandInListener, ThrottledProxy, free_port, make_sample
+from stream_engine import LIVE, StreamEngine
+
+UPLINK_KBPS = 800     # well under the top rung's 3000k
+TIMEOUT = COOLDOWN + DOWN_AFTER + 45
+PERIOD = 0.5          # ffmpeg's -progress period
+
+
+async def stream_through_squeeze(sample):
+    listener = StandInListener(free_port()).start()
+    proxy = ThrottledProxy(listener, free_port(), rate_kbps=UPLINK_KBPS).start()
+    engine = StreamEngine()
+    try:
+        await engine.start('abr', sample, [proxy.url], adaptive=True)
+        deadline = time.monotonic() + TIMEOUT
+        status = engine.status('abr')
+        while status['rung'] == DEFAULT_LADDER[0]['name'] and time.monotonic() < deadline:
+            await asyncio.sleep(1)
+            status = engine.status('abr')
+        # Give the encoder time to come back at the new rung
+        await asyncio.sleep(5)
+        return engine.status('abr')
+    finally:
+        await engine.stop_all()
+        proxy.stop()
+        listener.stop()
+
+
+@requires_ffmpeg
+def test_congested_uplink_steps_down_the_ladder(tmp_path):
+    sample = make_sample(str(tmp_path / 'sample.mp4'), duration=TIMEOUT + 30, gop=50)
+    status = asyncio.run(stream_through_squeeze(sample))
+    names = [rung['name'] for rung in DEFAULT_LADDER]
+    assert names.index(status['rung']) > 0
+    assert status['state'] == LIVE
+
+
+def drive(abr, start, end, speed, send_rate_kbps=0):
+    # Feeds one sample per progress period from start to end; returns the (time, rung) switches
+    switches = []
+    now = start
+    while now < end:
+        rung = abr.observe({'time': now, 'speed': speed, 'total_size': 0, 'bitrate_kbps': send_rate_kbps})
+        if rung:
+            switches.append((now, rung['name']))
+        now += PERIOD
+    return switches
+
+
+def test_no_decision_during_the_cooldown():
+    abr = AdaptiveBitrate(DEFAULT_LADDER)
+    assert drive(abr, 0, COOLDOWN, 0.5) == []
+    assert abr.rung['name'] == 'source'
+
+
+def test_sustained_congestion_steps_down_one_rung():
+    abr = AdaptiveBitrate(DEFAULT_LADDER)
+    drive(abr, 0, COOLDOWN, 1.0)
+    assert drive(abr, COOLDOWN, COOLDOWN + DOWN_AFTER + 1, 0.9) == [(COOLDOWN + DOWN_AFTER, '540p')]
+
+
+def test_a_short_stall_does_not_step_down():
+    abr = AdaptiveBitrate(DEFAULT_LADDER)
+    drive(abr, 0, COOLDOWN, 1.0)
+    assert drive(abr, COOLDOWN, COOLDOWN + DOWN_AFTER - 1, 0.9) == []
+    # Back to real time resets the congestion clock
+    assert drive(abr, COOLDOWN + DOWN_AFTER - 1, COOLDOWN + DOWN_AFTER, 1.0) == []
+    assert drive(abr, COOLDOWN + DOWN_AFTER, COOLDOWN + 2 * DOWN_AFTER - 1, 0.9) == []
+
+
+def test_step_down_skips_rungs_the_measured_send_rate_cannot_carry():
+    abr = AdaptiveBitrate(DEFAULT_LADDER)
+    drive(abr, 0, COOLDOWN, 1.0)
+    # 900 kbit/s leaves 720 usable: only 360p's 700 fits
+    assert drive(abr, COOLDOWN, COOLDOWN + DOWN_AFTER + 1, 0.9, send_rate_kbps=900) == [
+        (COOLDOWN + DOWN_AFTER, '360p')]
+
+
+def test_bottom_rung_is_the_floor():
+    abr = AdaptiveBitrate(DEFAULT_LADDER)
+    switches = drive(abr, 0, 10 * (COOLDOWN + DOWN_AFTER), 0.5)
+    assert [name for _, name in switches] == ['540p', '480p', '360p']
+    assert abr.rung['name'] == '360p'
+
+
+def test_steps_up_after_a_clean_hold_and_not_in_the_dead_band():
+    abr = AdaptiveBitrate(DEFAULT_LADDER)
+    drive(abr, 0, COOLDOWN, 1.0)
+    down = COOLDOWN + DOWN_AFTER
+    drive(abr, COOLDOWN, down + PERIOD, 0.9)
+    # Between the thresholds nothing moves, however long it lasts
+    assert drive(abr, down + PERIOD, down + 10 * UP_AFTER, 0.97) == []
+    good = down + 10 * UP_AFTER
+    assert drive(abr, good, good + UP_AFTER + 1, 1.0) == [(good + UP_AFTER, 'source')]
+
+
+def test_a_step_up_that_fails_quickly_doubles_the_next_hold():
+    abr = AdaptiveBitrate(DEFAULT_LADDER)
+    drive(abr, 0, COOLDOWN, 1.0)
+    down = COOLDOWN + DOWN_AFTER
+    drive(abr, COOLDOWN, down + PERIOD, 0.9)
+    up = down + COOLDOWN + UP_AFTER
+    assert drive(abr, down + PERIOD, up + PERIOD, 1.0) == [(up, 'source')]
+    # Congested again straight after the cooldown: back down, and the next try waits twice as long
+    down_again = up + COOLDOWN + DOWN_AFTER
+    assert drive(abr, up + PERIOD, down_again + PERIOD, 0.9) == [(down_again, '540p')]
+    assert abr.up_after == 2 * UP_AFTER
+    settled = down_again + COOLDOWN
+    assert drive(abr, down_again + PERIOD, settled + UP_AFTER + 1, 1.0) == []
+    assert drive(abr, settled + UP_AFTER + 1, settled + 2 * UP_AFTER + 1, 1.0) == [
+        (settled + 2 * UP_AFTER, 'source')]
@@ -0,0 +1,70 @@
+from channels import Channel, ChannelManager
+
+
+class Engine:
+    streams = {}
+
+    def subscribe(self, callback):
+        pass
+
+
+def make_manager(tmp_path, costs=(), capacity=4.0):
+    manager = ChannelManager(Engine(), cost_path=str(tmp_path / 'costs.json'))
+    manager.capacity = capacity
+    manager.costs = dict(costs)
+    return manager
+
+
+def add_running(manager, name, profile, cores=None):
+    channel = Channel(name, f"{name}.mp4", [], {}, profile)
+    channel.cores = cores
+    manager.channels[name] = channel
+    return channel
+
+
+def candidate(profile):
+    return Channel('new', 'new.mp4', [], {}, profile)
+
+
+def test_first_stream_on_an_idle_host_is_admitted_to_be_measured(tmp_path):
+    manager = make_manager(tmp_path)
+    assert manager.admit(candidate('x264:1280x720')) == (True, None)
+
+
+def test_unmeasured_profile_is_refused_when_the_host_is_full(tmp_path):
+    manager = make_manager(tmp_path, {'x264:1280x720': 1.5})
+    add_running(manager, 'a', 'x264:1280x720', 1.5)
+    add_running(manager, 'b', 'x264:1280x720', 1.5)
+    ok, reason = manager.admit(candidate('x264:1920x1080'))
+    assert not ok
+    assert 'until measured' in reason
+
+
+def test_unmeasured_profile_is_charged_as_the_dearest_measured_one(tmp_path):
+    manager = make_manager(tmp_path, {'copy:1280x720': 0.2, 'x264:1280x720': 1.5})
+    add_running(manager, 'a', 'x264:1280x720', 1.5)
+    assert manager.admit(candidate('x264:1920x1080')) == (True, None)
+    add_running(manager, 'b', 'copy:1280x720', 1.2)
+    assert not manager.admit(candidate('x264:1920x1080'))[0]
+
+
+def test_unmeasured_profile_waits_for_a_warming_stream(tmp_path):
+    manager = make_manager(tmp_path)
+    add_running(manager, 'a', 'x264:1280x720')
+    ok, reason = manager.admit(candidate('x264:1920x1080'))
+    assert not ok
+    assert 'waiting for a' in reason
+
+
+def test_warming_stream_of_an_unmeasured_profile_holds_its_placeholder(tmp_path):
+    manager = make_manager(tmp_path, {'x264:1280x720': 2.0})
+    add_running(manager, 'a', 'x264:1920x1080')
+    assert manager.used_cores() == 2.0
+    add_running(manager, 'b', 'x264:1280x720', 1.5)
+    assert not manager.admit(candidate('x264:1280x720'))[0]
+
+
+def test_nothing_measured_yet_counts_a_warming_stream_as_the_whole_host(tmp_path):
+    manager = make_manager(tmp_path, capacity=3.4)
+    add_running(manager, 'a', 'copy:1280x720')
+    assert manager.used_cores() == 3.4
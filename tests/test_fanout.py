@@ -0,0 +1,26 @@
+import subprocess
+import time
+
+from conftest import requires_ffmpeg
+from probe import probe_duration
+from standin import StandInListener, free_port, make_sample
+from stream_command import plan_stream
+
+DURATION = 8
+
+
+@requires_ffmpeg
+def test_one_encode_reaches_every_destination_despite_a_dead_one(tmp_path):
+    sample = make_sample(str(tmp_path / 'sample.mp4'), duration=DURATION, size='640x360')
+    listeners = [StandInListener(free_port(), output_path=str(tmp_path / f"out{i}.flv")).start() for i in range(2)]
+    dead = f"rtmp://127.0.0.1:{free_port()}/live/dead"
+    try:
+        plan = plan_stream(sample, [listener.url for listener in listeners] + [dead], rendition_cache=None)
+        assert plan.command.count('-i') == 1
+        subprocess.run(plan.command, capture_output=True, timeout=DURATION * 4)
+    finally:
+        time.sleep(1)
+        for listener in listeners:
+            listener.stop()
+    for listener in listeners:
+        assert probe_duration(listener.output_path) >= DURATION - 1, listener.url
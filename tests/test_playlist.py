@@ -0,0 +1,44 @@
+import asyncio
+import subprocess
+import time
+
+from config import FFPROBE_PATH
+from conftest import requires_ffmpeg
+from playlist import OUTPUT_FPS, Playlist
+from standin import StandInListener, free_port, make_sample
+from stream_engine import STOPPED, StreamEngine
+
+ITEMS = [(6, '1280x720'), (6, '640x360'), (6, '1920x1080')]
+MAX_EXTRA_GAP = 0.1   # seconds beyond one frame between consecutive received frames
+
+
+def received_frame_times(path):
+    command = [FFPROBE_PATH, '-v', 'error', '-select_streams', 'v:0', '-show_entries', 'packet=pts_time',
+               '-of', 'csv=p=0', path]
+    output = subprocess.run(command, capture_output=True, text=True, check=True).stdout
+    return sorted(float(line) for line in output.split() if line != 'N/A')
+
+
+async def air(items, recording):
+    listener = StandInListener(free_port(), output_path=recording).start()
+    engine = StreamEngine()
+    try:
+        await engine.start('playlist', None, [listener.url], playlist=Playlist(items, loop=False))
+        await engine.streams['playlist'].task
+        return engine.status('playlist')
+    finally:
+        time.sleep(1)
+        listener.stop()
+
+
+@requires_ffmpeg
+def test_items_play_back_to_back_without_a_gap(tmp_path):
+    items = [make_sample(str(tmp_path / f"item{i}.mp4"), duration=duration, size=size)
+             for i, (duration, size) in enumerate(ITEMS)]
+    recording = str(tmp_path / 'received.flv')
+    status = asyncio.run(air(items, recording))
+    assert status['state'] == STOPPED
+    times = received_frame_times(recording)
+    assert times[-1] - times[0] >= sum(duration for duration, _ in ITEMS) - 1
+    largest = max(b - a for a, b in zip(times, times[1:]))
+    assert largest - 1 / OUTPUT_FPS < MAX_EXTRA_GAP
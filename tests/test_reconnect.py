@@ -0,0 +1,45 @@
+import asyncio
+import time
+
+from conftest import requires_ffmpeg
+from standin import StandInListener, free_port, make_sample
+from stream_engine import LIVE, StreamEngine
+
+KILL_AFTER = 8
+OUTAGE = 3
+RECOVER_TIMEOUT = 60
+
+
+async def kill_ingest_mid_stream(sample, tmp_path):
+    port = free_port()
+    listener = StandInListener(port, output_path=str(tmp_path / 'before.flv')).start()
+    engine = StreamEngine()
+    try:
+        await engine.start('supervised', sample, [listener.url])
+        await asyncio.sleep(KILL_AFTER)
+        listener.stop()
+        await asyncio.sleep(OUTAGE)
+        listener = StandInListener(port, output_path=str(tmp_path / 'after.flv')).start()
+        deadline = time.monotonic() + RECOVER_TIMEOUT
+        status = engine.status('supervised')
+        while not (status['restarts'] and status['state'] == LIVE) and time.monotonic() < deadline:
+            await asyncio.sleep(0.5)
+            status = engine.status('supervised')
+        # Let the resumed run deliver something before it is stopped
+        await asyncio.sleep(3)
+        return status, listener
+    finally:
+        await engine.stop_all()
+        listener.stop()
+
+
+@requires_ffmpeg
+def test_stream_resumes_after_the_ingest_goes_away(tmp_path):
+    sample = make_sample(str(tmp_path / 'sample.mp4'), duration=90, size='640x360', gop=50)
+    status, listener = asyncio.run(kill_ingest_mid_stream(sample, tmp_path))
+    assert status['state'] == LIVE
+    assert status['restarts'] >= 1
+    assert status['last_recovery_seconds'] is not None
+    # Picked up where the dead run got to, not from 0:00
+    assert status['offset'] >= KILL_AFTER - 3
+    assert listener.received_bytes() > 0
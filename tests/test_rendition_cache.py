@@ -0,0 +1,39 @@
+import os
+
+from rendition_cache import rendition_key
+
+ARGS = ['-c:v', 'libx264', '-c:a', 'aac']
+
+
+def write(path, data):
+    with open(path, 'wb') as f:
+        f.write(data)
+
+
+def test_key_is_stable_and_survives_a_move(tmp_path):
+    source = tmp_path / 'show.mp4'
+    write(source, b'video')
+    key = rendition_key(str(source), ARGS)
+    assert rendition_key(str(source), ARGS) == key
+    moved = tmp_path / 'renamed.mp4'
+    os.rename(source, moved)
+    assert rendition_key(str(moved), ARGS) == key
+
+
+def test_key_changes_with_the_file_the_args_and_the_ticker(tmp_path):
+    source = tmp_path / 'show.mp4'
+    ticker = tmp_path / 'ticker.png'
+    write(source, b'video')
+    write(ticker, b'png')
+    key = rendition_key(str(source), ARGS)
+    assert rendition_key(str(source), ARGS + ['-af', 'loudnorm']) != key
+    assert rendition_key(str(source), ARGS, str(ticker)) != key
+    write(source, b'edited video')
+    assert rendition_key(str(source), ARGS) != key
+
+
+def test_key_does_not_read_the_file(tmp_path, monkeypatch):
+    source = tmp_path / 'show.mp4'
+    write(source, b'video')
+    monkeypatch.setattr('builtins.open', lambda *args, **kwargs: 1 / 0)
+    rendition_key(str(source), ARGS)
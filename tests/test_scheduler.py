@@ -0,0 +1,211 @@
+import asyncio
+import concurrent.futures
+import json
+import time
+
+import pytest
+
+import scheduler
+from scheduler import (CANCELLED, GRACE_SECONDS, JOIN, MISSED, PENDING, PREFLIGHT, PREFLIGHT_LEAD, RUN, SKIP,
+                       STARTED, WARM, WARM_LEAD, ScheduledJob, Scheduler)
+from stream_engine import LIVE, EngineError
+
+NOW = 1_800_000_000.0
+
+
+class Clock:
+    # Stands in for the time module inside scheduler
+    def __init__(self, now):
+        self.now = now
+
+    def time(self):
+        return self.now
+
+    def __getattr__(self, name):
+        return getattr(time, name)
+
+
+class Engine:
+    def __init__(self):
+        self.started = []
+        self.warmed = []
+        self.busy = set()
+
+    def submit(self, coroutine):
+        future = concurrent.futures.Future()
+        try:
+            future.set_result(asyncio.run(coroutine))
+        except Exception as e:
+            future.set_exception(e)
+        return future
+
+    async def start(self, name, video_path, urls, **options):
+        if name in self.busy:
+            raise EngineError(f"Stream {name} is already running")
+        self.started.append((name, options['start_offset']))
+        return {'name': name, 'state': LIVE}
+
+    async def prewarm(self, name, video_path, urls, **options):
+        self.warmed.append(name)
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock(NOW)
+    monkeypatch.setattr(scheduler, 'time', clock)
+    return clock
+
+
+def make_scheduler(tmp_path, engine=None):
+    return Scheduler(engine or Engine(), path=str(tmp_path / 'schedule.json'), preflight=lambda job, log: None)
+
+
+def job(start_at, name='main', catch_up=JOIN, **options):
+    return ScheduledJob(start_at, f"{name}.mp4", ['rtmp://example/live/key'], name=name, catch_up=catch_up,
+                        **options)
+
+
+def run_until(schedule, clock, when):
+    # What the worker thread does once the clock reaches `when`
+    clock.now = when
+    with schedule.condition:
+        due = schedule.pop_due(when)
+    schedule.dispatch(due, when)
+
+
+def test_on_time_slot_goes_through_preflight_and_warm_up_then_starts(tmp_path, clock):
+    schedule = make_scheduler(tmp_path)
+    slot = schedule.add(job(NOW + 3600))
+    run_until(schedule, clock, NOW + 3600 - PREFLIGHT_LEAD)
+    assert slot.status == PREFLIGHT
+    run_until(schedule, clock, NOW + 3600 - WARM_LEAD)
+    assert schedule.engine.warmed == ['main']
+    assert schedule.engine.started == []
+    run_until(schedule, clock, NOW + 3600 + 1)
+    assert slot.status == STARTED
+    assert schedule.engine.started == [('main', 0.0)]
+
+
+def test_late_within_grace_starts_from_the_top_whatever_the_policy(tmp_path, clock):
+    schedule = make_scheduler(tmp_path)
+    slot = schedule.add(job(NOW - GRACE_SECONDS + 1, catch_up=SKIP))
+    run_until(schedule, clock, NOW)
+    assert slot.status == STARTED
+    assert schedule.engine.started == [('main', 0.0)]
+
+
+def test_skip_marks_a_missed_slot_and_does_not_start_it(tmp_path, clock):
+    schedule = make_scheduler(tmp_path)
+    slot = schedule.add(job(NOW - 600, catch_up=SKIP))
+    run_until(schedule, clock, NOW)
+    assert slot.status == MISSED
+    assert 'missed by 600s' in slot.error
+    assert schedule.engine.started == []
+
+
+def test_run_starts_a_missed_slot_from_its_in_point(tmp_path, clock):
+    schedule = make_scheduler(tmp_path)
+    slot = schedule.add(job(NOW - 600, catch_up=RUN, in_point=30.0))
+    run_until(schedule, clock, NOW)
+    assert slot.status == STARTED
+    assert schedule.engine.started == [('main', 30.0)]
+
+
+def test_join_starts_where_the_slot_would_be_by_now(tmp_path, clock):
+    schedule = make_scheduler(tmp_path)
+    slot = schedule.add(job(NOW - 600, catch_up=JOIN, in_point=30.0, out_point=3600.0))
+    run_until(schedule, clock, NOW)
+    assert slot.status == STARTED
+    assert schedule.engine.started == [('main', 630.0)]
+
+
+def test_join_misses_a_slot_that_is_already_over(tmp_path, clock):
+    schedule = make_scheduler(tmp_path)
+    slot = schedule.add(job(NOW - 700, catch_up=JOIN, out_point=600.0))
+    run_until(schedule, clock, NOW)
+    assert slot.status == MISSED
+    assert 'already over' in slot.error
+    assert schedule.engine.started == []
+
+
+def test_a_busy_stream_name_fails_the_slot(tmp_path, clock):
+    engine = Engine()
+    engine.busy.add('main')
+    schedule = make_scheduler(tmp_path, engine)
+    slot = schedule.add(job(NOW))
+    run_until(schedule, clock, NOW)
+    assert slot.status == scheduler.FAILED
+    assert 'already running' in slot.error
+
+
+def test_heap_fires_every_action_in_deadline_order(tmp_path, clock):
+    schedule = make_scheduler(tmp_path)
+    late = schedule.add(job(NOW + 7200, name='late'))
+    early = schedule.add(job(NOW + 3600, name='early'))
+    with schedule.condition:
+        due = schedule.pop_due(NOW + 10 * 3600)
+    assert [(action, job_id) for _, _, action, job_id in due] == [
+        (PREFLIGHT, early.id), (WARM, early.id), (STARTED, early.id),
+        (PREFLIGHT, late.id), (WARM, late.id), (STARTED, late.id)]
+    assert [deadline for deadline, *_ in due] == sorted(deadline for deadline, *_ in due)
+
+
+def test_slots_start_in_time_order_and_cancelled_ones_are_skipped(tmp_path, clock):
+    schedule = make_scheduler(tmp_path)
+    schedule.add(job(NOW + 300, name='third'))
+    schedule.add(job(NOW + 100, name='first'))
+    dropped = schedule.add(job(NOW + 150, name='dropped'))
+    schedule.add(job(NOW + 200, name='second'))
+    schedule.cancel(dropped.id)
+    for when in range(0, 400, 10):
+        run_until(schedule, clock, NOW + when)
+    assert [name for name, _ in schedule.engine.started] == ['first', 'second', 'third']
+    assert dropped.status == CANCELLED
+
+
+def test_schedule_survives_a_restart(tmp_path, clock):
+    schedule = make_scheduler(tmp_path)
+    pending = schedule.add(job(NOW + 3600, name='pending'))
+    interrupted = schedule.add(job(NOW + 600, name='interrupted'))
+    cancelled = schedule.add(job(NOW + 1200, name='cancelled'))
+    schedule.cancel(cancelled.id)
+    run_until(schedule, clock, NOW + 1)
+    assert interrupted.status == PREFLIGHT
+    later = schedule.add(job(NOW + 7200, name='later'))
+
+    with open(schedule.path) as f:
+        saved = {entry['id']: entry['status'] for entry in json.load(f)}
+    assert saved == {pending.id: PENDING, interrupted.id: PREFLIGHT, cancelled.id: CANCELLED, later.id: PENDING}
+
+    reloaded = make_scheduler(tmp_path).load()
+    # The pre-flight that was cut short is redone
+    assert reloaded.jobs[interrupted.id].status == PENDING
+    assert reloaded.jobs[cancelled.id].status == CANCELLED
+    assert [job.name for job in reloaded.upcoming()] == ['interrupted', 'pending', 'later']
+    run_until(reloaded, clock, NOW + 7200)
+    assert [name for name, _ in reloaded.engine.started] == ['interrupted', 'pending', 'later']
+
+
+def test_a_slot_that_passed_while_down_is_caught_up_on_reload(tmp_path, clock):
+    schedule = make_scheduler(tmp_path)
+    schedule.add(job(NOW + 60, name='joined', catch_up=JOIN, out_point=3600.0))
+    schedule.add(job(NOW + 60, name='skipped', catch_up=SKIP))
+    clock.now = NOW + 660
+    reloaded = make_scheduler(tmp_path).load()
+    run_until(reloaded, clock, clock.now)
+    assert reloaded.engine.started == [('joined', 600.0)]
+    assert {job.name: job.status for job in reloaded.jobs.values()} == {'joined': STARTED, 'skipped': MISSED}
+
+
+def test_pre_encodes_start_on_add_soonest_slot_first(tmp_path, clock):
+    encoded = []
+    schedule = Scheduler(Engine(), path=str(tmp_path / 'schedule.json'), preflight=lambda job, log: None,
+                         preencode=lambda job, log: encoded.append(job.name))
+    schedule.add(job(NOW + 7200, name='later'))
+    schedule.add(job(NOW + 3600, name='sooner'))
+    dropped = schedule.add(job(NOW + 1800, name='dropped'))
+    schedule.cancel(dropped.id)
+    # Ends the loop once the queue is drained
+    schedule.preencodes.put((float('inf'), 0, None))
+    schedule.run_preencodes()
+    assert encoded == ['sooner', 'later']
@@ -0,0 +1,17 @@
+import pytest
+
+from stream_cli import parse_args
+
+
+@pytest.mark.parametrize('argv', [
+    ['a.mp4', 'b.mp4', '-k', 'KEY', '--ticker', 'ticker.png'],
+    ['a.mp4', '--loop', '-k', 'KEY', '--adaptive'],
+])
+def test_playlist_refuses_single_video_options(argv):
+    with pytest.raises(SystemExit):
+        parse_args(argv)
+
+
+def test_single_video_takes_ticker_and_adaptive():
+    args = parse_args(['a.mp4', '-k', 'KEY', '--ticker', 'ticker.png', '--adaptive'])
+    assert (args.ticker, args.adaptive) == ('ticker.png', True)
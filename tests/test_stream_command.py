@@ -0,0 +1,67 @@
+import encoder_tuning
+from encoder_tuning import fingerprint, save_profile, tuned_profile
+from stream_command import YOUTUBE_RTMP_URL, codec_args, output_args, parse_destinations, tee_escape
+
+
+def test_tee_escape_leaves_a_plain_url_alone():
+    assert tee_escape('rtmp://a.rtmp.youtube.com/live2/abc-123') == 'rtmp://a.rtmp.youtube.com/live2/abc-123'
+
+
+def test_tee_escape_backslashes_the_tee_specials():
+    assert tee_escape(r"rtmp://host/app/k|e[y]'s\x") == r"rtmp://host/app/k\|e\[y\]\'s\\x"
+
+
+def test_parse_destinations_turns_keys_into_youtube_urls():
+    assert parse_destinations('KEY1') == [f"{YOUTUBE_RTMP_URL}KEY1"]
+
+
+def test_parse_destinations_splits_on_commas_semicolons_and_whitespace():
+    text = ' KEY1,KEY2;\nrtmp://other/live/KEY3  ,, '
+    assert parse_destinations(text) == [f"{YOUTUBE_RTMP_URL}KEY1", f"{YOUTUBE_RTMP_URL}KEY2",
+                                        'rtmp://other/live/KEY3']
+
+
+def test_parse_destinations_of_nothing_is_empty():
+    assert parse_destinations('') == []
+    assert parse_destinations(None) == []
+
+
+def test_output_args_for_one_url_is_plain_flv():
+    assert output_args(['rtmp://a/live/k']) == ['-f', 'flv', 'rtmp://a/live/k']
+
+
+def test_output_args_fans_out_through_a_tee_with_a_fifo_per_slave():
+    args = output_args(['rtmp://a/live/k1', 'rtmp://b/live/k|2'])
+    assert args[:-1] == ['-flags', '+global_header', '-tag:v', '7', '-tag:a', '10', '-f', 'tee', '-use_fifo', '1']
+    assert args[-1] == r'[f=flv:onfail=ignore]rtmp://a/live/k1|[f=flv:onfail=ignore]rtmp://b/live/k\|2'
+
+
+def test_output_args_records_alongside_a_single_url_through_the_tee():
+    args = output_args(['rtmp://a/live/k'], recording_path='/tmp/rec.flv')
+    assert '-f' in args and args[args.index('-f') + 1] == 'tee'
+    assert args[-1].split('|') == ['[f=flv:onfail=ignore]rtmp://a/live/k', '[f=flv:onfail=ignore]/tmp/rec.flv']
+
+
+def test_tuned_profile_for_an_unknown_height_is_the_largest_calibrated(tmp_path):
+    path = str(tmp_path / 'profiles.json')
+    for height, preset in ((720, 'medium'), (1080, 'veryfast')):
+        save_profile(height, {'preset': preset, 'threads': 4, 'fingerprint': fingerprint()}, path)
+    assert tuned_profile(None, path)['preset'] == 'veryfast'
+    assert tuned_profile(480, path)['preset'] == 'medium'
+    assert tuned_profile(2160, path)['preset'] == 'veryfast'
+
+
+def test_codec_args_without_a_probe_still_uses_the_host_profile(monkeypatch):
+    heights = []
+
+    def profile(height):
+        heights.append(height)
+        return {'preset': 'faster', 'threads': 3}
+
+    monkeypatch.setattr(encoder_tuning, 'tuned_profile', profile)
+    args, _ = codec_args('missing.mp4', probe_cache=None)
+    assert args[args.index('-preset') + 1] == 'faster'
+    assert args[args.index('-threads') + 1] == '3'
+    codec_args('missing.mp4', probe_cache=None, rung={'name': '480p', 'height': 480, 'maxrate': 1200,
+                                                      'bufsize': 2400})
+    assert heights == [None, 480]
@@ -0,0 +1,99 @@
+from telemetry import FIELDS, MetricsRing, ProgressParser, parse_number
+
+BLOCK = """frame=250
+fps=25.02
+stream_0_0_q=23.0
+bitrate=2950.3kbits/s
+total_size=3690000
+out_time_us=10000000
+out_time_ms=10000000
+out_time=00:00:10.000000
+dup_frames=1
+drop_frames=3
+speed=1.01x
+progress=continue
+"""
+
+
+def sample(frame):
+    return dict(dict.fromkeys(FIELDS, 0.0), frame=frame)
+
+
+def feed(parser, text):
+    return [parser.feed(line) for line in text.splitlines()]
+
+
+def test_parse_number_strips_units_and_zeroes_na():
+    assert parse_number('2950.3kbits/s') == 2950.3
+    assert parse_number('1.01x') == 1.01
+    assert parse_number('42') == 42.0
+    assert parse_number('N/A') == 0.0
+
+
+def test_a_progress_block_becomes_one_sample():
+    ring = MetricsRing(capacity=4)
+    done = feed(ProgressParser(ring), BLOCK)
+    assert done == [False] * (len(done) - 1) + [True]
+    assert ring.count == 1
+    latest = ring.latest()
+    assert latest['frame'] == 250
+    assert latest['fps'] == 25.02
+    assert latest['bitrate_kbps'] == 2950.3
+    assert latest['total_size'] == 3690000
+    assert latest['out_time'] == 10.0
+    assert (latest['dup_frames'], latest['drop_frames']) == (1, 3)
+    assert latest['speed'] == 1.01
+    assert latest['time'] > 0
+
+
+def test_a_block_only_updates_the_keys_it_carries():
+    ring = MetricsRing(capacity=4)
+    parser = ProgressParser(ring)
+    feed(parser, BLOCK)
+    # Before the first output packet ffmpeg writes N/A; earlier values carry over otherwise
+    feed(parser, "frame=275\nbitrate=N/A\nprogress=end\n")
+    assert ring.count == 2
+    assert ring.latest()['frame'] == 275
+    assert ring.latest()['bitrate_kbps'] == 0.0
+    assert ring.latest()['speed'] == 1.01
+    assert ring.series('frame') == [250, 275]
+
+
+def test_empty_ring_has_no_latest_and_no_samples():
+    ring = MetricsRing(capacity=3)
+    assert ring.latest() is None
+    assert ring.series('frame') == []
+    assert ring.since(0) == []
+
+
+def test_ring_wraps_around_and_keeps_the_newest_in_order():
+    ring = MetricsRing(capacity=3)
+    for frame in range(1, 6):
+        ring.append(sample(frame))
+    assert (ring.count, ring.total) == (3, 5)
+    assert ring.series('frame') == [3, 4, 5]
+    assert ring.latest()['frame'] == 5
+
+
+def test_series_window_takes_the_newest_samples_across_the_wrap():
+    ring = MetricsRing(capacity=4)
+    for frame in range(1, 7):
+        ring.append(sample(frame))
+    assert ring.series('frame', 2) == [5, 6]
+    assert ring.series('frame', 3) == [4, 5, 6]
+    assert ring.series('frame', 10) == [3, 4, 5, 6]
+
+
+def test_since_returns_only_new_samples_and_drops_overwritten_ones():
+    ring = MetricsRing(capacity=3)
+    for frame in range(1, 3):
+        ring.append(sample(frame))
+    seen = ring.total
+    for frame in range(3, 5):
+        ring.append(sample(frame))
+    assert [row['frame'] for row in ring.since(seen)] == [3, 4]
+    assert ring.since(ring.total) == []
+    # Fell further behind than the ring holds: what's left is all there is
+    for frame in range(5, 10):
+        ring.append(sample(frame))
+    assert [row['frame'] for row in ring.since(seen)] == [7, 8, 9]
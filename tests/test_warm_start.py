@@ -0,0 +1,40 @@
+import asyncio
+import time
+
+from conftest import requires_ffmpeg
+from standin import StandInListener, ThrottledProxy, free_port, make_sample
+from stream_engine import StreamEngine
+
+TIMEOUT = 30
+
+
+async def first_packet(sample, warm):
+    listener = StandInListener(free_port()).start()
+    proxy = ThrottledProxy(listener, free_port()).start()
+    engine = StreamEngine()
+    messages = []
+    engine.subscribe(lambda event: event['type'] == 'log' and messages.append(event['message']))
+    try:
+        if warm:
+            await engine.prewarm('warm', sample, [proxy.url])
+        released = time.time()
+        status = await engine.start('warm', sample, [proxy.url])
+        while proxy.first_media_time is None and time.time() < released + TIMEOUT:
+            await asyncio.sleep(0.01)
+    finally:
+        await engine.stop_all()
+        proxy.stop()
+        listener.stop()
+    return status, proxy.first_media_time is not None, messages
+
+
+@requires_ffmpeg
+def test_warm_start_only_spawns_ffmpeg(tmp_path):
+    # Separate files, so the cold start can't find the warm one's probe cached
+    cold_sample = make_sample(str(tmp_path / 'cold.mp4'), duration=15, size='640x360')
+    warm_sample = make_sample(str(tmp_path / 'warm.mp4'), duration=15, size='640x360')
+    cold, cold_reached, _ = asyncio.run(first_packet(cold_sample, warm=False))
+    warm, warm_reached, messages = asyncio.run(first_packet(warm_sample, warm=True))
+    assert cold_reached and warm_reached
+    assert "Starting from the warm standby plan" in messages
+    assert warm['startup_seconds'] < cold['startup_seconds']
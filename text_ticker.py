@@ -0,0 +1,125 @@
+import threading
+
+try:
+    from PIL import Image, ImageChops, ImageDraw, ImageFont
+except ImportError:  # Pillow is only needed for the text ticker
+    Image = None
+
+STRIP_HEIGHT = 40
+FONT_SIZE = 28
+FPS = 4
+SPEED = 120  # pixels per second
+MIN_GAP = 80
+SEPARATOR = "  •  "
+FONT_NAMES = ['arial.ttf', 'DejaVuSans.ttf']
+
+
+class TextTicker:
+    # Headlines drawn into one RGBA strip that ffmpeg reads as a rawvideo
+    # input on stdin. The strip holds the text repeated with a period that
+    # divides the scroll length, so a fixed overlay x expression loops
+    # seamlessly; Python only redraws when the text changes.
+    def __init__(self, text='', font_path=None, font_size=FONT_SIZE, height=STRIP_HEIGHT, fps=FPS, speed=SPEED):
+        if Image is None:
+            raise RuntimeError("The text ticker needs Pillow (pip install Pillow)")
+        self.text = text
+        self.font = self.load_font(font_path, font_size)
+        self.height = height
+        self.fps = fps
+        self.speed = speed
+        self.width = 0
+        self.buffer = None
+        self.view = None
+        self.canvas = None
+        self.scratch = None
+        self.lock = threading.Lock()
+        self.writer = None
+        self.running = False
+
+    def load_font(self, font_path, font_size):
+        for name in ([font_path] if font_path else []) + FONT_NAMES:
+            try:
+                return ImageFont.truetype(name, font_size)
+            except OSError:
+                continue
+        return ImageFont.load_default()
+
+    def configure(self, output_width):
+        # Sized once per stream; frames are written from this same buffer
+        width = output_width * 4
+        if width != self.width:
+            self.width = width
+            self.buffer = bytearray(width * self.height * 4)
+            self.view = memoryview(self.buffer)
+            self.canvas = Image.new('RGBA', (width, self.height))
+            self.scratch = Image.new('RGBA', (width, self.height))
+            self.redraw()
+
+    @property
+    def scroll_length(self):
+        return self.width * 3 // 4
+
+    def input_args(self):
+        return ['-thread_queue_size', '2', '-f', 'rawvideo', '-pix_fmt', 'rgba',
+                '-s', f"{self.width}x{self.height}", '-r', str(self.fps), '-i', 'pipe:0']
+
+    def overlay_filter(self, main, strip):
+        return f"[{main}][{strip}]overlay=x='-mod(t*{self.speed},{self.scroll_length})':y=H-h"
+
+    def set_text(self, text):
+        if text != self.text:
+            self.text = text
+            if self.buffer is not None:
+                self.redraw()
+
+    def redraw(self):
+        self.scratch.paste((0, 0, 0, 0), (0, 0, self.width, self.height))
+        if self.text:
+            draw = ImageDraw.Draw(self.scratch)
+            item = self.text + SEPARATOR
+            item_width = max(int(draw.textlength(item, font=self.font)), 1)
+            copies = max(self.scroll_length // (item_width + MIN_GAP), 1)
+            period = self.scroll_length / copies
+            top = max((self.height - self.font.size) // 2, 0) if hasattr(self.font, 'size') else 0
+            x = 0.0
+            while x < self.width:
+                draw.rectangle((int(x), 0, int(x + period), self.height), fill=(0, 0, 0, 160))
+                draw.text((int(x) + MIN_GAP // 2, top), item, font=self.font, fill=(255, 255, 255, 255))
+                x += period
+        box = ImageChops.difference(self.scratch, self.canvas).getbbox()
+        if not box:
+            return
+        left, top, right, bottom = box
+        region = self.scratch.crop(box)
+        self.canvas.paste(region, box)
+        rows = region.tobytes()
+        row_bytes = (right - left) * 4
+        with self.lock:
+            # Copy only the rows and columns that changed
+            for y in range(top, bottom):
+                start = (y * self.width + left) * 4
+                offset = (y - top) * row_bytes
+                self.view[start:start + row_bytes] = rows[offset:offset + row_bytes]
+
+    def attach(self, pipe):
+        self.running = True
+        self.writer = threading.Thread(target=self.feed, args=(pipe,), daemon=True)
+        self.writer.start()
+
+    def feed(self, pipe):
+        # ffmpeg's small input queue provides the pacing: the write blocks
+        # until it wants the next frame, so edits reach air within a frame or two.
+        try:
+            while self.running:
+                pipe.write(self.view)
+                pipe.flush()
+        except (BrokenPipeError, OSError, ValueError):
+            pass
+        finally:
+            try:
+                pipe.close()
+            except OSError:
+                pass
+
+    def detach(self):
+        self.running = False
@@ -0,0 +1,33 @@
+import hashlib
+import os
+import subprocess
+
+from config import DATA_DIR, FFMPEG_PATH
+from file_cache import content_hash
+
+TICKER_DIR = os.path.join(DATA_DIR, 'tickers')
+
+# The ticker arrives already sized for the output, so the graph only blends it
+OVERLAY_FILTER = '[0:v][1:v]overlay=0:H-h'
+
+
+def prepared_ticker_path(ticker_path, width, height):
+    digest = hashlib.sha256(f"{content_hash(ticker_path)}|{width}x{height}".encode()).hexdigest()
+    return os.path.join(TICKER_DIR, f"{digest}_{width}x{height}.png")
+
+
+def prepare_ticker(ticker_path, width, height, ffmpeg_path=FFMPEG_PATH):
+    # Rasterise the ticker once at the output width, keeping its alpha, and
+    # reuse it for every later stream at that resolution.
+    output_path = prepared_ticker_path(ticker_path, width, height)
+    if os.path.exists(output_path):
+        return output_path
+    os.makedirs(TICKER_DIR, exist_ok=True)
+    tmp_path = f"{output_path}.{os.getpid()}.tmp.png"
+    command = [
+        ffmpeg_path, '-hide_banner', '-loglevel', 'error', '-y', '-i', ticker_path,
+        '-vf', f"scale={width}:-1:flags=lanczos,format=rgba", '-frames:v', '1', tmp_path,
+    ]
+    subprocess.run(command, check=True)
+    os.replace(tmp_path, output_path)
+    return output_path